@@ -2,38 +2,28 @@ import streamlit as st
 import pandas as pd
 import requests
 import re
-import time
 import io
 import os
-import hashlib
 import json
 # Load scraper role config
 with open("scraper_config.json", "r") as f:
     ROLE_CONFIG = json.load(f)
 from dotenv import load_dotenv
-from search import search_places, get_place_details
-from enrich import scrape_contact_info_from_site, extract_email_from_text
+from dedup import duplicated_entities, duplicated_leads
+from cache_store import EnrichmentCache
+from enrich import FetchSession, extract_email_from_text
+from enrich_engine import enrich_many
+from ratelimit import MONTHLY_CALL_LIMIT, get_governor
+from sweep import (
+    TEST_MODE_DEPTH, open_meter, load_cities, open_details_cache, open_dedup_index,
+    open_lead_store, open_search_cache, open_job_store, expand_terms, dry_run, open_job, run_job
+)
+from planner import MIN_NEW_PER_CALL
+from exports import FORMATS, available_formats, export_file, export_name
+from lead_store import COLUMNS
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
-USAGE_FILE = "api_usage_real.json"
-
-def load_api_usage():
-    if os.path.exists(USAGE_FILE):
-        with open(USAGE_FILE, "r") as f:
-            return json.load(f)
-    return {"actual": 0, "estimated": 0}
-
-def save_api_usage(usage_dict):
-    with open(USAGE_FILE, "w") as f:
-        json.dump(usage_dict, f)
-
-# Session state: load persistent usage at startup
-if "api_usage" not in st.session_state:
-    st.session_state.api_usage = load_api_usage()
-if "api_calls" not in st.session_state:
-    st.session_state.api_calls = 0
-
 if "view_mode" not in st.session_state:
     st.session_state.view_mode = "table"
 
@@ -69,13 +59,64 @@ test_mode = st.sidebar.checkbox("🧪 Enable Test Mode (for fast testing)")
 use_threading = st.sidebar.checkbox(
     "⚡ Enable Fast Search (Threaded)", 
     value=False,
-    help="Use multi-threading to search multiple cities in parallel. May increase speed but also API risk."
+    help="Search all cities, terms and states in parallel. API calls stay within the configured rate limits."
+)
+st.sidebar.selectbox(
+    "📦 Export format", available_formats(), format_func=lambda fmt: FORMATS[fmt]["label"], key="export_format",
+    help="File format of every download. Files are only built when a download button is clicked."
 )
 
 # Insert a large flexible spacer to push content down
 st.sidebar.markdown("<div style='height:40vh;'></div>", unsafe_allow_html=True)
 
-API_LIMIT = 11000
+API_LIMIT = MONTHLY_CALL_LIMIT
+
+@st.cache_resource
+def get_details_cache():
+    return open_details_cache()
+
+@st.cache_resource
+def get_dedup_index():
+    return open_dedup_index()
+
+@st.cache_resource
+def get_lead_store():
+    return open_lead_store()
+
+@st.cache_resource
+def get_search_cache():
+    return open_search_cache()
+
+@st.cache_resource
+def get_job_store():
+    return open_job_store()
+
+@st.cache_resource
+def get_enrichment_cache():
+    cache = EnrichmentCache()
+    cache.purge_expired()
+    return cache
+
+@st.cache_resource
+def get_usage_meter():
+    return open_meter()
+
+def download_export(label, frames, name, container=st, columns=None, **kwargs):
+    # frames() gives the rows as DataFrame chunks; nothing is serialized unless the button is clicked
+    fmt = st.session_state.get("export_format", "csv")
+    return container.download_button(
+        label, data=lambda: export_file(frames(), fmt, columns),
+        file_name=export_name(name, fmt), mime=FORMATS[fmt]["mime"], **kwargs
+    )
+
+def session_details(session):
+    # One line of a search session's calls and run time for Previous Searches
+    parts = []
+    if session["text_search_calls"] or session["details_calls"]:
+        parts.append(f"{session['text_search_calls']} searches, {session['details_calls']} details lookups")
+    if session["started_at"] and session["finished_at"]:
+        parts.append(f"took {max(session['finished_at'] - session['started_at'], 0):.0f}s")
+    return " · ".join(parts) or "Imported search"
 
 page = st.session_state.page
 
@@ -88,36 +129,11 @@ if page == "Enrich Contacts":
 
         st.success(f"Uploaded {len(df)} businesses for enrichment.")
 
-        enriched_rows = []
-
-        with st.spinner("🔄 Enriching contact info. Please wait..."):
-            for idx, row in df.iterrows():
-                website = row.get("Website", "")
-                business_name = row.get("Business Name", "")
-                phone = row.get("Phone", "")
-
-                industry = business_name.lower()
-                matched_roles = []
-                for key in ROLE_CONFIG.get("titles_by_industry", {}):
-                    if key in industry:
-                        matched_roles = ROLE_CONFIG["titles_by_industry"][key]
-                        break
-                if not matched_roles:
-                    matched_roles = ["owner", "manager", "director"]
-
-                contact_info = scrape_contact_info_from_site(website, matched_roles)
-
-                enriched_rows.append({
-                    "Business Name": business_name,
-                    "Phone Number": phone,
-                    "Website": f"[Visit Website]({website})" if website else "",
-                    "Business Email": contact_info.get("business_email", ""),
-                    "Direct Contacts": contact_info.get("direct_contacts", "No direct contact found")
-                })
-
-        enriched_contacts = pd.DataFrame(enriched_rows)
-        st.success(f"✅ Enriched {len(enriched_contacts)} businesses.")
-        st.dataframe(enriched_contacts)
+        # Don't crawl the same business twice when the upload repeats it, however its URL or phone is written
+        duplicate_rows = duplicated_leads(df) | duplicated_entities(df)
+        if duplicate_rows.any():
+            st.info(f"Skipping {int(duplicate_rows.sum())} duplicate rows.")
+            df = df[~duplicate_rows]
 
         from datetime import datetime
         filename_base = uploaded_file.name.replace(".csv", "").replace(" ", "_").lower()
@@ -126,7 +142,51 @@ if page == "Enrich Contacts":
         date_str = datetime.now().strftime("%Y-%m-%d")
         output_filename = f"{search_term}_{search_state}_enriched_contacts_{date_str}.csv"
 
-        st.download_button("📥 Download Enriched Contacts (.csv)", enriched_contacts.to_csv(index=False), file_name=output_filename, mime="text/csv")
+        rows = df.to_dict("records")
+
+        # Finished rows are kept in session state so a rerun resumes instead of starting over
+        upload_key = f"{uploaded_file.name}:{uploaded_file.size}"
+        if st.session_state.get("enrich_upload") != upload_key:
+            st.session_state.enrich_upload = upload_key
+            st.session_state.enrich_done = {}
+        done = st.session_state.enrich_done
+        pending = [i for i in range(len(rows)) if i not in done]
+
+        progress = st.progress(len(done) / max(len(rows), 1), text="🔄 Enriching contact info. Please wait...")
+        table_slot = st.empty()
+        download_slot = st.empty()
+
+        def show_enriched(key):
+            # Rows in input order, limited to the ones that have finished so far
+            enriched = pd.DataFrame([done[i] for i in range(len(rows)) if i in done])
+            table_slot.dataframe(enriched)
+            download_export(
+                "📥 Download Enriched Contacts", lambda: [enriched], output_filename,
+                container=download_slot, on_click="ignore", key=key
+            )
+            return enriched
+
+        # Sites enriched recently come from the enrichment cache; stored pages are revalidated, not refetched
+        fetch_session = FetchSession(cache=get_enrichment_cache())
+        for position, contact_info in enrich_many(rows, ROLE_CONFIG, positions=pending, session=fetch_session):
+            row = rows[position]
+            website = row.get("Website", "")
+            done[position] = {
+                "Business Name": row.get("Business Name", ""),
+                "Phone Number": row.get("Phone", ""),
+                "Website": f"[Visit Website]({website})" if website else "",
+                "Business Email": contact_info.get("business_email", ""),
+                "Direct Contacts": contact_info.get("direct_contacts", "No direct contact found")
+            }
+            progress.progress(len(done) / len(rows), text=f"🔄 Enriched {len(done)} of {len(rows)} businesses...")
+            if len(done) % 10 == 0 and len(done) < len(rows):
+                show_enriched(f"enrich_partial_{len(done)}")
+
+        enriched_contacts = show_enriched("enrich_download")
+        st.success(f"✅ Enriched {len(enriched_contacts)} businesses.")
+        fetch_stats = fetch_session.stats()
+        st.caption(f"Website requests: {fetch_stats['requests']} ({fetch_stats['not_modified']} not modified); "
+                   f"{fetch_stats['cached_sites']} sites reused from the enrichment cache")
 
 elif page == "Instructions":
     st.title("❓ Help")
@@ -186,6 +246,11 @@ These help clean your results:
   Skips previously searched cities and expands your reach.  
   _Helpful for repeat searches or lead expansion over time._
 
+- **🗺️ Grid Coverage**  
+  Searches the whole state map cell by cell instead of its top cities.  
+  _Off by default: it finds places between the cities, but far fewer new leads per API call._  
+  _Use it to fill coverage gaps after the city searches, not as a cheaper way to get leads._
+
 - **⚡ Enable Fast Search (Threaded)**  
   Speeds up the process using multi-threading.  
   _Use if you have a solid internet connection._  
@@ -232,48 +297,45 @@ elif page == "Lead Database":
     tab1, tab2 = st.tabs(["🔍 Filter Leads", "🕓 Previous Searches"])
 
     with tab1:
-        # Always load all leads from the archive CSV if it exists, otherwise initialize empty DataFrame
-        lead_archive_file = "lead_results_latest.csv"
-        if os.path.exists(lead_archive_file):
-            lead_archive_df = pd.read_csv(lead_archive_file)
-        else:
-            lead_archive_df = pd.DataFrame(columns=["Business Name", "Phone", "Website", "Address", "Status"])
-
-        st.session_state.lead_results = lead_archive_df
+        # Filters, counts and pages are queries against the lead store, cached until its next write
+        lead_store = get_lead_store()
 
         # --- UI: Horizontal rule and filter header ---
         st.markdown("---")
         st.markdown("### 🔍 Filter Options")
 
         # --- Filter controls ---
-        available_states = sorted(lead_archive_df["Search State(s)"].dropna().unique()) if "Search State(s)" in lead_archive_df.columns else []
-        available_terms = sorted(lead_archive_df["Search Term"].dropna().unique()) if "Search Term" in lead_archive_df.columns else []
+        available_states, available_terms = lead_store.filter_values()
 
         selected_states = st.multiselect("Filter by State(s)", available_states)
         selected_terms = st.multiselect("Filter by Business Type", available_terms)
-
-        filtered_df = lead_archive_df.copy()
-        if selected_states:
-            filtered_df = filtered_df[filtered_df["Search State(s)"].isin(selected_states)]
-        if selected_terms:
-            filtered_df = filtered_df[filtered_df["Search Term"].isin(selected_terms)]
+        searched_between = st.date_input("Searched between", value=(), help="Leave empty for all dates")
+        since = until = None
+        if len(searched_between) == 2:
+            since = searched_between[0].strftime("%Y-%m-%d")
+            until = (searched_between[1] + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        filters = dict(states=selected_states, terms=selected_terms, since=since, until=until)
 
         # --- Pagination logic for filtered leads ---
+        # Pages are read by row id: filter_leads_cursors[n] is the last id before page n
         leads_per_page = 10
-        if "filter_leads_page" not in st.session_state:
+        filter_key = repr(sorted((k, str(v)) for k, v in filters.items()))
+        if st.session_state.get("filter_leads_key") != filter_key:
+            st.session_state.filter_leads_key = filter_key
             st.session_state.filter_leads_page = 0
+            st.session_state.filter_leads_cursors = [0]
 
-        total_filtered = len(filtered_df)
+        total_filtered = lead_store.count_results(**filters)
         total_pages = (total_filtered + leads_per_page - 1) // leads_per_page
         current_page = st.session_state.filter_leads_page
 
-        paged_df = filtered_df.iloc[current_page * leads_per_page: (current_page + 1) * leads_per_page]
+        paged_df = lead_store.results_page(**filters, after_id=st.session_state.filter_leads_cursors[current_page], limit=leads_per_page)
 
         # Create a list to track selected indices
         selected_indices = []
 
-        if not filtered_df.empty:
-            st.markdown(f"### Displaying {len(filtered_df)} leads")
+        if total_filtered:
+            st.markdown(f"### Displaying {total_filtered} leads")
 
             select_all = st.checkbox("☑️ Select All Filtered Results", value=False)
 
@@ -318,133 +380,122 @@ elif page == "Lead Database":
                 st.markdown(f"<div style='text-align:center;padding-top:4px;'>Page {current_page + 1} of {total_pages}</div>", unsafe_allow_html=True)
             with col_next:
                 if st.button("Next ➡️", disabled=(current_page >= total_pages - 1), key="filter_next_pg"):
-                    st.session_state.filter_leads_page = min(total_pages - 1, current_page + 1)
+                    cursors = st.session_state.filter_leads_cursors
+                    del cursors[current_page + 1:]
+                    cursors.append(int(paged_df.index[-1]))
+                    st.session_state.filter_leads_page = current_page + 1
                     st.experimental_rerun()
 
             # --- UI: Spacing before export buttons ---
             st.markdown("### 📤 Export Options")
             # Export button for selected leads
             if selected_indices:
-                selected_leads = filtered_df.loc[selected_indices]
-                csv_export = selected_leads.to_csv(index=False)
-                st.download_button("📥 Export Selected Leads", data=csv_export, file_name="selected_leads.csv", mime="text/csv")
-            # Allow download of all leads as well
-            st.download_button("📥 Download All Leads", lead_archive_df.to_csv(index=False), file_name="lead_database.csv", mime="text/csv")
+                selected_leads = paged_df.loc[selected_indices]
+                download_export("📥 Export Selected Leads", lambda: [selected_leads], "selected_leads.csv")
+            # Files are streamed from the lead store in chunks when the button is clicked
+            if any(filters.values()):
+                download_export("📥 Download Filtered Leads", lambda: lead_store.iter_frames(**filters),
+                                "filtered_leads.csv", columns=list(COLUMNS))
+            download_export("📥 Download All Leads", lambda: lead_store.iter_frames(), "lead_database.csv", columns=list(COLUMNS))
         else:
             st.warning("⚠️ No leads match your filter.")
 
     with tab2:
         st.markdown("### 🕓 Previous Searches")
-        lead_results_file = "lead_results_latest.csv"
-        if os.path.exists(lead_results_file):
-            # Load and group previous searches
-            full_df = pd.read_csv(lead_results_file)
-            if not full_df.empty:
-                # Group by Search Term, State(s), Timestamp Group
-                full_df["Timestamp Group"] = pd.to_datetime(full_df["Timestamp"]).dt.strftime("%Y-%m-%d %H:%M")
-                grouped = list(full_df.groupby(["Search Term", "Search State(s)", "Timestamp Group"]))
-
-                # --- Pagination state ---
-                if "prev_searches_page" not in st.session_state:
-                    st.session_state.prev_searches_page = 0
-                groups_per_page = 5
-                total_groups = len(grouped)
-                total_pages = (total_groups + groups_per_page - 1) // groups_per_page
-                page = st.session_state.prev_searches_page
-                start_idx = page * groups_per_page
-                end_idx = min(start_idx + groups_per_page, total_groups)
-                paged_groups = grouped[start_idx:end_idx]
-
-                # --- For delete: maintain state for deletion triggers ---
-                if "delete_group_keys" not in st.session_state:
-                    st.session_state.delete_group_keys = {}
-
-                # --- Display paginated groups ---
-                for i, (key, group_df) in enumerate(paged_groups):
-                    term, state, timestamp = key
-                    label = f"{term.title()} in {state} — {timestamp}"
-                    lead_count = len(group_df)
-                    group_id = f"{term}|{state}|{timestamp}"
-                    delete_btn_key = f"del_{group_id}_{start_idx+i}".replace(" ", "_")
-                    preview_key = f"preview_{group_id}_{start_idx+i}".replace(" ", "_")
-                    download_key = f"download_{group_id}_{start_idx+i}".replace(" ", "_").lower()
-                    # --- Container for group ---
-                    with st.container():
-                        st.markdown(f"""
+        # Every search run is a session in the lead store; only the page shown is loaded
+        lead_store = get_lead_store()
+        total_groups = lead_store.count_sessions()
+        if total_groups:
+
+            # --- Pagination state ---
+            if "prev_searches_page" not in st.session_state:
+                st.session_state.prev_searches_page = 0
+            groups_per_page = 5
+            total_pages = (total_groups + groups_per_page - 1) // groups_per_page
+            page = min(st.session_state.prev_searches_page, total_pages - 1)
+            start_idx = page * groups_per_page
+            paged_groups = lead_store.sessions(limit=groups_per_page, offset=start_idx)
+
+            # --- For delete: maintain state for deletion triggers ---
+            if "delete_group_keys" not in st.session_state:
+                st.session_state.delete_group_keys = {}
+
+            # --- Display paginated groups ---
+            for session in paged_groups:
+                term, state, timestamp = session["search_term"], session["search_state"], session["timestamp"]
+                lead_count = session["lead_count"]
+                label = f"{term.title()} in {state} — {timestamp}"
+                group_id = session["id"]
+                delete_btn_key = f"del_session_{group_id}"
+                preview_key = f"preview_session_{group_id}"
+                download_key = f"download_session_{group_id}"
+                # --- Container for group ---
+                with st.container():
+                    st.markdown(f"""
 <div style="border: 1px solid #333; padding: 15px; border-radius: 8px; margin-bottom: 15px; background-color: #1c1c1c;">
     <div style="font-size: 18px; font-weight: bold; margin-bottom: 10px;">
-        🔎 {label} <span style="color:#bbb; font-size:14px;">({lead_count} lead{'s' if lead_count != 1 else ''})</span>
+        🔎 {label} <span style="color:#bbb; font-size:14px;">({lead_count} lead{'s' if lead_count != 1 else ''}, {session['new_count']} new)</span>
     </div>
+    <div style="color:#bbb; font-size:13px;">{session_details(session)}</div>
 </div>
 """, unsafe_allow_html=True)
-                        cols = st.columns([0.15, 0.2, 0.25])
-                        with cols[0]:
-                            st.checkbox("👁 Preview", key=preview_key)
-                        with cols[1]:
-                            st.download_button(
-                                label="📥 Download Leads",
-                                data=group_df.to_csv(index=False),
-                                file_name=f"{term}_{state}_{timestamp}.csv".replace(" ", "_").lower(),
-                                mime="text/csv",
-                                key=download_key
-                            )
-                        with cols[2]:
-                            if st.button("🗑 Delete Search", key=delete_btn_key):
-                                st.session_state.delete_group_keys[group_id] = True
-                        # --- Deletion logic ---
-                        if st.session_state.delete_group_keys.get(group_id, False):
-                            # Remove this group's rows from full_df and save
-                            mask = ~(
-                                (full_df["Search Term"] == term)
-                                & (full_df["Search State(s)"] == state)
-                                & (full_df["Timestamp Group"] == timestamp)
-                            )
-                            full_df = full_df[mask]
-                            # Remove the trigger so it doesn't re-trigger
-                            st.session_state.delete_group_keys[group_id] = False
-                            # Remove the group from grouped list and update file
-                            full_df.drop(columns=["Timestamp Group"], inplace=True, errors="ignore")
-                            full_df.to_csv(lead_results_file, index=False)
-                            st.experimental_rerun()
-                        if st.session_state.get(preview_key):
-                            st.dataframe(group_df)
-
-                # --- Pagination controls ---
-                col_prev, col_page, col_next = st.columns([0.15, 0.2, 0.15])
-                with col_prev:
-                    if st.button("⬅️ Previous", disabled=(page == 0), key="prev_pg"):
-                        st.session_state.prev_searches_page = max(0, page - 1)
-                        st.experimental_rerun()
-                with col_page:
-                    st.markdown(f"<div style='text-align:center;padding-top:4px;'>Page {page+1} of {total_pages}</div>", unsafe_allow_html=True)
-                with col_next:
-                    if st.button("Next ➡️", disabled=(page >= total_pages-1), key="next_pg"):
-                        st.session_state.prev_searches_page = min(total_pages-1, page + 1)
+                    cols = st.columns([0.15, 0.2, 0.25])
+                    with cols[0]:
+                        st.checkbox("👁 Preview", key=preview_key)
+                    with cols[1]:
+                        download_export(
+                            "📥 Download Leads",
+                            lambda session_id=group_id: lead_store.iter_frames(session_id=session_id),
+                            f"{term}_{state}_{timestamp}.csv".replace(" ", "_").lower(),
+                            columns=list(COLUMNS),
+                            key=download_key
+                        )
+                    with cols[2]:
+                        if st.button("🗑 Delete Search", key=delete_btn_key):
+                            st.session_state.delete_group_keys[group_id] = True
+                    # --- Deletion logic ---
+                    if st.session_state.delete_group_keys.get(group_id, False):
+                        # Remove this session and its rows from the store
+                        lead_store.delete_session(group_id)
+                        # Remove the trigger so it doesn't re-trigger
+                        st.session_state.delete_group_keys[group_id] = False
                         st.experimental_rerun()
+                    if st.session_state.get(preview_key):
+                        st.dataframe(lead_store.session_frame(group_id))
 
-                # --- Export All Historical Searches ---
-                st.markdown("---")
-                st.markdown("#### 📦 Export All Historical Searches")
-                total_leads = len(full_df)
-                if "export_confirm" not in st.session_state:
+            # --- Pagination controls ---
+            col_prev, col_page, col_next = st.columns([0.15, 0.2, 0.15])
+            with col_prev:
+                if st.button("⬅️ Previous", disabled=(page == 0), key="prev_pg"):
+                    st.session_state.prev_searches_page = max(0, page - 1)
+                    st.experimental_rerun()
+            with col_page:
+                st.markdown(f"<div style='text-align:center;padding-top:4px;'>Page {page+1} of {total_pages}</div>", unsafe_allow_html=True)
+            with col_next:
+                if st.button("Next ➡️", disabled=(page >= total_pages-1), key="next_pg"):
+                    st.session_state.prev_searches_page = min(total_pages-1, page + 1)
+                    st.experimental_rerun()
+
+            # --- Export All Historical Searches ---
+            st.markdown("---")
+            st.markdown("#### 📦 Export All Historical Searches")
+            total_leads = lead_store.count_results()
+            if "export_confirm" not in st.session_state:
+                st.session_state.export_confirm = False
+            if st.button("📦 Export All Historical Searches", key="export_all_hist"):
+                st.session_state.export_confirm = True
+            if st.session_state.export_confirm:
+                st.warning(f"You are about to export {total_leads:,} leads. Are you sure?")
+                if st.button("✅ Confirm Export", key="confirm_export_all"):
+                    download_export(
+                        "📥 Download All Historical Leads",
+                        lambda: lead_store.iter_frames(),
+                        "lead_results_latest.csv",
+                        columns=list(COLUMNS),
+                        key="dl_all_hist"
+                    )
+                    # Reset confirmation after download button shown
                     st.session_state.export_confirm = False
-                if st.button("📦 Export All Historical Searches", key="export_all_hist"):
-                    st.session_state.export_confirm = True
-                if st.session_state.export_confirm:
-                    st.warning(f"You are about to export {total_leads:,} leads. Are you sure?")
-                    if st.button("✅ Confirm Export", key="confirm_export_all"):
-                        export_csv = full_df.drop(columns=["Timestamp Group"], errors="ignore").to_csv(index=False)
-                        st.download_button(
-                            label="📥 Download All Historical Leads",
-                            data=export_csv,
-                            file_name="lead_results_latest.csv",
-                            mime="text/csv",
-                            key="dl_all_hist"
-                        )
-                        # Reset confirmation after download button shown
-                        st.session_state.export_confirm = False
-            else:
-                st.info("No previous search results found.")
         else:
             st.info("No previous search results found.")
 
@@ -465,7 +516,7 @@ def create_filename(prefix, business_type, states, is_new=False):
 
 if page == "Lead Finder":
     # --- API input disabling logic ---
-    disabled = st.session_state.api_calls >= API_LIMIT
+    disabled = get_governor().exhausted()
     st.title("🔍 Lead Finder")
     st.markdown("<p style='color:#888;'>Enter a type of business and select the states you'd like to search. This tool will generate a list of relevant businesses using the Google Maps API.</p>", unsafe_allow_html=True)
 
@@ -507,7 +558,7 @@ if page == "Lead Finder":
 
     # Add search_depth logic with test mode
     if test_mode:
-        search_depth = 3
+        search_depth = TEST_MODE_DEPTH
     else:
         search_depth = st.slider(
             "Search Depth (cities per state)",
@@ -532,194 +583,156 @@ if page == "Lead Finder":
             help="Skips cities already searched for this business type to expand coverage across sessions.",
             disabled=disabled
         )
+        min_yield = st.slider(
+            "📈 Minimum New Leads Per API Call",
+            min_value=0.0,
+            max_value=10.0,
+            value=MIN_NEW_PER_CALL,
+            step=0.5,
+            help="Search variants (e.g. 'dental clinic') only run in a city when past searches suggest they add at least this many new places per call, and a city stops trying variants once one adds fewer. 0 searches every variant everywhere.",
+            disabled=disabled
+        )
+        search_budget = st.number_input(
+            "💵 Budget for this search (USD, 0 = no limit)",
+            min_value=0.0,
+            value=0.0,
+            step=1.0,
+            help="The least productive searches (variants first, then whole cities) are left out until the predicted cost fits.",
+            disabled=disabled
+        )
+        grid_coverage = st.checkbox(
+            "🗺️ Grid Coverage (search the whole state map instead of top cities)",
+            value=False,
+            help="Tiles the state's map into cells, skipping lakes and neighbouring states, and splits any cell whose first page of results is full. "
+                 "Finds the suburban and rural businesses city searches miss, but at about a fifth of the new leads per API call of the top-cities search: "
+                 "use it to fill coverage gaps, not to get more leads for the money. "
+                 "The search depth is not used.",
+            disabled=disabled
+        )
+        start_over = st.checkbox(
+            "🔁 Start Over (don't resume an unfinished run of this search)",
+            value=False,
+            help="An interrupted search, or one with failed searches in the last few days, normally picks up where it stopped. Tick this to run every search again as a new job.",
+            disabled=disabled
+        )
 
     # Load top cities per state from external JSON for full coverage
-    with open("top_cities_by_state_converted.json", "r") as f:
-        TOP_CITIES_PER_STATE = json.load(f)
+    TOP_CITIES_PER_STATE = load_cities()
 
     # Recent Searches now in the sidebar
 
-    # --- Estimate API Usage ---
+    def explore_offsets():
+        # Cities to skip per state when exploring beyond the ones searched earlier this session
+        if not explore_more:
+            return {}
+        return {state: st.session_state.get(f"{business_type.lower()}_{state.lower()}_offset", 0) for state in states}
+
+    # --- Predict API Usage (dry run against the caches, no API calls) ---
     if business_type and states:
-        estimated_terms = [business_type]
-        if not test_mode:
-            if "dentist" in business_type.lower():
-                estimated_terms.extend(["dental office", "dental clinic", "family dentist"])
-            elif "school" in business_type.lower():
-                estimated_terms.extend(["elementary school", "middle school", "high school", "academy"])
-
-        estimated_term_count = len(estimated_terms)
-        estimated_city_count = len(states) * (search_depth if not test_mode else 3)
-        estimated_per_term = 3 if paginate_results else 1
-        estimated_total_calls = estimated_term_count * estimated_city_count * estimated_per_term
-
-        st.session_state.api_usage["estimated"] += estimated_total_calls
-        save_api_usage(st.session_state.api_usage)
-        st.info(f"🔍 Estimated API calls for this search: **{estimated_total_calls:,}**")
+        estimated_terms = expand_terms(business_type, test_mode)
+        offsets = explore_offsets()
+        # Rerun only when an input changes (or after a search fills the caches), not on every widget rerun
+        preview_key = (tuple(estimated_terms), tuple(states), search_depth, tuple(sorted(offsets.items())),
+                       paginate_results, grid_coverage, min_yield, search_budget)
+        if st.session_state.get("dry_run_key") != preview_key:
+            st.session_state.dry_run_result = dry_run(estimated_terms, states, TOP_CITIES_PER_STATE, search_depth,
+                                                      get_search_cache(), get_details_cache(), offsets, paginate_results,
+                                                      grid_coverage, min_yield, search_budget or None)
+            st.session_state.dry_run_key = preview_key
+        plan, predicted = st.session_state.dry_run_result
+        at_least = "" if predicted["exact"] else "about "
+        st.info(
+            f"🔍 This search will make {at_least}**{predicted['search_calls']:,}** search and "
+            f"**{predicted['details_calls']:,}** Place Details calls for {at_least}**{predicted['cost']:.2f} USD** "
+            f"({predicted['cached_searches']:,} of {predicted['tasks']:,} searches are already cached)."
+        )
+        if plan["new_per_call"] is not None:
+            st.caption(f"📈 Plan: about {plan['expected_new']:,.0f} new places, **{plan['new_per_call']:.1f} new per search call**; "
+                       f"search variants best first: {', '.join(plan['terms'])}")
+        if plan["dropped"]:
+            st.caption(f"Skipped everywhere as not worth a call: {', '.join(plan['dropped'])}")
+        if predicted["trimmed_tasks"]:
+            st.warning(f"💵 Trimmed {predicted['trimmed_tasks']} searches to fit the {search_budget:.2f} USD budget.")
+        with st.expander("🧪 Dry run details", expanded=False):
+            st.json(predicted)
 
     if st.button("Search", disabled=disabled):
         if not business_type or not states:
             st.warning("Please enter a business type and select at least one state.")
         else:
             # Gate for API usage limit
-            if st.session_state.api_calls >= API_LIMIT:
+            if get_governor().exhausted():
                 st.error(f"🚫 API usage limit ({API_LIMIT:,}) reached for the month. Please try again after your usage resets.")
                 st.stop()
             # API_KEY is now loaded from the environment at the top of the script
-
-            leads = []
-
-            with st.spinner(f"⏳ Searching... this may take some time."):
-                from concurrent.futures import ThreadPoolExecutor
-
-                search_terms = [business_type]
-                # Only expand variants if not in test mode
-                if not test_mode:
-                    if "dentist" in business_type.lower():
-                        search_terms.extend(["dental office", "dental clinic", "family dentist"])
-                    elif "school" in business_type.lower():
-                        search_terms.extend(["elementary school", "middle school", "high school", "academy"])
-
-        def search_city(city):
-            city_leads = []
-            for term in search_terms:
-                with st.spinner(f"Searching {term} in {city}, {state}..."):
-                    normalization_map = {
-                        "dental office": "dentist",
-                        "dental clinic": "dentist",
-                        "family dentist": "dentist",
-                        "elementary school": "school",
-                        "middle school": "school",
-                        "high school": "school",
-                        "academy": "school"
-                    }
-                    normalized_term = normalization_map.get(term.lower(), term.lower())
-                    cache_key = f"{normalized_term}_{city.lower().replace(' ', '')}_{state.lower().replace(' ', '')}"
-                    cache_hash = hashlib.md5(cache_key.encode()).hexdigest()
-                    cache_path = os.path.join("cache", f"{cache_hash}.json")
-
-                    if not os.path.exists("cache"):
-                        os.makedirs("cache")
-
-                    if os.path.exists(cache_path):
-                        with open(cache_path, "r") as f:
-                            query_results = json.load(f)
-                    else:
-                        query_results = search_places(term, f"{city}, {state}", API_KEY, use_pagination=paginate_results)
-                        with open(cache_path, "w") as f:
-                            json.dump(query_results, f)
-                        st.session_state.api_usage["actual"] += 1
-                        save_api_usage(st.session_state.api_usage)
-
-            for result in query_results:
-                place_id = result.get("place_id")
-                phone = ""
-                website = ""
-                if place_id:
-                    details = get_place_details(place_id, API_KEY)
-                    phone = details.get("formatted_phone_number", "")
-                    website = details.get("website", "")
-                city_leads.append({
-                    "Business Name": result.get("name", ""),
-                    "Phone": phone,
-                    "Website": website,
-                    "Address": result.get("formatted_address", ""),
-                    "Search Term": business_type,
-                    "Search State(s)": state,
-                    "Timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-                })
-            if not use_threading:
-                time.sleep(0.3)  # Prevent rate-limiting
-            return city_leads
-
-        for state in states:
-            state_cities = TOP_CITIES_PER_STATE.get(state, [state])
-            offset_key = f"{business_type.lower()}_{state.lower()}_offset"
-            if explore_more:
-                if offset_key not in st.session_state:
-                    st.session_state[offset_key] = 0
-                start = st.session_state[offset_key]
-                end = start + search_depth
-                cities_to_search = state_cities[start:end]
-                st.session_state[offset_key] += search_depth
-            else:
-                cities_to_search = state_cities[:search_depth] if len(state_cities) >= search_depth else state_cities
-
-            if use_threading:
-                with ThreadPoolExecutor(max_workers=8) as executor:
-                    for city_leads in executor.map(search_city, cities_to_search):
-                        leads.extend(city_leads)
-            else:
-                for city in cities_to_search:
-                    leads.extend(search_city(city))
-
-            df = pd.DataFrame(leads)
-
-            # Deduplicate
-            df.drop_duplicates(subset=["Business Name", "Phone", "Website"], inplace=True)
-            df.reset_index(drop=True, inplace=True)
-
-            # Apply filters
-            if "📞 Only show leads with a phone number" in lead_filters:
-                df = df[df["Phone"].notna() & df["Phone"].str.strip().ne("")]
-            if "🌐 Only show leads with a website" in lead_filters:
-                df = df[df["Website"].notna() & df["Website"].str.strip().ne("")]
-
-            archive_file = "lead_archive.csv"
-
-            if os.path.exists(archive_file):
-                archive_df = pd.read_csv(archive_file)
-            else:
-                archive_df = pd.DataFrame(columns=["Business Name", "Phone", "Website", "Address"])
-
-            if not df.empty and len(df.columns) > 0:
-                df["Status"] = df.apply(
-                    lambda row: "Already Harvested" if (
-                        ((archive_df["Business Name"] == row["Business Name"]) &
-                         (archive_df["Phone"] == row["Phone"]) &
-                         (archive_df["Website"] == row["Website"])).any()
-                    ) else "New",
-                    axis=1
+            search_terms = expand_terms(business_type, test_mode)
+            search_cache = get_search_cache()
+            dedup_index = get_dedup_index()
+            lead_store = get_lead_store()
+            details_cache = get_details_cache()
+            job_store = get_job_store()
+
+            offsets = explore_offsets()
+            st.session_state.pop("dry_run_key", None)
+            for state, offset in offsets.items():
+                st.session_state[f"{business_type.lower()}_{state.lower()}_offset"] = offset + search_depth
+            plan, _ = dry_run(search_terms, states, TOP_CITIES_PER_STATE, search_depth, search_cache, details_cache, offsets,
+                              paginate_results, grid_coverage, min_yield, search_budget or None)
+            # Every (term, city, state) task is checkpointed, so an interrupted search picks up where it stopped
+            job = open_job(
+                job_store, business_type, search_terms, states, TOP_CITIES_PER_STATE, search_depth, offsets,
+                paginate=paginate_results, has_phone=has_phone, has_website=has_website, grid=grid_coverage, plan=plan,
+                resume=not start_over
+            )
+            progress = job_store.progress(job["id"])
+            if progress["done"]:
+                st.info(f"▶️ Resuming the search started {job['timestamp']}: {progress['done']} of {progress['total']} tasks already done.")
+            progress_bar = st.progress(progress["done"] / max(progress["total"], 1))
+
+            def show_progress(task, progress):
+                progress_bar.progress(
+                    progress["done"] / max(progress["total"], 1),
+                    text=f"Searched {task['term']} in {task['city']}, {task['state']} ({progress['done']} of {progress['total']})"
                 )
 
-                new_leads_to_add = df[df["Status"] == "New"]
-
-                st.success(f"Found {len(df)} leads ({(df['Status'] == 'New').sum()} new, {(df['Status'] == 'Already Harvested').sum()} previously harvested).")
-                # Remove LinkedIn Search column from display if present
-                display_df = df.copy()
-                if "LinkedIn Search" in display_df.columns:
-                    display_df = display_df.drop(columns=["LinkedIn Search"])
-                st.dataframe(display_df)
-
-                # --- Construct export filenames ---
-                filename_all = create_filename("leads", business_type, states)
-                filename_new = create_filename("leads", business_type, states, is_new=True)
-
-                # Update the archive immediately with new leads so they persist and display in Lead Database
-                new_leads_to_add = df[df["Status"] == "New"]
-                updated_archive = pd.concat([archive_df, new_leads_to_add], ignore_index=True)
-                updated_archive.drop_duplicates(subset=["Business Name", "Phone", "Website"], inplace=True)
-                updated_archive.to_csv(archive_file, index=False)
-
-                # Save latest session to both files
-                st.session_state.lead_results = df
-                df.to_csv("lead_results_latest.csv", index=False)
-
-                # Download All Leads button
-                st.download_button("📥 Download All Leads", display_df.to_csv(index=False), file_name=filename_all, mime="text/csv")
-
-                # Download Only New Leads button and archive update
-                if st.download_button("🆕 Download Only New Leads", new_leads_to_add.to_csv(index=False), file_name=filename_new, mime="text/csv"):
-                    updated_archive = pd.concat([archive_df, new_leads_to_add], ignore_index=True)
-                    updated_archive.drop_duplicates(subset=["Business Name", "Phone", "Website"], inplace=True)
-                    updated_archive.to_csv(archive_file, index=False)
-
-                # Save results to session state for persistent view
-                st.session_state.lead_results = df
-                # Save to CSV for persistence on refresh
-                df.to_csv("lead_results_latest.csv", index=False)
-            else:
-                st.warning("⚠️ No leads were found. Please check your search term or selected states.")
+            # Every real API call made by this search is metered against this run
+            with get_usage_meter().run(f"{business_type} in {', '.join(states)}") as api_run:
+                for result in run_job(job, job_store, API_KEY, search_cache, details_cache, dedup_index, lead_store,
+                                      threaded=use_threading, on_task=show_progress):
+                    state = result["state"]
+                    if result["skipped"]:
+                        st.caption(f"Skipped {result['skipped']} variant searches in {state} once they stopped finding new places.")
+                    if result["failed"]:
+                        st.warning(f"⚠️ {result['failed']} searches in {state} failed. Click Search again to retry them.")
+
+                    df = result["leads"]
+                    if not df.empty and len(df.columns) > 0:
+                        new_leads_to_add = result["new_leads"]
+
+                        st.success(f"Found {len(df)} leads ({(df['Status'] == 'New').sum()} new, {(df['Status'] == 'Already Harvested').sum()} previously harvested).")
+                        st.caption(f"Place Details cache: {result['details_hits']} hits, {result['details_misses']} misses")
+                        # Remove LinkedIn Search column from display if present
+                        display_df = df.copy()
+                        if "LinkedIn Search" in display_df.columns:
+                            display_df = display_df.drop(columns=["LinkedIn Search"])
+                        st.dataframe(display_df)
+
+                        # --- Construct export filenames ---
+                        filename_all = create_filename("leads", business_type, states)
+                        filename_new = create_filename("leads", business_type, states, is_new=True)
+
+                        # Save results to session state for persistent view
+                        st.session_state.lead_results = df
+
+                        # Download All Leads button
+                        download_export("📥 Download All Leads", lambda df=display_df: [df], filename_all, key=f"download_all_{state}")
+
+                        # Download Only New Leads button (merge_leads has already archived them)
+                        download_export("🆕 Download Only New Leads", lambda df=new_leads_to_add: [df], filename_new, key=f"download_new_{state}")
+                    else:
+                        st.warning("⚠️ No leads were found. Please check your search term or selected states.")
+            run_usage = api_run.totals()
+            st.caption(f"API calls this search: {run_usage['calls']:,} ({run_usage['cost']:.2f} USD)")
 
 
 # Sidebar Lead Summary (expander version)
@@ -741,17 +754,14 @@ if page == "Lead Finder":
         st.sidebar.markdown("### 🔁 Recent Searches")
         st.sidebar.markdown("<ul>" + "".join([f"<li>{query}</li>" for query in st.session_state.search_history[-5:]]) + "</ul>", unsafe_allow_html=True)
 
-    # Ensure api_calls is initialized before usage/credit block
-    if "api_calls" not in st.session_state:
-        st.session_state.api_calls = 0
     # Move API usage and credit explicitly to the very bottom, with horizontal rule and bottom container
     with st.sidebar.container():
         st.sidebar.markdown("<hr>", unsafe_allow_html=True)
-        usage = st.session_state.api_usage
-        st.sidebar.markdown(f"**Actual API Usage:** {usage['actual']:,}")
-        st.sidebar.markdown(f"**Estimated Usage (Projected):** {usage['estimated']:,}")
-        st.sidebar.markdown(f"**Remaining Credit Estimate:** ~{300 - usage['actual'] * 0.017:.2f} USD")
-        if usage["actual"] >= API_LIMIT:
+        usage = get_usage_meter().month_totals()
+        st.sidebar.markdown(f"**Actual API Usage (this month):** {usage['calls']:,}")
+        st.sidebar.markdown(f"**API Cost (this month):** {usage['cost']:.2f} USD")
+        st.sidebar.markdown(f"**Remaining Credit Estimate:** ~{usage['credit_remaining']:.2f} USD")
+        if get_governor().exhausted():
             st.sidebar.error("🚫 Monthly API limit reached!")
         st.sidebar.markdown("Built by Olivia Burnett")
 def extract_emails_from_text(text):
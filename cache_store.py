@@ -0,0 +1,481 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_DIR = "cache"
+CACHE_DB = os.path.join(CACHE_DIR, "places.db")
+ENRICH_CACHE_DB = os.path.join(CACHE_DIR, "enrich.db")
+
+DETAILS_TTL_DAYS = 30
+SEARCH_TTL_DAYS = 90
+SEARCH_MAX_BYTES = 200 * 1024 * 1024
+ENRICH_TTL_DAYS = 7     # a site's enrichment result is reused without any request for this long
+PAGE_TTL_DAYS = 60      # stored pages (for conditional GETs) are dropped after this long without a 200 or 304
+PAGES_MAX_BYTES = 500 * 1024 * 1024  # compressed page bodies kept; the least recently validated go first
+LRU_FLUSH_EVERY = 256  # buffered access-time updates before they are written back
+EVICT_EVERY = 256      # writes between expiry sweeps; a cache over its size budget is swept straight away
+EVICT_TO = 0.9         # an over-budget cache is trimmed to this fraction of it, so the next sweep is writes away
+SQLITE_MAX_VARS = 900  # stay under SQLite's bound-parameter limit for IN (...) lookups
+
+def _connect(path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _chunks(items, size=SQLITE_MAX_VARS):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def search_cache_key(normalized_term, city, state):
+    # Same key the old cache/<md5>.json files were named after
+    return f"{normalized_term}_{city.lower().replace(' ', '')}_{state.lower().replace(' ', '')}"
+
+def search_cache_hash(normalized_term, city, state):
+    return hashlib.md5(search_cache_key(normalized_term, city, state).encode()).hexdigest()
+
+class DetailsCache:
+    # Place Details responses keyed by place_id, shared across runs
+
+    def __init__(self, path=CACHE_DB, ttl_days=DETAILS_TTL_DAYS):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS place_details ("
+                " place_id TEXT PRIMARY KEY,"
+                " details TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL)"
+            )
+
+    def _is_fresh(self, fetched_at, now):
+        return self.ttl_seconds is None or now - fetched_at <= self.ttl_seconds
+
+    def get_many(self, place_ids):
+        # One read for the whole batch; returns {place_id: details} for fresh hits only
+        wanted = list(dict.fromkeys(pid for pid in place_ids if pid))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for chunk in _chunks(wanted):
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT place_id, details, fetched_at FROM place_details WHERE place_id IN ({marks})",
+                    chunk
+                ).fetchall()
+                for place_id, details, fetched_at in rows:
+                    if self._is_fresh(fetched_at, now):
+                        found[place_id] = json.loads(details)
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found
+
+    def get(self, place_id):
+        return self.get_many([place_id]).get(place_id)
+
+    def contains_many(self, place_ids):
+        # Read-only probe for dry runs: the set of ids with fresh details, without counting hits or misses
+        wanted = list(dict.fromkeys(pid for pid in place_ids if pid))
+        present = set()
+        now = time.time()
+        with self._lock:
+            for chunk in _chunks(wanted):
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT place_id, fetched_at FROM place_details WHERE place_id IN ({marks})", chunk
+                ).fetchall()
+                present.update(place_id for place_id, fetched_at in rows if self._is_fresh(fetched_at, now))
+        return present
+
+    def put_many(self, details_by_id):
+        now = time.time()
+        rows = [(pid, json.dumps(details), now) for pid, details in details_by_id.items() if pid]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO place_details (place_id, details, fetched_at) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def put(self, place_id, details):
+        self.put_many({place_id: details})
+
+    def purge_expired(self):
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM place_details WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        return cur.rowcount
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+class SearchCache:
+    # Text Search results keyed by (normalized term, city, state), with TTL and LRU eviction
+
+    def __init__(self, path=CACHE_DB, ttl_days=SEARCH_TTL_DAYS, max_bytes=SEARCH_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._size = None  # running total of size_bytes, recounted at each sweep
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                " key_hash TEXT PRIMARY KEY,"
+                " term TEXT,"
+                " city TEXT,"
+                " state TEXT,"
+                " results TEXT NOT NULL,"
+                " result_count INTEGER NOT NULL,"
+                " size_bytes INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_term_state ON search_results (term, state)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_accessed ON search_results (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_created ON search_results (created_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def _is_fresh(self, created_at, now):
+        return self.ttl_seconds is None or now - created_at <= self.ttl_seconds
+
+    def get(self, normalized_term, city, state):
+        key_hash = search_cache_hash(normalized_term, city, state)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created_at FROM search_results WHERE key_hash = ?", (key_hash,)
+            ).fetchone()
+            if row is None or not self._is_fresh(row[1], now):
+                self.misses += 1
+                return None
+            # Reads stay read-only; access times are written back in batches
+            self._touched[key_hash] = now
+            if len(self._touched) >= LRU_FLUSH_EVERY:
+                with self._conn:
+                    self._flush_touched_locked()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _flush_touched_locked(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE search_results SET accessed_at = ? WHERE key_hash = ?",
+                [(at, key_hash) for key_hash, at in self._touched.items()]
+            )
+            self._touched = {}
+
+    def contains_many(self, keys):
+        # keys: iterable of (normalized_term, city, state); returns the set of keys with a fresh entry.
+        # Read-only probe: does not touch LRU order or hit/miss counters.
+        by_hash = {search_cache_hash(*key): key for key in keys}
+        hashes = list(by_hash)
+        now = time.time()
+        present = set()
+        with self._lock:
+            for chunk in _chunks(hashes):
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key_hash, created_at FROM search_results WHERE key_hash IN ({marks})", chunk
+                ).fetchall()
+                present.update(by_hash[h] for h, created_at in rows if self._is_fresh(created_at, now))
+        return present
+
+    def peek_many(self, keys):
+        # keys: iterable of (normalized_term, city, state); returns {key: results} for fresh entries.
+        # Read-only like contains_many.
+        by_hash = {search_cache_hash(*key): key for key in keys}
+        hashes = list(by_hash)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for chunk in _chunks(hashes):
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key_hash, results, created_at FROM search_results WHERE key_hash IN ({marks})", chunk
+                ).fetchall()
+                found.update({by_hash[h]: json.loads(results) for h, results, created_at in rows if self._is_fresh(created_at, now)})
+        return found
+
+    def put(self, normalized_term, city, state, results):
+        payload = json.dumps(results)
+        key_hash = search_cache_hash(normalized_term, city, state)
+        now = time.time()
+        with self._lock, self._conn:
+            replaced = self._conn.execute("SELECT size_bytes FROM search_results WHERE key_hash = ?", (key_hash,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results"
+                " (key_hash, term, city, state, results, result_count, size_bytes, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key_hash, normalized_term, city, state, payload, len(results), len(payload), now, now)
+            )
+            if self._size is None:
+                self._size = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM search_results").fetchone()[0]
+            else:
+                self._size += len(payload) - (replaced[0] if replaced else 0)
+            self._writes += 1
+            # Sweeping scans the table, so it runs every EVICT_EVERY writes or once over budget
+            if self._writes >= EVICT_EVERY or (self.max_bytes and self._size > self.max_bytes):
+                self._evict_locked(now)
+
+    def _evict_locked(self, now):
+        self._flush_touched_locked()
+        self._writes = 0
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM search_results WHERE created_at < ?", (now - self.ttl_seconds,))
+        # Recounted here rather than trusted: another process may share the cache file
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM search_results").fetchone()[0]
+        if not self.max_bytes or self._size <= self.max_bytes:
+            return
+        # Drop least recently used entries until back under budget, with headroom for the next writes
+        target = self.max_bytes * EVICT_TO
+        doomed = []
+        for key_hash, size in self._conn.execute(
+            "SELECT key_hash, size_bytes FROM search_results ORDER BY accessed_at ASC"
+        ):
+            if self._size <= target:
+                break
+            doomed.append((key_hash,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM search_results WHERE key_hash = ?", doomed)
+
+    def evict(self):
+        with self._lock, self._conn:
+            self._evict_locked(time.time())
+
+    def list_entries(self, term=None, state=None):
+        query = "SELECT term, city, state, result_count, size_bytes, created_at, accessed_at FROM search_results"
+        clauses, params = [], []
+        if term:
+            clauses.append("term = ?")
+            params.append(term)
+        if state:
+            clauses.append("state = ?")
+            params.append(state)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY state, city, term"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                "term": term_, "city": city, "state": state_,
+                "result_count": count, "size_bytes": size,
+                "created_at": created_at, "accessed_at": accessed_at
+            }
+            for term_, city, state_, count, size, created_at, accessed_at in rows
+        ]
+
+    def place_ids(self, terms, states=None):
+        # Yield history for the planner: {(term, city, state): [place_id, ...]} for fresh labelled entries
+        terms = list(dict.fromkeys(t.lower() for t in terms))
+        if not terms:
+            return {}
+        query = f"SELECT term, city, state, results, created_at FROM search_results WHERE term IN ({','.join('?' * len(terms))})"
+        params = list(terms)
+        if states:
+            query += f" AND state IN ({','.join('?' * len(states))})"
+            params.extend(states)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {
+            (term, city, state): [r["place_id"] for r in json.loads(results) if r.get("place_id")]
+            for term, city, state, results, created_at in rows
+            if self._is_fresh(created_at, now)
+        }
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM search_results"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": total}
+
+    def migrate_json_dir(self, directory=CACHE_DIR, terms=(), cities_by_state=None):
+        # One-shot import of the old cache/<md5>.json files. File names are hashes, so the
+        # (term, city, state) label is recovered by hashing every known candidate key;
+        # files that match no candidate are still imported, just without a label.
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'json_migrated'").fetchone()
+        if done or not os.path.isdir(directory):
+            return 0
+
+        labels = {}
+        for state, cities in (cities_by_state or {}).items():
+            for city in list(cities) + [state]:
+                for term in terms:
+                    labels[search_cache_hash(term, city, state)] = (term, city, state)
+
+        rows = []
+        now = time.time()
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r") as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                continue  # truncated writes from the old cache are skipped
+            key_hash = name[:-len(".json")]
+            term, city, state = labels.get(key_hash, (None, None, None))
+            payload = json.dumps(results)
+            # The old cache never expired, so imported entries start their TTL now; mtime keeps LRU order
+            rows.append((key_hash, term, city, state, payload, len(results), len(payload), now, os.path.getmtime(path)))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO search_results"
+                " (key_hash, term, city, state, results, result_count, size_bytes, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('json_migrated', ?)", (str(now),))
+            self._size = None
+        return len(rows)
+
+class EnrichmentCache:
+    # Website enrichment across runs: each site's contact result (keyed by canonical site and the roles
+    # looked for), reused without a request within the TTL, and fetched pages keyed by URL with their
+    # ETag/Last-Modified, so later crawls send conditional GETs and a 304 reuses the stored body
+
+    def __init__(self, path=ENRICH_CACHE_DB, ttl_days=ENRICH_TTL_DAYS, page_ttl_days=PAGE_TTL_DAYS,
+                 max_bytes=PAGES_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.page_ttl_seconds = page_ttl_days * 86400 if page_ttl_days else None
+        self.max_bytes = max_bytes
+        self._size = None  # running total of page size_bytes, recounted at each sweep
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS site_results ("
+                " site TEXT NOT NULL,"
+                " roles TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (site, roles))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY,"
+                " site TEXT,"
+                " status_code INTEGER NOT NULL,"
+                " body BLOB NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " size_bytes INTEGER NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " validated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_validated ON pages (validated_at)")
+
+    def get_result(self, site, roles):
+        # The stored result for a site if fresh, else None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, fetched_at FROM site_results WHERE site = ? AND roles = ?", (site, roles)
+            ).fetchone()
+        if row is None or (self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return json.loads(row[0])
+
+    def put_result(self, site, roles, result):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO site_results (site, roles, result, fetched_at) VALUES (?, ?, ?, ?)",
+                (site, roles, json.dumps(result), time.time())
+            )
+
+    def get_page(self, url):
+        # {"status_code", "html", "etag", "last_modified"} for a stored page, or None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status_code, body, etag, last_modified, validated_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or (self.page_ttl_seconds is not None and time.time() - row[4] > self.page_ttl_seconds):
+            return None
+        status_code, body, etag, last_modified, _ = row
+        return {"status_code": status_code, "html": zlib.decompress(body).decode("utf-8"), "etag": etag, "last_modified": last_modified}
+
+    def put_page(self, url, site, status_code, html, etag=None, last_modified=None):
+        body = zlib.compress(html.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            replaced = self._conn.execute("SELECT size_bytes FROM pages WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages"
+                " (url, site, status_code, body, etag, last_modified, size_bytes, fetched_at, validated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, site, status_code, body, etag, last_modified, len(body), now, now)
+            )
+            if self._size is None:
+                self._size = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM pages").fetchone()[0]
+            else:
+                self._size += len(body) - (replaced[0] if replaced else 0)
+            self._writes += 1
+            if self._writes >= EVICT_EVERY or (self.max_bytes and self._size > self.max_bytes):
+                self._evict_locked(now)
+
+    def page_validated(self, url):
+        # The server answered 304: the stored body is current again
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE pages SET validated_at = ? WHERE url = ?", (time.time(), url))
+
+    def _evict_locked(self, now):
+        self._writes = 0
+        if self.page_ttl_seconds is not None:
+            self._conn.execute("DELETE FROM pages WHERE validated_at < ?", (now - self.page_ttl_seconds,))
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM pages").fetchone()[0]
+        if not self.max_bytes or self._size <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO
+        doomed = []
+        for url, size in self._conn.execute("SELECT url, size_bytes FROM pages ORDER BY validated_at ASC"):
+            if self._size <= target:
+                break
+            doomed.append((url,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM pages WHERE url = ?", doomed)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock, self._conn:
+            removed = 0
+            if self.ttl_seconds is not None:
+                removed += self._conn.execute("DELETE FROM site_results WHERE fetched_at < ?", (now - self.ttl_seconds,)).rowcount
+            before = self._conn.total_changes
+            self._evict_locked(now)
+            removed += self._conn.total_changes - before
+        return removed
+
+    def stats(self):
+        with self._lock:
+            sites = self._conn.execute("SELECT COUNT(*) FROM site_results").fetchone()[0]
+            pages, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM pages").fetchone()
+        return {"sites": sites, "pages": pages, "size_bytes": total}
@@ -0,0 +1,63 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from cache_store import DetailsCache, SearchCache
+from planner import trim_to_budget
+from sweep import dry_run, expand_terms, load_cities, plan_job, price_plan
+
+# Budget trimming: dry runs over a search cache where neighbouring cities and term variants return many of
+# the same places, at budgets from 5% to 95% of the full plan's cost. A cached search's details are paid by
+# the first task that returns the places, so dropping it moves them onto a later task; the trimmed plan must
+# still fit. Prints how often a single trim pass would have gone over, and fails if a dry run's plan does.
+# Runs in a scratch directory. `python check_budget.py [state] [city depth] [seeds]`
+
+def fill_caches(search_cache, details_cache, terms, state, cities, rng):
+    # Each city draws from a window of the state's places that overlaps its neighbours' windows
+    for i, city in enumerate(cities):
+        window = [f"{state}-{n}" for n in range(i * 30, i * 30 + 90)]
+        for term in terms:
+            if rng.random() < 0.7:
+                ids = rng.sample(window, rng.randint(5, 60))
+                search_cache.put(term.lower(), city, state, [{"place_id": place_id, "name": place_id} for place_id in ids])
+        details_cache.put_many({place_id: {"name": place_id} for place_id in window if rng.random() < 0.25})
+
+def check_budget(state="Ohio", depth=15, seeds=5):
+    cities_by_state = load_cities()
+    cities = cities_by_state[state][:depth]
+    terms = expand_terms("dentist")
+    previous_dir = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="check_budget_")
+    os.chdir(scratch)
+    runs = over_once = failures = 0
+    try:
+        for seed in range(seeds):
+            search_cache, details_cache = SearchCache(path=f"search{seed}.db"), DetailsCache(path=f"details{seed}.db")
+            fill_caches(search_cache, details_cache, terms, state, cities, random.Random(seed))
+            plan = plan_job(terms, [state], cities_by_state, depth, search_cache, min_yield=0)
+            costs, report = price_plan(plan, search_cache, details_cache)
+            full = report["cost"]
+            for percent in range(5, 100, 5):
+                budget = round(full * percent / 100, 4)
+                # What a single trim pass leaves
+                _, once = price_plan(trim_to_budget(plan, costs, budget), search_cache, details_cache)
+                over_once += once["cost"] > budget
+                trimmed, report = dry_run(terms, [state], cities_by_state, depth, search_cache, details_cache,
+                                          min_yield=0, budget=budget)
+                runs += 1
+                if report["cost"] > budget or report["headroom"] < 0:
+                    failures += 1
+                    print(f"OVER seed {seed} budget {budget:.4f}: plan costs {report['cost']:.4f} "
+                          f"after trimming {report['trimmed_tasks']} of {len(plan['tasks'])} tasks")
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(scratch, ignore_errors=True)
+    print(f"{runs - failures}/{runs} trimmed plans fit their budget ({over_once} would have gone over after one trim pass)")
+    return failures
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(1 if check_budget(args[0] if args else "Ohio", int(args[1]) if len(args) > 1 else 15,
+                               int(args[2]) if len(args) > 2 else 5) else 0)
@@ -0,0 +1,169 @@
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dedup import (
+    ENTITY_COLUMNS, SHARED_HOSTS, candidate_pairs, entity_features, match_pairs, normalize_names, normalize_phones,
+    resolve_entities, website_hosts
+)
+
+# Entity resolution benchmark: pairwise precision and recall on two labelled samples, then candidate pairs
+# compared per second and run time as the input grows.
+# - corpus/entities/real_leads.csv: real rows from lead_archive.csv and leads.csv that share a phone number,
+#   website host or street address, labelled by hand. One entity is one practice at one location: listings of
+#   its dentists on the practice's phone line are the practice, branches of a chain and neighbours in one
+#   building are not. This is the score to trust.
+# - corpus/entities/labelled_leads.csv: archived leads, one per phone number, plus variants written by the
+#   rules below. The normalizer undoes exactly these rules, so its recall only shows that nothing regressed;
+#   it also seeds the synthetic scale runs.
+# Run `python check_entities.py [largest synthetic size]` after touching dedup.py; --rebuild-sample
+# regenerates the generated sample from lead_archive.csv.
+SAMPLE_FILE = os.path.join("corpus", "entities", "labelled_leads.csv")
+REAL_SAMPLE_FILE = os.path.join("corpus", "entities", "real_leads.csv")
+SCALE_SIZES = [50000, 100000, 200000, 400000]
+
+SUFFIXES = [", LLC", " LLC", ", Inc.", " Inc", ", PLLC", " PC"]
+UTM = ["?utm_source=google&utm_medium=organic", "?utm_source=GMB&utm_medium=organic&utm_campaign=local",
+       "?y_source=1_NTkxODg2NC03MTUtbG9jYXRpb24ud2Vic2l0ZQ%3D%3D"]
+
+def _phone_variant(phone, rng):
+    digits = normalize_phones([phone]).iloc[0]
+    if len(digits) != 10:
+        return phone
+    a, b, c = digits[:3], digits[3:6], digits[6:]
+    return rng.choice([f"{a}-{b}-{c}", f"+1 {a}.{b}.{c}", f"{a}{b}{c}", f"+1 ({a}) {b}-{c}", f"1-{a}-{b}-{c}"])
+
+def _website_variant(url, rng):
+    if not isinstance(url, str) or "://" not in url:
+        return url
+    scheme, rest = url.split("://", 1)
+    scheme = "http" if scheme == "https" else "https"
+    rest = rest[4:] if rest.startswith("www.") else "www." + rest
+    rest = rest.split("?")[0]
+    return f"{scheme}://{rest}" + (rng.choice(UTM) if rng.random() < 0.6 else "")
+
+def _name_variant(name, rng):
+    choice = rng.random()
+    if choice < 0.4:
+        return name + rng.choice(SUFFIXES)
+    if choice < 0.6:
+        return name.replace(" & ", " and ") if " & " in name else name.replace(" and ", " & ") if " and " in name else name.upper()
+    if choice < 0.8:
+        return "The " + name
+    return name.lower()
+
+def _address_variant(address, rng):
+    if not isinstance(address, str):
+        return address
+    address = address.replace(", United States", "")
+    for short, long in [(" St,", " Street,"), (" Rd,", " Road,"), (" Ave,", " Avenue,"), (" Dr,", " Drive,")]:
+        if short in address:
+            return address.replace(short, long, 1)
+    parts = address.split(",", 1)
+    return f"{parts[0]} Suite {rng.randint(1, 400)}," + parts[1] if len(parts) == 2 else address
+
+def build_sample(archive_path="lead_archive.csv", seed=7):
+    rng = random.Random(seed)
+    archive = pd.read_csv(archive_path)[ENTITY_COLUMNS]
+    phones = normalize_phones(archive["Phone"]).values
+    hosts = website_hosts(archive["Website"]).values
+    names = normalize_names(archive["Business Name"]).values
+    # One base lead per phone number (per host, then per name, for leads without one)
+    key = np.where(phones != "", "p" + phones, np.where(hosts != "", "h" + hosts, "n" + names))
+    bases = archive[~pd.Series(key).duplicated().values].reset_index(drop=True)
+    rows = []
+    for entity, base in bases.iterrows():
+        rows.append(dict(base, Entity=entity))
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            variant = dict(base, Entity=entity)
+            variant["Business Name"] = _name_variant(base["Business Name"], rng)
+            if rng.random() < 0.8:
+                variant["Phone"] = _phone_variant(base["Phone"], rng)
+            if rng.random() < 0.8:
+                variant["Website"] = _website_variant(base["Website"], rng)
+            if rng.random() < 0.5:
+                variant["Address"] = _address_variant(base["Address"], rng)
+            # Listings missing one contact field
+            drop = rng.random()
+            if drop < 0.1:
+                variant["Phone"] = ""
+            elif drop < 0.2:
+                variant["Website"] = ""
+            rows.append(variant)
+    sample = pd.DataFrame(rows, columns=ENTITY_COLUMNS + ["Entity"])
+    return sample.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def load_sample(path=SAMPLE_FILE):
+    return pd.read_csv(path, dtype=str, keep_default_na=False).astype({"Entity": int})
+
+def pair_scores(truth, predicted):
+    # Pairwise precision and recall: pairs of rows put in one entity vs pairs that are one entity
+    frame = pd.DataFrame({"truth": truth, "predicted": predicted})
+    pairs = lambda groups: int((groups * (groups - 1) // 2).sum())
+    true_pairs = pairs(frame.groupby("truth").size())
+    predicted_pairs = pairs(frame.groupby("predicted").size())
+    correct = pairs(frame.groupby(["truth", "predicted"]).size())
+    precision = correct / predicted_pairs if predicted_pairs else 1.0
+    recall = correct / true_pairs if true_pairs else 1.0
+    return precision, recall, true_pairs
+
+def synthetic(sample, size):
+    # `size` rows of distinct copies of the sample: copy k gets its own phone numbers, domains and house
+    # numbers, so copies never match each other and the labels carry over
+    digits = normalize_phones(sample["Phone"]).values
+    hosts = website_hosts(sample["Website"]).values
+    copies = []
+    for k in range(size // len(sample) + 1):
+        copy = sample.copy()
+        phones = [f"{(int(d) + k * 7_919_009) % 10**10:010d}" if len(d) == 10 else "" for d in digits]
+        copy["Phone"] = [f"({p[:3]}) {p[3:6]}-{p[6:]}" if p else "" for p in phones]
+        copy["Website"] = [url.replace(host, f"c{k}-{host}", 1) if host and host not in SHARED_HOSTS else url
+                           for url, host in zip(copy["Website"], hosts)]
+        copy["Address"] = copy["Address"].str.replace(r"^\s*(\d+)", lambda m: f"{m.group(1)}{k:04d}", regex=True)
+        copy["Entity"] = copy["Entity"] + k * (sample["Entity"].max() + 1)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True).head(size)
+
+def score_sample(label, sample):
+    stats = {}
+    start = time.perf_counter()
+    predicted = resolve_entities(sample, stats)
+    elapsed = time.perf_counter() - start
+    precision, recall, true_pairs = pair_scores(sample["Entity"].values, predicted.values)
+    print(f"{label}: {len(sample)} rows, {sample['Entity'].nunique()} entities, {true_pairs} duplicate pairs")
+    print(f"  precision {precision:.3f}  recall {recall:.3f}  ({stats['pairs']} candidate pairs, {elapsed * 1000:.0f} ms)")
+    return precision, recall
+
+def check_entities(largest=SCALE_SIZES[-1]):
+    real = score_sample("real sample (hand-labelled)", load_sample(REAL_SAMPLE_FILE))
+    sample = load_sample()
+    score_sample("generated sample", sample)
+
+    print(f"{'rows':>9} {'seconds':>8} {'rows/s':>9} {'pairs':>9} {'pairs/s':>10} {'precision':>9} {'recall':>7}")
+    for size in [s for s in SCALE_SIZES if s <= largest] or [largest]:
+        rows = synthetic(sample, size)
+        stats = {}
+        start = time.perf_counter()
+        predicted = resolve_entities(rows, stats)
+        elapsed = time.perf_counter() - start
+        # Pair comparisons alone, without feature extraction and blocking
+        features = entity_features(rows)
+        left, right = candidate_pairs(features)
+        compare_start = time.perf_counter()
+        match_pairs(features, features, left, right)
+        compare = time.perf_counter() - compare_start
+        precision, recall, _ = pair_scores(rows["Entity"].values, predicted.values)
+        print(f"{size:>9} {elapsed:>8.2f} {size / elapsed:>9.0f} {stats['pairs']:>9} {len(left) / compare:>10.0f} {precision:>9.3f} {recall:>7.3f}")
+    return real
+
+if __name__ == "__main__":
+    if "--rebuild-sample" in sys.argv:
+        os.makedirs(os.path.dirname(SAMPLE_FILE), exist_ok=True)
+        build_sample().to_csv(SAMPLE_FILE, index=False)
+        print(f"wrote {SAMPLE_FILE}")
+    else:
+        check_entities(int(sys.argv[1]) if len(sys.argv) > 1 else SCALE_SIZES[-1])
@@ -0,0 +1,33 @@
+import json
+import os
+import sys
+import time
+
+from enrich import HTML_PARSER, extract_people_info
+
+# Regression corpus: team/about pages plus the records the original three-stage
+# extract_people_info produced for them. Run `python check_extractor.py` after touching the extractor.
+# Malformed pages are repaired differently by each parser; "people_lxml" holds what they yield with lxml.
+CORPUS_DIR = os.path.join("corpus", "team_pages")
+EXPECTED_FILE = os.path.join(CORPUS_DIR, "expected.json")
+
+def check_corpus(corpus_dir=CORPUS_DIR, expected_file=EXPECTED_FILE):
+    with open(expected_file, "r", encoding="utf-8") as f:
+        cases = json.load(f)["cases"]
+    failures = 0
+    elapsed = 0.0
+    for case in cases:
+        with open(os.path.join(corpus_dir, case["page"]), "r", encoding="utf-8") as f:
+            html = f.read()
+        start = time.perf_counter()
+        people = extract_people_info(html, case["roles"])
+        elapsed += time.perf_counter() - start
+        expected = case.get(f"people_{HTML_PARSER}", case["people"])
+        if people != expected:
+            failures += 1
+            print(f"MISMATCH {case['page']} roles={case['roles']}: expected {len(expected)} records, got {len(people)}")
+    print(f"{len(cases) - failures}/{len(cases)} cases match ({elapsed * 1000:.0f} ms extracting with {HTML_PARSER})")
+    return failures
+
+if __name__ == "__main__":
+    sys.exit(1 if check_corpus() else 0)
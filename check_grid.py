@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import search
+from cache_store import SearchCache
+from geogrid import STATE_BOUNDS_FILE, STATE_SHAPES_FILE, grid_search
+from places_standin import CITIES_FILE, build_world, start_standin
+from sweep import cities_for_state, load_cities
+
+# Grid coverage vs top-city searches against the local Places stand-in: unique places found, billed
+# calls sent and unique places per call. Runs in a scratch directory so the stand-in's calls never reach
+# usage.db, the caches or the lead database. `python check_grid.py [state] [places] [city depth]`
+
+def check_grid(state="Ohio", places=4000, depth=25):
+    world = build_world([state], places)
+    server, base_url = start_standin(world)
+    cities_by_state = load_cities()
+    previous_dir = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="check_grid_")
+    for path in [STATE_BOUNDS_FILE, STATE_SHAPES_FILE, CITIES_FILE]:
+        shutil.copy(path, scratch)
+    os.environ["PLACES_API_BASE"] = base_url
+    # Stand-in page tokens are valid straight away
+    page_token_delay, search.PAGE_TOKEN_DELAY = search.PAGE_TOKEN_DELAY, 0
+    os.chdir(scratch)
+    try:
+        rows = []
+        for paginate in [False, True]:
+            server.counts.clear()
+            start = time.perf_counter()
+            found = set()
+            for city in cities_for_state(cities_by_state, state, depth):
+                found.update(r["place_id"] for r in search.search_places("business", f"{city}, {state}", "standin", paginate))
+            rows.append((f"top cities ({3 if paginate else 1} pg)", len(found), dict(server.counts), time.perf_counter() - start))
+
+        server.counts.clear()
+        start = time.perf_counter()
+        results, _, cells = grid_search("business", state, "standin", SearchCache(path="grid.db"))
+        rows.append((f"grid ({cells} cells)", len({r["place_id"] for r in results}), dict(server.counts), time.perf_counter() - start))
+    finally:
+        os.chdir(previous_dir)
+        search.PAGE_TOKEN_DELAY = page_token_delay
+        del os.environ["PLACES_API_BASE"]
+        server.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{state}: {len(world['places']):,} businesses in the stand-in")
+    for mode, unique, counts, seconds in rows:
+        # Every request the stand-in answers, next pages included, is a billed call
+        calls = sum(counts.values())
+        print(f"{mode:>20}: {unique:5,} unique ({unique / len(world['places']):.0%}), {calls:4,} billed calls,"
+              f" {unique / max(calls, 1):.1f} unique per call, {seconds:.1f}s")
+    return rows
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    check_grid(args[0] if args else "Ohio", int(args[1]) if len(args) > 1 else 4000, int(args[2]) if len(args) > 2 else 25)
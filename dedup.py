@@ -0,0 +1,385 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+LEADS_DB = "leads.db"
+
+KEY_COLUMNS = ["Business Name", "Phone", "Website"]
+# Digests are stored, so the hash must not change between library versions; stores whose recorded
+# scheme differs are rehashed on open
+DIGEST_SCHEME = "blake2b-64"
+ENTITY_COLUMNS = KEY_COLUMNS + ["Address"]
+
+# Entity resolution: rows that share a blocking key (phone digits, registrable domain or street address)
+# are compared, everything else is assumed different. Blocks bigger than MAX_BLOCK_SIZE (a chain's shared
+# domain, a call centre number) say little about identity and are skipped, which keeps the number of
+# comparisons linear in the number of rows.
+MAX_BLOCK_SIZE = 50
+NAME_MATCH = 0.8        # name similarity that, with one shared phone/domain/address, makes two rows one entity
+WEAK_NAME_MATCH = 0.5   # ... or with two of them
+LEGAL_WORDS = {"llc", "inc", "incorporated", "pllc", "pc", "ltd", "co", "corp", "corporation", "company", "lp", "llp", "the", "and"}
+# Hosts shared by unrelated businesses: no domain key
+SHARED_HOSTS = {
+    "facebook.com", "instagram.com", "google.com", "goo.gl", "yelp.com", "linktr.ee", "linkedin.com",
+    "twitter.com", "x.com", "youtube.com", "tiktok.com", "nextdoor.com", "yellowpages.com", "bbb.org"
+}
+# Site builders that give each business its own subdomain: the full host is the key
+HOSTING_DOMAINS = {"business.site", "wixsite.com", "squarespace.com", "godaddysites.com", "weebly.com", "wordpress.com", "square.site"}
+SECOND_LEVEL_SUFFIXES = {"co.uk", "org.uk", "ac.uk", "com.au", "net.au", "org.au", "co.nz", "com.mx", "com.br", "co.in", "co.jp"}
+
+def _clean(values):
+    return pd.Series(values, dtype="object").fillna("").astype(str).str.strip()
+
+# Vectorized normalizers: each takes any sequence and returns a Series of strings
+
+def normalize_names(names):
+    names = _clean(names).str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True)
+    return names.str.strip()
+
+def normalize_phones(phones):
+    digits = _clean(phones).str.replace(r"\D", "", regex=True)
+    # Drop the US country code so "+1 (330) 724-2551" matches "(330) 724-2551"
+    has_country_code = (digits.str.len() == 11) & digits.str.startswith("1")
+    return digits.where(~has_country_code, digits.str[1:])
+
+def website_hosts(urls):
+    urls = _clean(urls).str.lower()
+    urls = urls.where(urls != "nan", "")
+    hosts = urls.str.replace(r"^[a-z][a-z0-9+.-]*://", "", regex=True).str.extract(r"^(?:[^/?#@]*@)?([^/?#:]*)", expand=False)
+    return hosts.fillna("").str.replace(r"^www\.", "", regex=True)
+
+def registrable_domains(urls):
+    # "https://www.smiles.example.com/?utm_source=x" -> "example.com"; "" for shared hosts like facebook.com
+    def domain(host):
+        labels = host.split(".")
+        if len(labels) < 2:
+            return ""
+        keep = 3 if ".".join(labels[-2:]) in SECOND_LEVEL_SUFFIXES else 2
+        registrable = ".".join(labels[-keep:])
+        if registrable in SHARED_HOSTS:
+            return ""
+        if registrable in HOSTING_DOMAINS:
+            return host if len(labels) > keep else ""
+        return registrable
+    return website_hosts(urls).map(domain)
+
+def address_keys(addresses):
+    # House number, first street word and ZIP code: "1220 Grandview Ave, Columbus, OH 43212" -> "1220 grandview 43212".
+    # Suites, street types and spelling of the city do not matter; "" when any part is missing.
+    addresses = _clean(addresses).str.lower()
+    street = addresses.str.extract(r"^\s*(\d+[a-z]?)\s+(?:[nsew]\.?\s+)?([a-z0-9]+)")
+    zips = addresses.str.extract(r"\b(\d{5})(?:-\d{4})?\b(?!.*\b\d{5}\b)", expand=False)
+    keys = street[0] + " " + street[1] + " " + zips
+    return keys.fillna("")
+
+def entity_names(names):
+    # Names as compared for entity resolution: legal forms and filler words dropped
+    words = normalize_names(names).str.split()
+    return words.map(lambda ws: " ".join(w for w in ws if w not in LEGAL_WORDS))
+
+def lead_keys(df):
+    if df.empty:
+        return pd.Series([], dtype="object")
+    columns = [df[col].values if col in df.columns else [""] * len(df) for col in KEY_COLUMNS]
+    keys = normalize_names(columns[0]) + "|" + normalize_phones(columns[1]) + "|" + website_hosts(columns[2])
+    keys.index = df.index
+    return keys
+
+def key_digest(key):
+    # 64-bit signed digest of a normalized key, so it fits an SQLite INTEGER and a compact in-memory set
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def lead_digests(df):
+    return [key_digest(key) for key in lead_keys(df)]
+
+def lead_key(name, phone, website):
+    return lead_keys(pd.DataFrame([[name, phone, website]], columns=KEY_COLUMNS)).iloc[0]
+
+def lead_digest(name, phone, website):
+    return lead_digests(pd.DataFrame([[name, phone, website]], columns=KEY_COLUMNS))[0]
+
+def duplicated_leads(df):
+    # Boolean mask of rows whose normalized key already appeared earlier in df
+    return lead_keys(df).duplicated()
+
+def _chunks(values, size=500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class DedupIndex:
+    # Persistent set of normalized lead keys with O(1) in-memory membership checks, plus the archived
+    # entities for near-duplicate matching: one row of features per entity and its blocking keys in SQLite
+
+    def __init__(self, path=LEADS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lead_keys (digest INTEGER PRIMARY KEY)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                " id INTEGER PRIMARY KEY, name TEXT NOT NULL, phone TEXT NOT NULL, domain TEXT NOT NULL, address TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entity_blocks ("
+                " block TEXT NOT NULL, entity_id INTEGER NOT NULL, PRIMARY KEY (block, entity_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT)")
+            scheme = self._conn.execute("SELECT value FROM store_meta WHERE name = 'lead_keys_scheme'").fetchone()
+            if scheme is None or scheme[0] != DIGEST_SCHEME:
+                self._rehash_locked()
+        self._keys = {row[0] for row in self._conn.execute("SELECT digest FROM lead_keys")}
+
+    def _rehash_locked(self):
+        # Digests from an older scheme are rebuilt from the archived leads (a store without them rebuilds from the CSV)
+        self._conn.execute("DELETE FROM lead_keys")
+        has_leads = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leads'").fetchone()
+        if has_leads:
+            rows = self._conn.execute("SELECT business_name, phone, website FROM leads").fetchall()
+            digests = lead_digests(pd.DataFrame(rows, columns=KEY_COLUMNS))
+            self._conn.executemany("INSERT OR IGNORE INTO lead_keys (digest) VALUES (?)", [(d,) for d in digests])
+        self._conn.execute("INSERT OR REPLACE INTO store_meta (name, value) VALUES ('lead_keys_scheme', ?)", (DIGEST_SCHEME,))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, digest):
+        return bool(self.known([digest])[0])
+
+    def contains(self, name, phone, website):
+        return lead_digest(name, phone, website) in self
+
+    def known(self, digests):
+        # Membership per digest. The in-memory set answers most lookups; misses are checked in SQLite,
+        # so keys another process (the CLI next to the app) added since this index was opened still count.
+        known = [d in self._keys for d in digests]
+        missing = list({d for d, k in zip(digests, known) if not k})
+        if not missing:
+            return known
+        found = set()
+        with self._lock:
+            for chunk in _chunks(missing):
+                marks = ", ".join("?" * len(chunk))
+                found.update(row[0] for row in self._conn.execute(f"SELECT digest FROM lead_keys WHERE digest IN ({marks})", chunk))
+            self._keys.update(found)
+        return [k or d in found for d, k in zip(digests, known)]
+
+    def add_digests(self, digests):
+        with self._lock:
+            new = [d for d in set(digests) if d not in self._keys]
+            if not new:
+                return 0
+            with self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany("INSERT OR IGNORE INTO lead_keys (digest) VALUES (?)", [(d,) for d in new])
+                added = self._conn.total_changes - before
+            self._keys.update(new)
+        return added
+
+    def add_leads(self, df):
+        self.add_entities(df)
+        return self.add_digests(lead_digests(df))
+
+    def build_from_csv(self, path):
+        if not os.path.exists(path):
+            return 0
+        return self.add_leads(pd.read_csv(path, usecols=lambda col: col in ENTITY_COLUMNS))
+
+    def entity_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def _candidates(self, blocks):
+        # (block, entity_id) rows for the given blocks, leaving out blocks too big to be informative
+        keys = blocks["block"].unique().tolist()
+        rows = []
+        with self._lock:
+            for chunk in _chunks(keys):
+                marks = ", ".join("?" * len(chunk))
+                small = [block for block, in self._conn.execute(
+                    f"SELECT block FROM entity_blocks WHERE block IN ({marks}) GROUP BY block HAVING COUNT(*) <= ?",
+                    chunk + [MAX_BLOCK_SIZE]
+                )]
+                for part in _chunks(small):
+                    marks = ", ".join("?" * len(part))
+                    rows += self._conn.execute(f"SELECT block, entity_id FROM entity_blocks WHERE block IN ({marks})", part).fetchall()
+        return pd.DataFrame(rows, columns=["block", "entity_id"])
+
+    def _entity_features(self, entity_ids):
+        rows = []
+        with self._lock:
+            for chunk in _chunks(entity_ids):
+                marks = ", ".join("?" * len(chunk))
+                rows += self._conn.execute(
+                    f"SELECT id, name, phone, domain, address FROM entities WHERE id IN ({marks})", chunk
+                ).fetchall()
+        return pd.DataFrame(rows, columns=["id", "name", "phone", "domain", "address"])
+
+    def match_entities(self, df, features=None):
+        # Archived entity id per row (same index), or NA for rows that resolve to no archived entity
+        matches = pd.Series(pd.NA, index=df.index, dtype="Int64")
+        if df.empty:
+            return matches
+        features = entity_features(df) if features is None else features
+        blocks = _blocks(features)
+        if blocks.empty:
+            return matches
+        candidates = self._candidates(blocks)
+        if candidates.empty:
+            return matches
+        pairs = blocks.merge(candidates, on="block")[["position", "entity_id"]].drop_duplicates()
+        entities = self._entity_features(pairs["entity_id"].unique().tolist())
+        entity_pos = pd.Series(np.arange(len(entities)), index=entities["id"].values)
+        left = pairs["position"].values
+        right = entity_pos.loc[pairs["entity_id"].values].values
+        matched = match_pairs(features, entities, left, right)
+        # Lowest entity id wins when a row matches several
+        found = pairs[matched].groupby("position")["entity_id"].min()
+        values = matches.values.copy()
+        values[found.index.values] = found.values
+        return pd.Series(values, index=df.index, dtype="Int64")
+
+    def add_entities(self, df):
+        # Resolves the rows among themselves and against the archive. Rows of an archived entity add their
+        # blocking keys to it; every other group of rows becomes one new entity. Returns each row's entity id
+        # (same index).
+        if df.empty:
+            return pd.Series([], index=df.index, dtype="int64")
+        features = entity_features(df)
+        groups = resolve_entities(df).values
+        archived = self.match_entities(df, features).values
+        blocks = _blocks(features)
+        with self._lock:
+            with self._conn:
+                entity_of_group = {}
+                for position, group in enumerate(groups):
+                    if not pd.isna(archived[position]):
+                        entity_of_group.setdefault(group, int(archived[position]))
+                rows = features[["name", "phone", "domain", "address"]].values
+                for position, group in enumerate(groups):
+                    if group not in entity_of_group:
+                        cur = self._conn.execute(
+                            "INSERT INTO entities (name, phone, domain, address) VALUES (?, ?, ?, ?)", tuple(rows[position])
+                        )
+                        entity_of_group[group] = cur.lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entity_blocks (block, entity_id) VALUES (?, ?)",
+                    [(block, entity_of_group[groups[position]]) for position, block in zip(blocks["position"], blocks["block"])]
+                )
+        return pd.Series([entity_of_group[group] for group in groups], index=df.index, dtype="int64")
+
+# ---------------- Entity resolution ----------------
+
+def entity_features(df):
+    # One row per lead (same index): comparison name, phone digits, registrable domain and address key
+    column = lambda name: df[name].values if name in df.columns else [""] * len(df)
+    phones = normalize_phones(column("Phone"))
+    features = pd.DataFrame({
+        "name": entity_names(column("Business Name")).values,
+        "phone": phones.where(phones.str.len() >= 7, "").values,
+        "domain": registrable_domains(column("Website")).values,
+        "address": address_keys(column("Address")).values
+    }, index=df.index)
+    return features
+
+def _blocks(features):
+    # Long (position, block) pairs; a row has up to one block per kind of key
+    positions = np.arange(len(features))
+    parts = []
+    for kind in ["phone", "domain", "address"]:
+        values = features[kind].values
+        present = values != ""
+        parts.append(pd.DataFrame({"position": positions[present], "block": kind[0] + ":" + values[present].astype(object)}))
+    return pd.concat(parts, ignore_index=True)
+
+@lru_cache(maxsize=65536)
+def _grams(name):
+    padded = f" {name} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def name_similarity(a, b):
+    # Jaccard similarity of character trigrams; cheap enough to run millions of times a second
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def match_pairs(left, right, left_pos, right_pos):
+    # Boolean array: is left row left_pos[k] the same entity as right row right_pos[k]?
+    # Two different phone numbers always mean two entities (chain locations share a domain and a name).
+    # Same phone and same domain is one entity whatever the names; otherwise the names must be close,
+    # the more so the less contact data the rows share.
+    if not len(left_pos):
+        return np.zeros(0, dtype=bool)
+    same = {}
+    for kind in ["phone", "domain", "address"]:
+        a = left[kind].values[left_pos]
+        b = right[kind].values[right_pos]
+        same[kind] = (a == b) & (a != "")
+        if kind == "phone":
+            conflict = (a != b) & (a != "") & (b != "")
+    evidence = same["phone"].astype(int) + same["domain"] + same["address"]
+    matched = same["phone"] & same["domain"]
+    undecided = np.flatnonzero(~matched & ~conflict & (evidence > 0))
+    # Names are only compared where the contact data leaves the answer open
+    left_names, right_names = left["name"].values, right["name"].values
+    for k in undecided:
+        similarity = name_similarity(_grams(left_names[left_pos[k]]), _grams(right_names[right_pos[k]]))
+        matched[k] = similarity >= NAME_MATCH or (similarity >= WEAK_NAME_MATCH and evidence[k] >= 2)
+    return matched & ~conflict
+
+def candidate_pairs(features, max_block=MAX_BLOCK_SIZE):
+    # (left, right) position arrays of every pair of rows sharing a block of at most max_block rows
+    blocks = _blocks(features)
+    sizes = blocks.groupby("block")["position"].transform("size")
+    blocks = blocks[(sizes > 1) & (sizes <= max_block)]
+    pairs = blocks.merge(blocks, on="block")
+    pairs = pairs[pairs["position_x"] < pairs["position_y"]]
+    pairs = pairs[["position_x", "position_y"]].drop_duplicates()
+    return pairs["position_x"].values, pairs["position_y"].values
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def resolve_entities(df, stats=None):
+    # Entity number per row (same index): rows resolved to the same entity share the number of the
+    # first of them. stats, if given, gets the candidate pair and match counts.
+    if df.empty:
+        return pd.Series([], index=df.index, dtype="int64")
+    features = entity_features(df)
+    left, right = candidate_pairs(features)
+    matched = match_pairs(features, features, left, right)
+    parent = list(range(len(df)))
+    for i, j in zip(left[matched], right[matched]):
+        a, b = _find(parent, i), _find(parent, j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    if stats is not None:
+        stats["pairs"] = stats.get("pairs", 0) + len(left)
+        stats["matches"] = stats.get("matches", 0) + int(matched.sum())
+    return pd.Series([_find(parent, i) for i in range(len(df))], index=df.index, dtype="int64")
+
+def duplicated_entities(df):
+    # Boolean mask of rows resolved to the same entity as an earlier row of df
+    entities = resolve_entities(df)
+    return pd.Series(entities.values != np.arange(len(df)), index=df.index)
+
+def harvest_status(df, index):
+    # "Already Harvested" / "New" per row, checked against the persistent index: an exact key match
+    # or a row resolved to an archived entity
+    known = index.known(lead_digests(df))
+    if not all(known):
+        known = np.array(known) | index.match_entities(df).notna().values
+    return pd.Series(
+        ["Already Harvested" if k else "New" for k in known],
+        index=df.index,
+        dtype="object"
+    )
@@ -1,10 +1,170 @@
 import requests
 import cloudscraper
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+import heapq
+import importlib.util
 import re
-from urllib.parse import urljoin
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
 import json
 
+from roles import role_matcher
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:112.0) Gecko/20100101 Firefox/112.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive"
+}
+REQUEST_TIMEOUT = 10
+# lxml builds the tree several times faster than the pure-Python parser; html.parser is the fallback
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+MAX_CACHED_PAGES = 128  # pages memoized per FetchSession (LRU)
+
+class Page:
+    # A fetched page: the HTML is decoded once and the parsed tree is built on first use
+    def __init__(self, url, status_code, html, size, http_error=None, etag=None, last_modified=None):
+        self.url = url
+        self.status_code = status_code
+        self.html = html
+        self.size = size
+        self.http_error = http_error
+        self.etag = etag
+        self.last_modified = last_modified
+        self._soup = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_response(cls, url, response):
+        try:
+            response.raise_for_status()
+            http_error = None
+        except requests.exceptions.HTTPError as e:
+            http_error = e
+        return cls(url, response.status_code, response.text, len(response.content), http_error,
+                   response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    @property
+    def text(self):
+        return self.html
+
+    def raise_for_status(self):
+        if self.http_error:
+            raise self.http_error
+
+    @property
+    def soup(self):
+        with self._lock:
+            if self._soup is None:
+                self._soup = BeautifulSoup(self.html, HTML_PARSER)
+            return self._soup
+
+class _PendingFetch:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.page = None
+        self.error = None
+
+def canonical_site(url):
+    # "https://www.Example.com/?utm_source=x" and "http://example.com" -> "example.com"; a path is kept
+    # ("example.com/locations/akron") since location pages of one chain can list different people
+    url = clean_url(url)
+    if not url:
+        return ""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    return host + parsed.path.rstrip("/")
+
+def _roles_key(matched_roles):
+    # Results depend on the roles looked for, so sites are cached per role list
+    return json.dumps(role_matcher(matched_roles).roles)
+
+class FetchSession:
+    # One pooled scraper shared by every site in a run, with each URL fetched at most once.
+    # With an EnrichmentCache, pages stored by earlier runs are revalidated with conditional GETs
+    # (a 304 reuses the stored HTML) and finished sites' results are reused within the cache's TTL.
+
+    def __init__(self, max_pages=MAX_CACHED_PAGES, cache=None):
+        self.scraper = cloudscraper.create_scraper()
+        self.max_pages = max_pages
+        self.cache = cache
+        self.requests = 0
+        self.bytes = 0
+        self.not_modified = 0
+        self.cached_sites = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._pages.get(url)
+            owner = entry is None
+            if owner:
+                entry = self._pages[url] = _PendingFetch()
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+            else:
+                self._pages.move_to_end(url)
+        if owner:
+            try:
+                entry.page = self._fetch(url)
+            except Exception as e:
+                # Failures are memoized too, so a dead site is not retried within the run
+                entry.error = e
+            entry.ready.set()
+        else:
+            entry.ready.wait()
+        if entry.error:
+            raise entry.error
+        return entry.page
+
+    def _fetch(self, url):
+        stored = self.cache.get_page(url) if self.cache else None
+        headers = HEADERS
+        if stored:
+            headers = dict(HEADERS)
+            if stored["etag"]:
+                headers["If-None-Match"] = stored["etag"]
+            if stored["last_modified"]:
+                headers["If-Modified-Since"] = stored["last_modified"]
+        response = self.scraper.get(url, timeout=REQUEST_TIMEOUT, headers=headers)
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(response.content)
+        if stored and response.status_code == 304:
+            self.cache.page_validated(url)
+            with self._lock:
+                self.not_modified += 1
+            return Page(url, stored["status_code"], stored["html"], len(stored["html"]), None, stored["etag"], stored["last_modified"])
+        page = Page.from_response(url, response)
+        # Only pages a server can revalidate are worth keeping
+        if self.cache and page.status_code == 200 and (page.etag or page.last_modified):
+            self.cache.put_page(url, canonical_site(url), page.status_code, page.html, page.etag, page.last_modified)
+        return page
+
+    def cached_result(self, website, matched_roles):
+        # A fresh stored result for the site, or None; makes no request either way
+        site = canonical_site(website)
+        if self.cache is None or not site:
+            return None
+        result = self.cache.get_result(site, _roles_key(matched_roles))
+        if result is None:
+            return None
+        with self._lock:
+            self.cached_sites += 1
+        return dict(result, website=clean_url(website))
+
+    def store_result(self, website, matched_roles, result):
+        site = canonical_site(website)
+        if self.cache is not None and site:
+            self.cache.put_result(site, _roles_key(matched_roles), result)
+
+    def stats(self):
+        return {"requests": self.requests, "bytes": self.bytes, "not_modified": self.not_modified, "cached_sites": self.cached_sites}
+
 def extract_generic_email(soup, html=""):
     emails = set(re.findall(r"[a-zA-Z0-9._%+-]+@(?!example\.com)[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", soup.get_text()))
     mailtos = soup.select("a[href^=mailto]")
@@ -41,64 +201,86 @@ def extract_phone_from_text(text):
     matches = re.findall(pattern, text)
     return matches[0] if matches else None
 
-def extract_people_info(html, matched_roles):
-    soup = BeautifulSoup(html, "html.parser")
+# Tags whose text is checked for a role, and the headings a name is taken from (Step 1)
+CONTACT_TAGS = frozenset(["p", "div", "li", "h1", "h2", "h3", "span", "strong", "section", "a"])
+NAME_TAGS = frozenset(["h1", "h2", "h3", "strong"])
+TEXT_TYPES = (NavigableString, CData)  # what get_text() counts; comments, scripts and styles are skipped
+MAX_ROLE_WORDS = 5
+
+GENERIC_LABELS = {"meet our team", "our team", "team", "leadership", "management", "staff", "about us"}
+# Names must look like "First Last" (capitalized, 2+ parts)
+TAG_NAME_RE = re.compile(r"^[A-Z][a-z]+( [A-Z][a-z]+)+$")
+LINE_NAME_RE = re.compile(r"^[A-Z][a-z]+(?: [A-Z][a-z]+)+$")
+
+def _walk_tree(soup):
+    # One pass over the tree. Collects every text string in document order and, for each
+    # contact/name tag, the [start, end) slice of those strings it contains plus the
+    # nearest h1/h2/h3/strong opened before it (what find_previous would return).
+    strings, contacts, images = [], [], []
+    last_heading = None
+    stack = [(iter(soup.contents), None)]
+    while stack:
+        child = next(stack[-1][0], None)
+        if child is None:
+            _, record = stack.pop()
+            if record is not None:
+                record[2] = len(strings)
+            continue
+        if isinstance(child, Tag):
+            record = None
+            if child.name in CONTACT_TAGS or child.name in NAME_TAGS:
+                record = [child, len(strings), None, last_heading]
+                if child.name in CONTACT_TAGS:
+                    contacts.append(record)
+                if child.name in NAME_TAGS:
+                    last_heading = record
+            elif child.name == "img":
+                images.append(child)
+            stack.append((iter(child.contents), record))
+        elif type(child) in TEXT_TYPES:
+            strings.append(child)
+    return strings, contacts, images
+
+def extract_people_info(html, matched_roles, soup=None):
+    # matched_roles: a role list or a RoleMatcher; lists are compiled once and cached
+    soup = soup or BeautifulSoup(html, HTML_PARSER)
     people = []
-
-    GENERIC_LABELS = {"meet our team", "our team", "team", "leadership", "management", "staff", "about us"}
-
-    # Step 1: Scan structured elements
-    for tag in soup.find_all(["p", "div", "li", "h1", "h2", "h3", "span", "strong", "section", "a"]):
-        text = tag.get_text(" ", strip=True)
-        if any(role.lower() in text.lower() for role in matched_roles):
-            name_tag = tag.find_previous(["h1", "h2", "h3", "strong"])
-            if name_tag:
-                name = name_tag.get_text(strip=True)
-                if name.lower() in GENERIC_LABELS:
-                    continue  # Skip generic headers as contact names
-            else:
-                name = ""
-            # Improved title matching logic
-            skip_keywords = ["specialty", "areas", "services", "invisalign", "implants", "procedures", "bio", "about", "focus"]
-            cleaned_text = text.lower().strip()
-
-            # Ensure it's a short, clean role description, not a specialization bio
-            if 1 <= len(cleaned_text.split()) <= 5 and not any(kw in cleaned_text for kw in skip_keywords):
-                for role in matched_roles:
-                    if role.lower() in cleaned_text:
-                        clean_name = name.strip().replace("\n", " ").replace("\r", " ")
-                        clean_role = role.title().strip()
-                        # Skip titles that contain marketing/section phrases (case-insensitive, expanded list)
-                        generic_phrases = [
-                            "welcome to", "about your", "our services", "learn more",
-                            "improve your smile", "what to expect", "iv sedation",
-                            "sleep apnea", "quality dental care", "new patients", 
-                            "treatments", "dental care", "oral health"
-                        ]
-                        if any(phrase in cleaned_text.lower() for phrase in generic_phrases):
-                            continue
-
-                        import re
-                        # Only allow names that look like "First Last" (capitalized, 2+ parts)
-                        if not re.match(r"^[A-Z][a-z]+( [A-Z][a-z]+)+$", clean_name):
-                            continue
-
-                        formatted = {"name": clean_name, "role": clean_role}
-                        if formatted not in people:
-                            people.append({
-                                "name": clean_name,
-                                "role": clean_role,
-                                "email": extract_email_from_text(str(tag)),
-                                "phone": extract_phone_from_text(str(tag))
-                            })
-                        break
-
-    # Step 2: Scan image alt/title attributes
-    for img in soup.find_all("img"):
-        alt_text = img.get("alt", "")
-        title_text = img.get("title", "")
-        combined = f"{alt_text} {title_text}".strip()
-        if any(role.lower() in combined.lower() for role in matched_roles):
+    matcher = role_matcher(matched_roles)
+    strings, contacts, images = _walk_tree(soup)
+
+    # Step 1: Structured elements. Word counts are prefix sums over the strings, so only
+    # short elements (a few words) ever have their text assembled.
+    stripped = [s.strip() for s in strings]
+    word_ends = [0]
+    for s in stripped:
+        word_ends.append(word_ends[-1] + len(s.split()))
+    for tag, start, end, heading in contacts:
+        if not 1 <= word_ends[end] - word_ends[start] <= MAX_ROLE_WORDS:
+            continue
+        cleaned_text = " ".join(s for s in stripped[start:end] if s).lower()
+        role = matcher.first_role(cleaned_text)
+        if role is None or heading is None:
+            continue
+        name = "".join(stripped[heading[1]:heading[2]])
+        if name.lower() in GENERIC_LABELS:
+            continue  # Skip generic headers as contact names
+        if matcher.is_title_noise(cleaned_text):
+            continue
+        clean_name = name.strip().replace("\n", " ").replace("\r", " ")
+        if not TAG_NAME_RE.match(clean_name):
+            continue
+        markup = str(tag)
+        people.append({
+            "name": clean_name,
+            "role": role.title().strip(),
+            "email": extract_email_from_text(markup),
+            "phone": extract_phone_from_text(markup)
+        })
+
+    # Step 2: Image alt/title attributes
+    for img in images:
+        combined = f"{img.get('alt', '')} {img.get('title', '')}".strip()
+        if matcher.search(combined):
             people.append({
                 "name": combined,
                 "role": combined,
@@ -106,38 +288,29 @@ def extract_people_info(html, matched_roles):
                 "phone": ""
             })
 
-    # Step 3: Fallback line-by-line scan
-    full_text_lines = soup.get_text(separator="\n").splitlines()
+    # Step 3: Fallback line-by-line scan over the same strings
+    full_text_lines = "\n".join(strings).splitlines()
     seen = set()
     for i, line in enumerate(full_text_lines):
-        if any(role.lower() in line.lower() for role in matched_roles):
-            name_line = full_text_lines[i - 1].strip() if i > 0 else ""
-            role_line = line.strip()
-            identifier = f"{name_line} – {role_line}"
-            if identifier and identifier not in seen:
-                import re
-                # Additional noise filtering for fallback lines
-                skip_phrases = [
-                    "meet your", "what our patients", "our services", "about your", 
-                    "frequently asked", "faq", "iv sedation", "sleep apnea", 
-                    "quality dental care", "new patients", "treatments", "oral health"
-                ]
-                combined_line = f"{name_line.lower()} {role_line.lower()}"
-                if any(phrase in combined_line for phrase in skip_phrases):
-                    continue
-
-                # Improved name check: must be two proper capitalized words (e.g., John Smith)
-                if not re.match(r"^[A-Z][a-z]+(?: [A-Z][a-z]+)+$", name_line):
-                    continue
-
-                seen.add(identifier)
-                contact_block = f"{name_line}\n{role_line}"
-                people.append({
-                    "name": name_line,
-                    "role": role_line,
-                    "email": extract_email_from_text(contact_block),
-                    "phone": extract_phone_from_text(contact_block)
-                })
+        if not matcher.search(line):
+            continue
+        name_line = full_text_lines[i - 1].strip() if i > 0 else ""
+        role_line = line.strip()
+        identifier = f"{name_line} – {role_line}"
+        if identifier in seen:
+            continue
+        if matcher.is_line_noise(f"{name_line} {role_line}"):
+            continue
+        if not LINE_NAME_RE.match(name_line):
+            continue
+        seen.add(identifier)
+        contact_block = f"{name_line}\n{role_line}"
+        people.append({
+            "name": name_line,
+            "role": role_line,
+            "email": extract_email_from_text(contact_block),
+            "phone": extract_phone_from_text(contact_block)
+        })
 
     return people
 
@@ -154,7 +327,60 @@ def find_contact_page_link(soup, base_url):
             return urljoin(base_url, a["href"])
     return ""
 
-def scrape_contact_info_from_site(website, matched_roles):
+def _ssl_failed(website):
+    return {
+        "business_email": "",
+        "direct_contacts": "No direct contact found",
+        "website": website,
+        "scrape_status": "SSL Verification Failed"
+    }
+
+# Per-site crawl policy: a site's crawl stops at whichever limit comes first, or as soon as contacts
+# for ENOUGH_ROLES of the industry's roles are found. Every request counts: homepage, robots.txt,
+# sitemaps and subpages, failed ones included.
+MAX_SITE_PAGES = 8                 # requests per site
+MAX_SITE_BYTES = 2 * 1024 * 1024   # bytes downloaded per site
+MAX_SITE_SECONDS = 30.0            # seconds per site (a request already started still finishes)
+ENOUGH_ROLES = 2
+
+class CrawlPolicy:
+    def __init__(self, max_pages=MAX_SITE_PAGES, max_bytes=MAX_SITE_BYTES, max_seconds=MAX_SITE_SECONDS,
+                 enough_roles=ENOUGH_ROLES):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.enough_roles = enough_roles
+
+class SiteBudget:
+    # What one site's crawl has spent against its CrawlPolicy. A URL counts once: the session memoizes
+    # pages, so asking for one again costs nothing.
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.pages = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._fetched = set()
+
+    def allows(self):
+        return (self.pages < self.policy.max_pages and self.bytes < self.policy.max_bytes
+                and time.monotonic() - self.started < self.policy.max_seconds)
+
+    def fetch(self, session, url):
+        # session.get(url), counted whether it succeeds or raises
+        counted = url in self._fetched
+        if not counted:
+            self._fetched.add(url)
+            self.pages += 1
+        page = session.get(url)
+        if not counted:
+            self.bytes += page.size
+        return page
+
+def _page_text(soup):
+    return soup.get_text(separator=" ").strip().replace("\n", " ").replace("\r", " ")
+
+def scrape_contact_info_from_site(website, matched_roles, session=None, subpage_keywords=None, policy=None):
     website = clean_url(website)
     if not website or website.lower().strip() == "nan":
         return {
@@ -164,146 +390,191 @@ def scrape_contact_info_from_site(website, matched_roles):
             "scrape_status": "Invalid URL"
         }
 
-    result = {}
-    soup = None
-    direct_contacts = []
-    scrape_status = "Unknown Error"
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:112.0) Gecko/20100101 Firefox/112.0",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive"
-    }
+    # Pages are memoized on the session, so the homepage is fetched and parsed once per site
+    session = session or FetchSession()
+    policy = policy or CrawlPolicy()
+    cached = session.cached_result(website, matched_roles)
+    if cached is not None:
+        return cached
+    matcher = role_matcher(matched_roles)
+    enough_roles = min(policy.enough_roles, len(set(matcher.roles))) or 1
+    budget = SiteBudget(policy)
 
     try:
-        priority_links = crawl_priority_links(website)
-
-        scraper = cloudscraper.create_scraper()
-        for link in priority_links:
-            try:
-                response = scraper.get(link, timeout=10, headers=headers)
-            except requests.exceptions.SSLError:
-                scrape_status = "SSL Verification Failed"
-                return {
-                    "business_email": "",
-                    "direct_contacts": "No direct contact found",
-                    "website": website,
-                    "scrape_status": scrape_status
-                }
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ").strip().replace("\n", " ").replace("\r", " ")
-
-            people = extract_people_info(response.text, matched_roles)
-
-            for person in people:
-                name = person.get("name", "").strip()
-                role = person.get("role", "").strip()
-                if name and role:
-                    direct_contacts.append(f"{name} – {role}")
-
-        if not direct_contacts:
-            try:
-                response = scraper.get(website, timeout=10, headers=headers)
-            except requests.exceptions.SSLError:
-                scrape_status = "SSL Verification Failed"
-                return {
-                    "business_email": "",
-                    "direct_contacts": "No direct contact found",
-                    "website": website,
-                    "scrape_status": scrape_status
-                }
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ").strip().replace("\n", " ").replace("\r", " ")
-            people = extract_people_info(response.text, matched_roles)
-
-            for person in people:
-                name = person.get("name", "").strip()
-                role = person.get("role", "").strip()
-                if name and role:
-                    direct_contacts.append(f"{name} – {role}")
-
-        scrape_status = "Success"
-
+        home = budget.fetch(session, website)
+        home.raise_for_status()
+    except requests.exceptions.SSLError:
+        return _ssl_failed(website)
     except requests.exceptions.HTTPError as e:
-        scrape_status = f"{e.response.status_code} {e.response.reason}"
-        page_text = ""
+        return _site_result(website, [], "", f"{e.response.status_code} {e.response.reason}")
     except Exception as e:
         print(f"Failed to scrape {website}: {e}")
-        scrape_status = "Error"
-        page_text = ""
-
-    if not soup:
+        return _site_result(website, [], "", "Error")
+    keywords = [k.lower() for k in (subpage_keywords or TARGET_SUBPAGE_KEYWORDS)]
+
+    # Candidate subpages, best keyword score first; links found on visited subpages join the queue
+    queue, queued = [], {website}
+    def push(candidates):
+        for score, url in candidates:
+            if url not in queued:
+                queued.add(url)
+                heapq.heappush(queue, (-score, len(queued), url))
+    try:
+        push(discover_subpages(website, session, keywords, limit=policy.max_pages, budget=budget))
+    except Exception as e:
+        print(f"Error crawling {website}: {e}")
+
+    direct_contacts, roles_found, visited = [], set(), []
+    def collect(page):
+        for person in extract_people_info(page.html, matcher, soup=page.soup):
+            name = person.get("name", "").strip()
+            role = person.get("role", "").strip()
+            if name and role:
+                direct_contacts.append(f"{name} – {role}")
+                roles_found.add(matcher.first_role(role) or role.lower())
+
+    while queue and len(roles_found) < enough_roles and budget.allows():
+        _, _, url = heapq.heappop(queue)
+        # One bad subpage (404, timeout, certificate) only costs that page
         try:
-            try:
-                response = scraper.get(website, timeout=10, headers=headers)
-            except requests.exceptions.SSLError:
-                scrape_status = "SSL Verification Failed"
-                return {
-                    "business_email": "",
-                    "direct_contacts": "No direct contact found",
-                    "website": website,
-                    "scrape_status": scrape_status
-                }
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ").strip().replace("\n", " ").replace("\r", " ")
-        except Exception:
-            soup = None
-            page_text = ""
-
-    general_email = extract_email_from_text(page_text) if page_text else None
-    if (not general_email or general_email.strip() == "") and soup:
-        generic_email = extract_generic_email(soup, response.text)
-        if generic_email:
-            general_email = generic_email
+            page = budget.fetch(session, url)
+        except Exception as e:
+            print(f"Skipped {url}: {e}")
+            continue
+        if page.http_error:
+            continue
+        visited.append(page)
+        collect(page)
+        push((score, link) for link, score in _link_scores(page, website, keywords).items())
+
+    # The homepage is the fallback when no subpage named anyone
+    if not direct_contacts:
+        collect(home)
+
+    general_email = None
+    for page in visited + [home]:
+        general_email = extract_email_from_text(_page_text(page.soup))
+        if general_email:
+            break
+    if not general_email:
+        general_email = extract_generic_email(home.soup, home.html)
+
+    result = _site_result(website, direct_contacts, general_email, "Success")
+    session.store_result(website, matched_roles, result)
+    return result
 
-    result = {
-        "business_email": general_email or "",
+def _site_result(website, direct_contacts, business_email, scrape_status):
+    # Contacts are listed once each, in the order they were found
+    direct_contacts = list(dict.fromkeys(direct_contacts))
+    return {
+        "business_email": business_email or "",
         "direct_contacts": ", ".join(direct_contacts) if direct_contacts else "No direct contact found",
         "website": website,
         "scrape_status": scrape_status
     }
 
-    return result
-
 TARGET_SUBPAGE_KEYWORDS = ["about", "team", "staff", "doctors", "leadership", "providers", "who-we-are", "our-people"]
-
-def crawl_priority_links(home_url):
+MAX_SUBPAGES = 5           # best-scoring subpages fetched per site
+MAX_SITEMAP_FETCHES = 4    # robots.txt-listed sitemaps, /sitemap.xml and child sitemaps of an index
+SKIP_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".doc", ".docx", ".mp4", ".xml", ".gz")
+SITEMAP_LOC_RE = re.compile(r"<loc>\s*(?:<!\[CDATA\[)?\s*(.*?)\s*(?:\]\]>)?\s*</loc>", re.IGNORECASE | re.DOTALL)
+
+def score_subpage(url, keywords, text=""):
+    # Keyword score of a candidate page: earlier keywords in the list weigh more, and every extra path
+    # level costs a point so /team beats /blog/2021/05/team-outing. 0 = not a candidate.
+    path = urlparse(url).path.lower()
+    if not path.strip("/") or path.endswith(SKIP_EXTENSIONS):
+        return 0
+    words = re.sub(r"[^a-z0-9]+", "-", f"{path} {text.lower()}")
+    score = sum(len(keywords) - rank for rank, keyword in enumerate(keywords) if keyword in words)
+    return max(score - path.strip("/").count("/"), 1) if score else 0
+
+def _same_site(url, home_url):
+    return canonical_site(url).split("/")[0] == canonical_site(home_url).split("/")[0]
+
+def _sitemap_urls(home_url, session, budget=None):
+    # Page URLs listed in the site's sitemaps: the ones robots.txt names, else /sitemap.xml.
+    # Sitemap indexes are followed, page-like child sitemaps first, up to MAX_SITEMAP_FETCHES in all
+    # and while the site's budget (if any) allows.
+    get = (lambda url: budget.fetch(session, url)) if budget else session.get
+    allows = budget.allows if budget else lambda: True
+    queue = []
+    try:
+        robots = get(urljoin(home_url, "/robots.txt"))
+        if robots.status_code == 200:
+            queue = [line.split(":", 1)[1].strip() for line in robots.html.splitlines()
+                     if line.lower().startswith("sitemap:")]
+    except Exception:
+        pass
+    queue = queue or [urljoin(home_url, "/sitemap.xml")]
+    urls, fetched, seen = [], 0, set()
+    while queue and fetched < MAX_SITEMAP_FETCHES and allows():
+        sitemap = queue.pop(0)
+        # Compressed sitemaps are skipped rather than decoded
+        if sitemap in seen or sitemap.lower().endswith(".gz") or not _same_site(sitemap, home_url):
+            continue
+        seen.add(sitemap)
+        fetched += 1
+        try:
+            page = get(sitemap)
+        except Exception:
+            continue
+        if page.status_code != 200:
+            continue
+        locs = [loc.replace("&amp;", "&") for loc in SITEMAP_LOC_RE.findall(page.html)]
+        if "<sitemapindex" in page.html[:2000].lower():
+            # Posts, products and tags rarely hold the team
+            queue.extend(sorted(locs, key=lambda loc: any(k in loc.lower() for k in ("post", "product", "tag", "categor"))))
+        else:
+            urls.extend(locs)
+    return urls
+
+def _link_scores(page, home_url, keywords, scores=None):
+    # {url: score} for the page's same-site links that look like subpages worth a visit
+    scores = {} if scores is None else scores
+    for a in page.soup.find_all("a", href=True):
+        _consider(scores, urljoin(page.url, a["href"]), home_url, keywords, a.get_text(" ", strip=True))
+    return scores
+
+def _consider(scores, url, home_url, keywords, text=""):
+    url = url.split("#")[0]
+    if not url.startswith("http") or not _same_site(url, home_url) or canonical_site(url) == canonical_site(home_url):
+        return
+    score = score_subpage(url, keywords, text)
+    if score > scores.get(url, 0):
+        scores[url] = score
+
+def discover_subpages(home_url, session, keywords=None, limit=MAX_SUBPAGES, budget=None):
+    # [(score, url)] of the site's likely team/about/contact pages, best first: links on the homepage,
+    # plus the sitemaps (via robots.txt) when the homepage does not link to `limit` candidates itself.
+    # With a SiteBudget, every fetch counts against it and sitemaps are only read while it allows.
+    keywords = [k.lower() for k in (keywords or TARGET_SUBPAGE_KEYWORDS)]
+    page = budget.fetch(session, home_url) if budget else session.get(home_url)
+    page.raise_for_status()
+    scores = _link_scores(page, home_url, keywords)
+    if len(scores) < limit and (budget is None or budget.allows()):
+        for url in _sitemap_urls(home_url, session, budget):
+            _consider(scores, url, home_url, keywords)
+    ranked = sorted(((score, url) for url, score in scores.items()), key=lambda item: (-item[0], len(item[1])))
+    return ranked[:limit]
+
+def crawl_priority_links(home_url, session=None, keywords=None, limit=MAX_SUBPAGES):
+    # The top `limit` subpages to look for contacts on (see discover_subpages)
     home_url = clean_url(home_url)
     if not home_url or home_url.lower().strip() == "nan":
         return []
+    session = session or FetchSession()
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:112.0) Gecko/20100101 Firefox/112.0",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Connection": "keep-alive"
-        }
-        scraper = cloudscraper.create_scraper()
-        try:
-            response = scraper.get(home_url, timeout=10, headers=headers)
-        except requests.exceptions.SSLError:
-            print(f"SSL Verification Failed for {home_url}")
-            return []
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        links = [a['href'] for a in soup.find_all("a", href=True)]
-        internal_links = [
-            urljoin(home_url, l) for l in links
-            if any(k in l.lower() for k in TARGET_SUBPAGE_KEYWORDS) and l.startswith("/")
-        ]
-
-        return list(set(internal_links))
+        return [url for _, url in discover_subpages(home_url, session, keywords, limit)]
+    except requests.exceptions.SSLError:
+        print(f"SSL Verification Failed for {home_url}")
+        return []
     except Exception as e:
         print(f"Error crawling {home_url}: {e}")
         return []
 
 def extract_from_jsonld(html):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, HTML_PARSER)
     people = []
     for script in soup.find_all("script", type="application/ld+json"):
         try:
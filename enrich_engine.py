@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, zip_longest
+from urllib.parse import urlparse
+
+from enrich import FetchSession, scrape_contact_info_from_site, clean_url
+from roles import matcher_for_business
+
+MAX_CONCURRENT_SITES = 16   # global cap on sites being crawled at once
+PER_HOST_LIMIT = 1          # concurrent crawls allowed against one host
+HOST_MIN_INTERVAL = 1.0     # seconds between starting two crawls of the same host
+def host_of(website):
+    url = clean_url(website)
+    return urlparse(url).netloc.lower() if url else ""
+
+class HostThrottle:
+    # Per-host politeness: at most `per_host` crawls in flight and a minimum gap between starts
+
+    def __init__(self, per_host=PER_HOST_LIMIT, min_interval=HOST_MIN_INTERVAL):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._active = {}
+        self._last_start = {}
+
+    def acquire(self, host):
+        with self._cond:
+            while True:
+                active = self._active.get(host, 0)
+                wait = self._last_start.get(host, float("-inf")) + self.min_interval - time.monotonic()
+                if active < self.per_host and wait <= 0:
+                    break
+                self._cond.wait(timeout=wait if active < self.per_host else None)
+            self._active[host] = active + 1
+            self._last_start[host] = time.monotonic()
+
+    def release(self, host):
+        with self._cond:
+            self._active[host] -= 1
+            self._cond.notify_all()
+
+def _interleave_by_host(positions, hosts):
+    # Round-robin across hosts so workers don't queue up behind one multi-location chain
+    buckets = {}
+    for position in positions:
+        buckets.setdefault(hosts[position], []).append(position)
+    return [p for p in chain.from_iterable(zip_longest(*buckets.values())) if p is not None]
+
+def enrich_many(rows, role_config, positions=None, max_workers=MAX_CONCURRENT_SITES, throttle=None, session=None):
+    # rows: list of dicts with "Website" and "Business Name". Yields (position, contact_info)
+    # as each site finishes; callers reassemble input order from the position.
+    throttle = throttle or HostThrottle()
+    session = session or FetchSession()
+    positions = list(range(len(rows))) if positions is None else list(positions)
+    hosts = {p: host_of(rows[p].get("Website", "")) for p in positions}
+    subpage_keywords = role_config.get("subpage_keywords")
+
+    def work(position):
+        row = rows[position]
+        # Compiled once per industry and shared by every site in the run
+        matched_roles = matcher_for_business(row.get("Business Name", ""), role_config)
+        host = hosts[position]
+        # Sites enriched within the cache's TTL need no request, so they skip the host throttle too
+        cached = session.cached_result(row.get("Website", ""), matched_roles)
+        if cached is not None:
+            return cached
+        if not host:
+            return scrape_contact_info_from_site(row.get("Website", ""), matched_roles, session, subpage_keywords)
+        throttle.acquire(host)
+        try:
+            return scrape_contact_info_from_site(row.get("Website", ""), matched_roles, session, subpage_keywords)
+        finally:
+            throttle.release(host)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(work, p): p for p in _interleave_by_host(positions, hosts)}
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                yield position, future.result()
+            except Exception as e:
+                print(f"Enrichment failed for row {position}: {e}")
+                yield position, {
+                    "business_email": "",
+                    "direct_contacts": "No direct contact found",
+                    "website": rows[position].get("Website", ""),
+                    "scrape_status": "Error"
+                }
+    finally:
+        # If the caller stops early (e.g. a Streamlit rerun), drop queued sites instead of waiting on them
+        executor.shutdown(wait=False, cancel_futures=True)
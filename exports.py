@@ -0,0 +1,128 @@
+import contextlib
+import gzip
+import importlib.util
+import io
+import itertools
+import os
+import tempfile
+
+import pandas as pd
+
+# Lead exports, built only when someone asks for one. Rows come in as an iterable of DataFrame chunks
+# (LeadStore.iter_frames, or [df] for a frame already in memory) and are written chunk by chunk, so an
+# export of the whole history needs memory for one chunk, not for the file.
+
+FORMATS = {
+    "csv": {"label": "CSV", "extension": ".csv", "mime": "text/csv", "requires": None},
+    "csv.gz": {"label": "CSV (gzip)", "extension": ".csv.gz", "mime": "application/gzip", "requires": None},
+    "parquet": {"label": "Parquet", "extension": ".parquet", "mime": "application/vnd.apache.parquet", "requires": "pyarrow"},
+    "xlsx": {
+        "label": "Excel (XLSX)", "extension": ".xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "requires": "openpyxl"
+    }
+}
+XLSX_SHEET_ROWS = 1048575  # data rows per worksheet (Excel's limit, less the header); longer exports get more sheets
+
+def available_formats():
+    # Parquet and XLSX are offered only when their writer is installed
+    return [fmt for fmt, spec in FORMATS.items() if not spec["requires"] or importlib.util.find_spec(spec["requires"])]
+
+def export_name(name, fmt):
+    # "leads_dentist.csv" -> "leads_dentist.parquet"
+    stem = name[:-len(".csv")] if name.endswith(".csv") else name
+    return stem + FORMATS[fmt]["extension"]
+
+def _write_csv(frames, f, columns, compress=False):
+    with contextlib.ExitStack() as stack:
+        raw = stack.enter_context(open(f, "wb")) if isinstance(f, str) else f
+        if compress:
+            raw = stack.enter_context(gzip.GzipFile(fileobj=raw, mode="wb"))
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        try:
+            rows, header = 0, True
+            for frame in frames:
+                frame.to_csv(text, index=False, header=header)
+                header = False
+                rows += len(frame)
+            if header:
+                pd.DataFrame(columns=columns).to_csv(text, index=False)
+        finally:
+            # Leave closing `raw` to the stack (and a caller's file object to the caller)
+            text.flush()
+            text.detach()
+    return rows
+
+def _write_parquet(frames, path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Every column is text, so each chunk becomes one row group with the same schema
+    schema = pa.schema([(str(c), pa.string()) for c in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame.reindex(columns=columns).astype("string"), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(frame)
+    return rows
+
+def _write_xlsx(frames, path, columns):
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, rows = None, XLSX_SHEET_ROWS, 0
+    for frame in frames:
+        frame = frame.reindex(columns=columns)
+        # Control characters scraped from websites are not allowed in worksheet cells
+        frame = frame.astype(object).where(frame.notna(), None).map(
+            lambda v: ILLEGAL_CHARACTERS_RE.sub("", v) if isinstance(v, str) else v)
+        for values in frame.itertuples(index=False, name=None):
+            if sheet_rows == XLSX_SHEET_ROWS:
+                sheet = workbook.create_sheet(f"Leads {len(workbook.worksheets) + 1}" if workbook.worksheets else "Leads")
+                sheet.append(list(columns))
+                sheet_rows = 0
+            sheet.append(list(values))
+            sheet_rows += 1
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet("Leads").append(list(columns))
+    workbook.save(path)
+    return rows
+
+def write_export(frames, f, fmt="csv", columns=None):
+    # Writes the chunks to a path or binary file object; returns the number of rows written.
+    # columns: the header to use when there are no rows (default: the first chunk's columns).
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt not in available_formats():
+        raise ValueError(f"{FORMATS[fmt]['label']} exports need the {FORMATS[fmt]['requires']} package")
+    frames = iter(frames)
+    first = next(frames, None)
+    if columns is None:
+        columns = list(first.columns) if first is not None else []
+    frames = itertools.chain([first] if first is not None else [], frames)
+    if fmt in ("csv", "csv.gz"):
+        return _write_csv(frames, f, columns, compress=fmt == "csv.gz")
+    if fmt == "parquet":
+        return _write_parquet(frames, f, columns)
+    return _write_xlsx(frames, f, columns)
+
+def export_file(frames, fmt="csv", columns=None):
+    # The export in an anonymous temporary file, rewound for reading; it is deleted once closed.
+    # This is what download buttons get: Streamlit calls it only when the button is clicked.
+    f = tempfile.TemporaryFile()
+    write_export(frames, f, fmt, columns)
+    f.seek(0)
+    return f
+
+def export_path(frames, path, fmt=None, columns=None):
+    # Export to a file path, the format taken from its extension unless given
+    if fmt is None:
+        by_extension = sorted(FORMATS, key=lambda name: -len(FORMATS[name]["extension"]))
+        fmt = next((name for name in by_extension if path.endswith(FORMATS[name]["extension"])), "csv")
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    return write_export(frames, path, fmt, columns)
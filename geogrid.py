@@ -0,0 +1,219 @@
+import asyncio
+import json
+import math
+import os
+from functools import lru_cache
+
+from search import MAX_NEARBY_RADIUS_M, run_on_loop, search_nearby_batch_async
+
+# Grid coverage mode: instead of searching "<term> in <city>" for the top cities of a state, tile the
+# state's bounding box into cells and run a Nearby Search per cell. Each cell is probed with one page: a
+# full page (the API's page size) may be hiding more places, so the cell is split into four and searched
+# again; cells with room to spare are done. Cells that do not touch the state's outline (lakes, sea,
+# neighbouring states inside the box) are never searched. Results are merged by place_id, so overlapping
+# circles cost nothing extra. It stays opt-in (--grid, the Grid Coverage checkbox) for filling the gaps
+# between cities; check_grid.py compares its new places per call with the top-cities search.
+
+STATE_BOUNDS_FILE = "state_bounds.json"
+# Outlines dissolved from the US Census county boundaries and simplified to ~0.5 km
+STATE_SHAPES_FILE = "state_shapes.json"
+KM_PER_DEG_LAT = 111.32
+INITIAL_CELL_KM = 70  # circumscribed radius ~49.5 km, inside Nearby Search's 50 km limit
+MIN_CELL_KM = 2       # saturated cells this small are not split any further
+PAGE_SIZE = 20
+SHAPE_MARGIN_DEG = 0.02  # cells this close to a state's outline still count as touching it
+OUTLINE_TILE_DEG = 0.25
+
+@lru_cache(maxsize=1)
+def load_state_bounds(path=STATE_BOUNDS_FILE):
+    # {state: {"south", "west", "north", "east"}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+@lru_cache(maxsize=1)
+def load_state_shapes(path=STATE_SHAPES_FILE):
+    # {state: [ring, ...]}, each ring a closed list of [lng, lat]; islands are rings of their own
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def state_cell(state, path=STATE_BOUNDS_FILE):
+    bounds = load_state_bounds(path).get(state)
+    if bounds is None:
+        raise ValueError(f"No bounding box for {state} in {path}")
+    return (bounds["south"], bounds["west"], bounds["north"], bounds["east"])
+
+def cell_size_km(cell):
+    # (height, width) of a (south, west, north, east) cell, width measured at its middle latitude
+    south, west, north, east = cell
+    mid_lat = math.radians((south + north) / 2)
+    return (north - south) * KM_PER_DEG_LAT, (east - west) * KM_PER_DEG_LAT * math.cos(mid_lat)
+
+def tile(cell, cell_km=INITIAL_CELL_KM):
+    # Splits a cell into a grid of cells at most cell_km on a side
+    south, west, north, east = cell
+    height, width = cell_size_km(cell)
+    rows = max(1, math.ceil(height / cell_km))
+    cols = max(1, math.ceil(width / cell_km))
+    lat_step = (north - south) / rows
+    lng_step = (east - west) / cols
+    return [
+        (south + r * lat_step, west + c * lng_step, south + (r + 1) * lat_step, west + (c + 1) * lng_step)
+        for r in range(rows) for c in range(cols)
+    ]
+
+def split(cell):
+    south, west, north, east = cell
+    mid_lat, mid_lng = (south + north) / 2, (west + east) / 2
+    return [
+        (south, west, mid_lat, mid_lng), (south, mid_lng, mid_lat, east),
+        (mid_lat, west, north, mid_lng), (mid_lat, mid_lng, north, east)
+    ]
+
+def cell_circle(cell):
+    # Center and radius (m) of the circle through the cell's corners, so the search covers all of it
+    south, west, north, east = cell
+    height, width = cell_size_km(cell)
+    radius_m = math.hypot(height, width) / 2 * 1000
+    return (south + north) / 2, (west + east) / 2, min(radius_m, MAX_NEARBY_RADIUS_M)
+
+def cell_key(cell):
+    # Stands in for the city in search cache keys
+    return "grid:" + ",".join(f"{v:.5f}" for v in cell)
+
+def contains(cell, result):
+    location = (result.get("geometry") or {}).get("location") or {}
+    if "lat" not in location or "lng" not in location:
+        return True
+    south, west, north, east = cell
+    return south <= location["lat"] <= north and west <= location["lng"] <= east
+
+def _crosses(segment, box):
+    # Whether a segment passes through a (south, west, north, east) box (Liang-Barsky clipping)
+    (x1, y1), (x2, y2) = segment
+    south, west, north, east = box
+    t0, t1 = 0.0, 1.0
+    for p, q in [(x1 - x2, x1 - west), (x2 - x1, east - x1), (y1 - y2, y1 - south), (y2 - y1, north - y1)]:
+        if p == 0:
+            if q < 0:
+                return False
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+        if t0 > t1:
+            return False
+    return True
+
+@lru_cache(maxsize=None)
+def state_outline(state):
+    # The edges of the state's rings bucketed by OUTLINE_TILE_DEG tiles: {row: {col: [edge, ...]}}, so a
+    # cell only looks at the edges near it. Empty for a state without a shape.
+    outline = {}
+    for ring in load_state_shapes().get(state, []):
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            edge = ((x1, y1), (x2, y2))
+            for row in range(math.floor(min(y1, y2) / OUTLINE_TILE_DEG), math.floor(max(y1, y2) / OUTLINE_TILE_DEG) + 1):
+                cols = outline.setdefault(row, {})
+                for col in range(math.floor(min(x1, x2) / OUTLINE_TILE_DEG), math.floor(max(x1, x2) / OUTLINE_TILE_DEG) + 1):
+                    cols.setdefault(col, []).append(edge)
+    return outline
+
+def _inside(outline, lat, lng):
+    # Even-odd rule along a ray east of the point, over the edges in its row of tiles: islands count,
+    # lakes inside a ring do not
+    col = math.floor(lng / OUTLINE_TILE_DEG)
+    edges = {edge for c, tile_edges in outline.get(math.floor(lat / OUTLINE_TILE_DEG), {}).items() if c >= col for edge in tile_edges}
+    inside = False
+    for (x1, y1), (x2, y2) in edges:
+        if (y1 > lat) != (y2 > lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+def touches_state(cell, outline, margin=SHAPE_MARGIN_DEG):
+    # Whether a cell, widened by margin, overlaps the state's outline; a state without one touches every cell
+    if not outline:
+        return True
+    box = (cell[0] - margin, cell[1] - margin, cell[2] + margin, cell[3] + margin)
+    south, west, north, east = box
+    if _inside(outline, (south + north) / 2, (west + east) / 2):
+        return True
+    # Center outside: the cell touches the state only if an edge of the outline passes through it
+    edges = set()
+    for row in range(math.floor(south / OUTLINE_TILE_DEG), math.floor(north / OUTLINE_TILE_DEG) + 1):
+        cols = outline.get(row, {})
+        for col in range(math.floor(west / OUTLINE_TILE_DEG), math.floor(east / OUTLINE_TILE_DEG) + 1):
+            edges.update(cols.get(col, ()))
+    return any(_crosses(edge, box) for edge in edges)
+
+def state_cells(state, cells):
+    outline = state_outline(state)
+    return [cell for cell in cells if touches_state(cell, outline)]
+
+def in_state(state, lat, lng):
+    outline = state_outline(state)
+    return not outline or _inside(outline, lat, lng)
+
+async def grid_search_async(term, state, api_key, search_cache, cache_term=None,
+                            cell_km=INITIAL_CELL_KM, min_cell_km=MIN_CELL_KM, max_in_flight=None):
+    # Adaptive grid search of one state. Each level of cells is searched as one concurrent batch, from the
+    # search cache where possible (cache_term: the normalized term the cache is keyed by).
+    # Returns (results unique by place_id and inside the state's box, searches made, cells searched).
+    bounds = state_cell(state)
+    cache_term = cache_term or term.lower()
+    found = {}
+    calls = 0
+    cells_searched = 0
+    level = state_cells(state, tile(bounds, cell_km))
+    while level:
+        answers = await asyncio.to_thread(lambda: {cell: search_cache.get(cache_term, cell_key(cell), state) for cell in level})
+        misses = [cell for cell in level if answers[cell] is None]
+        if misses:
+            stats = {}
+            fetched = await search_nearby_batch_async([(term, *cell_circle(cell)) for cell in misses], api_key, False, max_in_flight, stats)
+            for cell, results in zip(misses, fetched):
+                await asyncio.to_thread(search_cache.put, cache_term, cell_key(cell), state, results)
+                answers[cell] = results
+            # Every result page is a billed search
+            calls += stats.get("calls", 0)
+        cells_searched += len(level)
+
+        next_level = []
+        for cell in level:
+            results = answers[cell]
+            for result in results:
+                key = result.get("place_id") or (result.get("name"), result.get("vicinity") or result.get("formatted_address"))
+                if key not in found and contains(bounds, result):
+                    found[key] = result
+            if len(results) >= PAGE_SIZE and min(cell_size_km(cell)) > min_cell_km:
+                next_level.extend(split(cell))
+        level = state_cells(state, next_level)
+    return list(found.values()), calls, cells_searched
+
+def grid_search(term, state, api_key, search_cache, cache_term=None,
+                cell_km=INITIAL_CELL_KM, min_cell_km=MIN_CELL_KM, max_in_flight=None):
+    return run_on_loop(grid_search_async(term, state, api_key, search_cache, cache_term, cell_km, min_cell_km, max_in_flight))
+
+def grid_from_cache(term, state, search_cache, cache_term=None, cell_km=INITIAL_CELL_KM, min_cell_km=MIN_CELL_KM):
+    # Dry run of grid_search from the search cache alone: returns (place_ids the cached cells hold, cells that
+    # would still be searched). What lies under an uncached cell is unknown, so the count is a lower bound.
+    bounds = state_cell(state)
+    cache_term = cache_term or term.lower()
+    place_ids = set()
+    uncached = 0
+    level = state_cells(state, tile(bounds, cell_km))
+    while level:
+        answers = search_cache.peek_many([(cache_term, cell_key(cell), state) for cell in level])
+        next_level = []
+        for cell in level:
+            results = answers.get((cache_term, cell_key(cell), state))
+            if results is None:
+                uncached += 1
+                continue
+            place_ids.update(r["place_id"] for r in results if r.get("place_id") and contains(bounds, r))
+            if len(results) >= PAGE_SIZE and min(cell_size_km(cell)) > min_cell_km:
+                next_level.extend(split(cell))
+        level = state_cells(state, next_level)
+    return place_ids, uncached
+
@@ -0,0 +1,199 @@
+import json
+import sqlite3
+import threading
+import time
+
+from dedup import LEADS_DB
+
+# Task states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # same format as the lead store's Timestamp column
+FAILED_RESUME_DAYS = 3  # a job that finished with failed tasks is resumed this long; after that it starts over
+
+def job_key(business_type, states, depth, options):
+    # Identifies "the same search" so an interrupted run is resumed instead of started over
+    return json.dumps({
+        "term": business_type.strip().lower(),
+        "states": list(states),
+        "depth": depth,
+        "options": options
+    }, sort_keys=True)
+
+class JobStore:
+    # Persisted search jobs: one row per job, one row per (term, city, state) task with its state.
+    # Tasks left "running" by a process that died are picked up again on resume.
+
+    def __init__(self, path=LEADS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS search_jobs (
+                id INTEGER PRIMARY KEY,
+                job_key TEXT NOT NULL,
+                business_type TEXT NOT NULL,
+                states TEXT NOT NULL,
+                options TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_search_jobs_key ON search_jobs (job_key, status);
+            CREATE TABLE IF NOT EXISTS search_tasks (
+                id INTEGER PRIMARY KEY,
+                job_id INTEGER NOT NULL REFERENCES search_jobs (id),
+                term TEXT NOT NULL,
+                city TEXT NOT NULL,
+                state TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result_count INTEGER,
+                new_count INTEGER,
+                api_calls INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (job_id, term, city, state)
+            );
+            CREATE INDEX IF NOT EXISTS idx_search_tasks_job ON search_tasks (job_id, status);
+        """)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cur
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def create_job(self, business_type, states, depth, options, tasks):
+        # tasks: list of (term, city, state) in the order they should run
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Rows are grouped by timestamp, so two runs of a search never share one
+                last = self._conn.execute(
+                    "SELECT MAX(timestamp) FROM search_jobs WHERE business_type = ?", (business_type,)
+                ).fetchone()[0]
+                timestamp = time.strftime(TIMESTAMP_FORMAT, time.localtime(now))
+                if last and last >= timestamp:
+                    bumped = time.mktime(time.strptime(last, TIMESTAMP_FORMAT)) + 1
+                    timestamp = time.strftime(TIMESTAMP_FORMAT, time.localtime(bumped))
+                cur = self._conn.execute(
+                    "INSERT INTO search_jobs (job_key, business_type, states, options, timestamp, status, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_key(business_type, states, depth, options), business_type, json.dumps(list(states)),
+                     json.dumps(options), timestamp, PENDING, now)
+                )
+                job_id = cur.lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO search_tasks (job_id, term, city, state, status, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(job_id, term, city, state, PENDING, now) for term, city, state in tasks]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.job(job_id)
+
+    def _job_from_row(self, row):
+        job_id, business_type, states, options, timestamp, status = row
+        return {
+            "id": job_id,
+            "business_type": business_type,
+            "states": json.loads(states),
+            "options": json.loads(options),
+            "timestamp": timestamp,
+            "status": status
+        }
+
+    def job(self, job_id):
+        rows = self._query(
+            "SELECT id, business_type, states, options, timestamp, status FROM search_jobs WHERE id = ?", (job_id,)
+        )
+        return self._job_from_row(rows[0]) if rows else None
+
+    def find_unfinished(self, business_type, states, depth, options, failed_resume_days=FAILED_RESUME_DAYS):
+        # Latest job of the same search a run was interrupted in, or that failed recently enough to retry
+        rows = self._query(
+            "SELECT id, business_type, states, options, timestamp, status FROM search_jobs"
+            " WHERE job_key = ? AND status != ? AND (status != ? OR updated_at >= ?) ORDER BY id DESC LIMIT 1",
+            (job_key(business_type, states, depth, options), DONE, FAILED, time.time() - failed_resume_days * 86400)
+        )
+        return self._job_from_row(rows[0]) if rows else None
+
+    def unfinished_jobs(self, failed_resume_days=FAILED_RESUME_DAYS):
+        # Every job find_unfinished would resume
+        rows = self._query(
+            "SELECT id, business_type, states, options, timestamp, status FROM search_jobs"
+            " WHERE status != ? AND (status != ? OR updated_at >= ?) ORDER BY id",
+            (DONE, FAILED, time.time() - failed_resume_days * 86400)
+        )
+        return [self._job_from_row(row) for row in rows]
+
+    def start(self, job_id):
+        # Tasks a dead run left running, or that failed, go back to pending
+        now = time.time()
+        self._execute(
+            "UPDATE search_tasks SET status = ?, updated_at = ? WHERE job_id = ? AND status IN (?, ?)",
+            (PENDING, now, job_id, RUNNING, FAILED)
+        )
+        self._execute("UPDATE search_jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, now, job_id))
+
+    def pending_tasks(self, job_id, state=None):
+        sql = "SELECT id, term, city, state FROM search_tasks WHERE job_id = ? AND status = ?"
+        params = [job_id, PENDING]
+        if state is not None:
+            sql += " AND state = ?"
+            params.append(state)
+        rows = self._query(sql + " ORDER BY id", params)
+        return [{"id": task_id, "term": term, "city": city, "state": state_} for task_id, term, city, state_ in rows]
+
+    def mark_running(self, task_id):
+        self._execute(
+            "UPDATE search_tasks SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (RUNNING, time.time(), task_id)
+        )
+
+    def mark_done(self, task_id, result_count, new_count, api_calls):
+        self._execute(
+            "UPDATE search_tasks SET status = ?, result_count = ?, new_count = ?, api_calls = ?, error = NULL,"
+            " updated_at = ? WHERE id = ?",
+            (DONE, result_count, new_count, api_calls, time.time(), task_id)
+        )
+
+    def mark_failed(self, task_id, error):
+        self._execute(
+            "UPDATE search_tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (FAILED, str(error), time.time(), task_id)
+        )
+
+    def progress(self, job_id):
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, count in self._query(
+            "SELECT status, COUNT(*) FROM search_tasks WHERE job_id = ? GROUP BY status", (job_id,)
+        ):
+            counts[status] = count
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def finish(self, job_id):
+        # A job is done once every task is; otherwise it stays resumable
+        progress = self.progress(job_id)
+        status = DONE if progress[DONE] == progress["total"] else FAILED
+        self._execute("UPDATE search_jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+        return status
@@ -0,0 +1,368 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from dedup import DIGEST_SCHEME, KEY_COLUMNS, LEADS_DB, lead_digests
+
+# CSV column -> table column; CSV names are what the UI and exports use
+COLUMNS = {
+    "Business Name": "business_name",
+    "Phone": "phone",
+    "Website": "website",
+    "Address": "address",
+    "Status": "status",
+    "Search Term": "search_term",
+    "Search State(s)": "search_state",
+    "Timestamp": "timestamp"
+}
+ARCHIVE_COLUMNS = [c for c in COLUMNS if c != "Status"]
+EXPORT_CHUNK_ROWS = 5000
+QUERY_CACHE_SIZE = 256  # query results kept per store until the next write
+SESSION_COLUMNS = [
+    "id", "search_term", "search_state", "timestamp", "job_id", "lead_count", "new_count",
+    "text_search_calls", "details_calls", "started_at", "finished_at", "params"
+]
+# Recounts one session's rows; runs in the write that appends them (the session_id index keeps it per-session)
+_SESSION_COUNTS_SQL = (
+    "UPDATE search_sessions SET"
+    " lead_count = (SELECT COUNT(*) FROM search_results WHERE session_id = search_sessions.id),"
+    " new_count = (SELECT COUNT(*) FROM search_results WHERE session_id = search_sessions.id AND status = 'New')"
+    " WHERE id = ?"
+)
+
+class LeadStore:
+    # Append-only SQLite store: `leads` is the deduplicated archive, `search_results` logs every search row
+
+    def __init__(self, path=LEADS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode so writes can take an explicit BEGIN IMMEDIATE lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS leads (
+                id INTEGER PRIMARY KEY,
+                digest INTEGER NOT NULL UNIQUE,
+                business_name TEXT, phone TEXT, website TEXT, address TEXT,
+                search_term TEXT, search_state TEXT, timestamp TEXT
+            );
+            CREATE TABLE IF NOT EXISTS search_results (
+                id INTEGER PRIMARY KEY,
+                digest INTEGER NOT NULL,
+                business_name TEXT, phone TEXT, website TEXT, address TEXT, status TEXT,
+                search_term TEXT, search_state TEXT, timestamp TEXT,
+                session_id INTEGER REFERENCES search_sessions (id),
+                UNIQUE (search_term, search_state, timestamp, digest)
+            );
+            CREATE TABLE IF NOT EXISTS search_sessions (
+                id INTEGER PRIMARY KEY,
+                search_term TEXT NOT NULL,
+                search_state TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                job_id INTEGER,
+                params TEXT,
+                lead_count INTEGER NOT NULL DEFAULT 0,
+                new_count INTEGER NOT NULL DEFAULT 0,
+                text_search_calls INTEGER NOT NULL DEFAULT 0,
+                details_calls INTEGER NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                UNIQUE (search_term, search_state, timestamp)
+            );
+            CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        # Stores created before search sessions existed get the link column added in place
+        if "session_id" not in [row[1] for row in self._conn.execute("PRAGMA table_info(search_results)")]:
+            self._conn.execute("ALTER TABLE search_results ADD COLUMN session_id INTEGER REFERENCES search_sessions (id)")
+        self._conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_search_results_state ON search_results (search_state, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_search_results_term ON search_results (search_term, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_search_results_timestamp ON search_results (timestamp);
+            CREATE INDEX IF NOT EXISTS idx_search_results_session ON search_results (session_id);
+        """)
+        scheme = self._conn.execute("SELECT value FROM store_meta WHERE name = 'digest_scheme'").fetchone()
+        if scheme is None or scheme[0] != DIGEST_SCHEME:
+            self._rehash()
+        self._cache = OrderedDict()
+        self._cache_version = None
+        self._cache_lock = threading.Lock()
+
+    def _write(self, statements):
+        # statements: list of (sql, rows); all applied in one transaction, returns rows changed
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    self._conn.executemany(sql, rows)
+                changed = self._conn.total_changes - before
+                if changed:
+                    # Bumped in the same transaction, so readers in any process see a new version with the new rows
+                    self._conn.execute(
+                        "INSERT INTO store_meta (name, value) VALUES ('write_version', 1)"
+                        " ON CONFLICT (name) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return changed
+
+    def _rehash(self):
+        # Stores written with an older digest scheme get their digests recomputed from the key columns, once
+        statements = []
+        for table in ["leads", "search_results"]:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT id, business_name, phone, website FROM {table}").fetchall()
+            keys = pd.DataFrame([row[1:] for row in rows], columns=KEY_COLUMNS)
+            statements.append((
+                f"UPDATE {table} SET digest = ? WHERE id = ?",
+                [(digest, row[0]) for digest, row in zip(lead_digests(keys), rows)]
+            ))
+        statements.append(("INSERT OR REPLACE INTO store_meta (name, value) VALUES ('digest_scheme', ?)", [(DIGEST_SCHEME,)]))
+        self._write(statements)
+
+    def _rows(self, df, columns):
+        frame = df.reindex(columns=columns)
+        frame = frame.astype(object).where(frame.notna(), None)
+        return [(digest, *values) for digest, values in zip(lead_digests(df), frame.itertuples(index=False, name=None))]
+
+    def _insert_sql(self, table, columns, extra=()):
+        names = ", ".join(["digest"] + [COLUMNS[c] for c in columns] + list(extra))
+        marks = ", ".join("?" * (len(columns) + len(extra) + 1))
+        return f"INSERT OR IGNORE INTO {table} ({names}) VALUES ({marks})"
+
+    def append_archive(self, df):
+        # Leads whose normalized key is already archived are ignored by the unique constraint
+        if df.empty:
+            return 0
+        return self._write([(self._insert_sql("leads", ARCHIVE_COLUMNS), self._rows(df, ARCHIVE_COLUMNS))])
+
+    def append_results(self, df, session_id=None):
+        # session_id links the rows to their search session, whose counts are refreshed in the same transaction
+        if df.empty:
+            return 0
+        columns = list(COLUMNS)
+        if session_id is None:
+            return self._write([(self._insert_sql("search_results", columns), self._rows(df, columns))])
+        rows = [row + (session_id,) for row in self._rows(df, columns)]
+        return self._write([
+            (self._insert_sql("search_results", columns, ["session_id"]), rows),
+            (_SESSION_COUNTS_SQL, [(session_id,)])
+        ])
+
+    # ---------------- Search sessions ----------------
+    # One row per (search term, state) of a search run, with its parameters, counts and timing. Result rows
+    # point at their session, so listing, previewing and deleting a session never scan the whole history.
+
+    def open_session(self, term, state, timestamp, job_id=None, params=None):
+        # Returns the session of this run and state, creating it on first use (a resumed job reuses it)
+        self._write([(
+            "INSERT OR IGNORE INTO search_sessions (search_term, search_state, timestamp, job_id, params, started_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(term, state, timestamp, job_id, json.dumps(params) if params is not None else None, time.time())]
+        )])
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id FROM search_sessions WHERE search_term = ? AND search_state = ? AND timestamp = ?",
+                (term, state, timestamp)
+            ).fetchone()[0]
+
+    def finish_session(self, session_id, text_search_calls=0, details_calls=0):
+        # Calls add up over the runs of a resumed job; finished_at is the last time the session completed
+        return self._write([(
+            "UPDATE search_sessions SET text_search_calls = text_search_calls + ?, details_calls = details_calls + ?,"
+            " finished_at = ? WHERE id = ?",
+            [(text_search_calls, details_calls, time.time(), session_id)]
+        )])
+
+    def build_sessions(self):
+        # Links rows logged without a session (imported CSVs, older stores) to one session per term, state
+        # and minute: the app used to stamp every city of a run separately, so the minute is the best guess
+        # at a run. A single indexed lookup once everything is linked.
+        with self._lock:
+            unlinked = self._conn.execute(
+                "SELECT 1 FROM search_results WHERE session_id IS NULL"
+                " AND search_term IS NOT NULL AND search_state IS NOT NULL AND timestamp IS NOT NULL LIMIT 1"
+            ).fetchone()
+        if not unlinked:
+            return 0
+        return self._write([
+            ("INSERT OR IGNORE INTO search_sessions (search_term, search_state, timestamp)"
+             " SELECT search_term, search_state, MIN(timestamp) FROM search_results"
+             " WHERE session_id IS NULL AND search_term IS NOT NULL AND search_state IS NOT NULL AND timestamp IS NOT NULL"
+             " GROUP BY search_term, search_state, substr(timestamp, 1, 16)", [()]),
+            ("UPDATE search_results SET session_id = (SELECT s.id FROM search_sessions s"
+             " WHERE s.search_term = search_results.search_term AND s.search_state = search_results.search_state"
+             " AND s.job_id IS NULL AND substr(s.timestamp, 1, 16) = substr(search_results.timestamp, 1, 16)"
+             " ORDER BY s.timestamp LIMIT 1)"
+             " WHERE session_id IS NULL", [()]),
+            ("UPDATE search_sessions SET"
+             " lead_count = (SELECT COUNT(*) FROM search_results r WHERE r.session_id = search_sessions.id),"
+             " new_count = (SELECT COUNT(*) FROM search_results r WHERE r.session_id = search_sessions.id AND r.status = 'New')"
+             " WHERE job_id IS NULL", [()])
+        ])
+
+    def delete_session(self, session_id):
+        # Removes the session and its rows; the deduplicated archive keeps its leads
+        return self._write([
+            ("DELETE FROM search_results WHERE session_id = ?", [(session_id,)]),
+            ("DELETE FROM search_sessions WHERE id = ?", [(session_id,)])
+        ])
+
+    def _read(self, sql, params=(), columns=None):
+        with self._lock:
+            frame = pd.read_sql_query(sql, self._conn, params=params)
+        frame = frame.rename(columns={v: k for k, v in COLUMNS.items()})
+        return frame[columns] if columns else frame
+
+    def archive_frame(self):
+        return self._read(f"SELECT {', '.join(COLUMNS[c] for c in ARCHIVE_COLUMNS)} FROM leads ORDER BY id", columns=ARCHIVE_COLUMNS)
+
+    def results_frame(self):
+        return self._read(f"SELECT {', '.join(COLUMNS.values())} FROM search_results ORDER BY id", columns=list(COLUMNS))
+
+    # ---------------- Queries for the Lead Database page ----------------
+    # Filters run against the indexes, pages are read by id (keyset) and every result is cached until
+    # the store's write version changes, so reruns and page flips never re-read the whole history.
+
+    def write_version(self):
+        with self._lock:
+            row = self._conn.execute("SELECT CAST(value AS INTEGER) FROM store_meta WHERE name = 'write_version'").fetchone()
+        return row[0] if row else 0
+
+    def _cached(self, key, compute):
+        version = self.write_version()
+        with self._cache_lock:
+            if version != self._cache_version:
+                self._cache.clear()
+                self._cache_version = version
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = compute()
+        with self._cache_lock:
+            if version == self._cache_version:
+                self._cache[key] = value
+                while len(self._cache) > QUERY_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return value
+
+    def _filter_sql(self, states=None, terms=None, since=None, until=None):
+        # since/until: "YYYY-MM-DD[ HH:MM:SS]" bounds on the Timestamp column, until exclusive
+        clauses, params = [], []
+        for column, values in (("search_state", states), ("search_term", terms)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def filter_values(self):
+        # Distinct states and terms for the filter controls
+        def compute():
+            with self._lock:
+                states = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT search_state FROM search_results WHERE search_state IS NOT NULL ORDER BY search_state")]
+                terms = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT search_term FROM search_results WHERE search_term IS NOT NULL ORDER BY search_term")]
+            return states, terms
+        return self._cached(("filter_values",), compute)
+
+    def count_results(self, states=None, terms=None, since=None, until=None):
+        where, params = self._filter_sql(states, terms, since, until)
+        def compute():
+            with self._lock:
+                return self._conn.execute(f"SELECT COUNT(*) FROM search_results{where}", params).fetchone()[0]
+        return self._cached(("count", where, tuple(params)), compute)
+
+    def results_page(self, states=None, terms=None, since=None, until=None, after_id=0, limit=10):
+        # The `limit` rows after row id `after_id`, indexed by row id; pass the last id of a page to get the next
+        where, params = self._filter_sql(states, terms, since, until)
+        where = (where + " AND" if where else " WHERE") + " id > ?"
+        sql = f"SELECT id, {', '.join(COLUMNS.values())} FROM search_results{where} ORDER BY id LIMIT ?"
+        params = params + [after_id, limit]
+        return self._cached(("page", sql, tuple(params)),
+                            lambda: self._read(sql, params).set_index("id")[list(COLUMNS)])
+
+    def count_sessions(self):
+        def compute():
+            with self._lock:
+                return self._conn.execute("SELECT COUNT(*) FROM search_sessions").fetchone()[0]
+        return self._cached(("count_sessions",), compute)
+
+    def sessions(self, limit=None, offset=0):
+        # Previous searches in term, state, time order, read from the sessions table
+        sql = (f"SELECT {', '.join(SESSION_COLUMNS)} FROM search_sessions"
+               " ORDER BY search_term, search_state, timestamp LIMIT ? OFFSET ?")
+        params = (-1 if limit is None else limit, offset)
+        def compute():
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+            return [dict(zip(SESSION_COLUMNS, row), params=json.loads(row[-1]) if row[-1] else None) for row in rows]
+        return self._cached(("sessions", params), compute)
+
+    def session_frame(self, session_id):
+        sql = f"SELECT {', '.join(COLUMNS.values())} FROM search_results WHERE session_id = ? ORDER BY id"
+        return self._cached(("session", session_id), lambda: self._read(sql, (session_id,), columns=list(COLUMNS)))
+
+    def iter_frames(self, table="search_results", session_id=None, chunk_rows=EXPORT_CHUNK_ROWS, **filters):
+        # Yields a table (optionally one session or a Lead Database filter) in id order, chunk_rows at a time.
+        # Chunks are read by id, so the lock is only held per chunk and exports never hold the whole history.
+        columns = ARCHIVE_COLUMNS if table == "leads" else list(COLUMNS)
+        where, params = self._filter_sql(**filters) if table == "search_results" else ("", [])
+        if session_id is not None:
+            where = (where + " AND" if where else " WHERE") + " session_id = ?"
+            params.append(session_id)
+        where = (where + " AND" if where else " WHERE") + " id > ?"
+        sql = f"SELECT id, {', '.join(COLUMNS[c] for c in columns)} FROM {table}{where} ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            frame = self._read(sql, params + [last_id, chunk_rows])
+            if frame.empty:
+                return
+            last_id = int(frame["id"].iloc[-1])
+            yield frame[columns]
+            if len(frame) < chunk_rows:
+                return
+
+    def import_csvs(self, archive_path="lead_archive.csv", results_path="lead_results_latest.csv"):
+        # One-shot import of the CSV files the app used to rewrite on every search
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM store_meta WHERE name = 'csv_imported'").fetchone()
+            status_fixed = self._conn.execute("SELECT value FROM store_meta WHERE name = 'archive_status_fixed'").fetchone()
+        if done:
+            if status_fixed:
+                return 0
+            # Stores imported before archive rows got their status: those are the only rows without one
+            return self._write([
+                ("UPDATE search_results SET status = 'New' WHERE status IS NULL", [()]),
+                ("UPDATE search_sessions SET"
+                 " new_count = (SELECT COUNT(*) FROM search_results r WHERE r.session_id = search_sessions.id AND r.status = 'New')"
+                 " WHERE job_id IS NULL", [()]),
+                ("INSERT OR REPLACE INTO store_meta (name, value) VALUES ('archive_status_fixed', datetime('now'))", [()])
+            ])
+        statements = []
+        if os.path.exists(archive_path):
+            archive = pd.read_csv(archive_path)
+            statements.append((self._insert_sql("leads", ARCHIVE_COLUMNS), self._rows(archive, ARCHIVE_COLUMNS)))
+            # Archive rows were "New" when first found, so they also seed the search history as "New"
+            seeded = archive.assign(Status="New")
+            statements.append((self._insert_sql("search_results", list(COLUMNS)), self._rows(seeded, list(COLUMNS))))
+        if os.path.exists(results_path):
+            results = pd.read_csv(results_path)
+            statements.append((self._insert_sql("search_results", list(COLUMNS)), self._rows(results, list(COLUMNS))))
+        statements.append(("INSERT OR REPLACE INTO store_meta (name, value) VALUES ('csv_imported', datetime('now'))", [()]))
+        statements.append(("INSERT OR REPLACE INTO store_meta (name, value) VALUES ('archive_status_fixed', datetime('now'))", [()]))
+        return self._write(statements)
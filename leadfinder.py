@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from ratelimit import TEXT_SEARCH, TEXT_SEARCH_PAGE, NEARBY_SEARCH, NEARBY_SEARCH_PAGE, DETAILS
+from sweep import (
+    TEST_MODE_DEPTH, open_meter, load_cities, open_details_cache, open_dedup_index,
+    open_lead_store, open_search_cache, open_job_store, expand_terms, dry_run, open_job, run_job
+)
+from planner import MIN_NEW_PER_CALL
+from exports import FORMATS, export_path
+from lead_store import ARCHIVE_COLUMNS, COLUMNS
+
+# Headless runner for multi-state sweeps, e.g.
+#   python -m leadfinder search --term dentist --states Ohio,Texas --depth 25
+# Uses the same search, cache, dedup and lead store code as the Lead Finder page and prints a
+# JSON run summary on stdout. Every (term, city, state) task is checkpointed in the job store: rerunning
+# the same search resumes an interrupted one; --dry-run prints the exact calls and cost the plan would
+# take instead. `export` streams the lead store to CSV, gzip CSV, Parquet or XLSX in bounded memory.
+# Exit status: 0 ok, 1 some tasks failed, 2 bad arguments.
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="leadfinder", description="Headless Lead Finder sweeps")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="Search one business type across one or more states")
+    search.add_argument("--term", required=True, help="Business type, e.g. dentist")
+    search.add_argument("--states", required=True, help="Comma-separated state names, e.g. Ohio,Texas")
+    search.add_argument("--depth", type=int, default=5, help="Top cities per state to search (default 5)")
+    search.add_argument("--offset", type=int, default=0, help="Skip this many top cities first (explore more cities)")
+    search.add_argument("--paginate", action="store_true", help="Fetch up to 3 result pages per city")
+    search.add_argument("--grid", action="store_true", help="Cover each state with an adaptive map grid instead of top cities (coverage only: about a fifth of the new leads per call)")
+    search.add_argument("--threaded", action="store_true", help="Run the searches of all states in parallel")
+    search.add_argument("--test-mode", action="store_true", help=f"{TEST_MODE_DEPTH} cities per state, no term variants")
+    search.add_argument("--min-yield", type=float, default=MIN_NEW_PER_CALL,
+                        help=f"Skip variant searches expected to add fewer new places per call (default {MIN_NEW_PER_CALL}, 0 = search all)")
+    search.add_argument("--budget", type=float, default=None, help="Most this run may spend (USD); the plan is trimmed to fit")
+    search.add_argument("--dry-run", action="store_true",
+                        help="Only resolve the plan against the caches and print the exact calls and cost; no API calls")
+    search.add_argument("--has-phone", action="store_true", help="Only keep leads with a phone number")
+    search.add_argument("--has-website", action="store_true", help="Only keep leads with a website")
+    search.add_argument("--api-key", default=None, help="Google API key (default: GOOGLE_API_KEY)")
+    search.add_argument("--new-job", action="store_true", help="Start over instead of resuming an unfinished run")
+    search.add_argument("--summary", default=None, help="Also write the run summary to this file")
+
+    commands.add_parser("jobs", help="List unfinished (resumable) search jobs")
+
+    export = commands.add_parser("export", help="Export leads from the lead store")
+    export.add_argument("--out", required=True, help="Output file; the format follows the extension (.csv, .csv.gz, .parquet, .xlsx)")
+    export.add_argument("--format", choices=list(FORMATS), default=None, help="Output format (default: from --out)")
+    export.add_argument("--archive", action="store_true", help="Export the deduplicated archive instead of every search row")
+    export.add_argument("--session", type=int, default=None, help="Only the rows of this search session")
+    export.add_argument("--states", default=None, help="Only these comma-separated states")
+    export.add_argument("--terms", default=None, help="Only these comma-separated search terms")
+    return parser.parse_args(argv)
+
+def run_search(args):
+    cities_by_state = load_cities()
+    states = [s.strip() for s in args.states.split(",") if s.strip()]
+    unknown = [s for s in states if s not in cities_by_state]
+    if unknown:
+        raise ValueError(f"Unknown state(s): {', '.join(unknown)}")
+    if args.depth < 1:
+        raise ValueError("--depth must be at least 1")
+    api_key = args.api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key and not args.dry_run:
+        raise ValueError("No API key: pass --api-key or set GOOGLE_API_KEY")
+
+    depth = TEST_MODE_DEPTH if args.test_mode else args.depth
+    terms = expand_terms(args.term, args.test_mode)
+    search_cache = open_search_cache()
+    details_cache = open_details_cache()
+    offsets = {state: args.offset for state in states}
+    plan, report = dry_run(terms, states, cities_by_state, depth, search_cache, details_cache, offsets,
+                           args.paginate, args.grid, args.min_yield, args.budget)
+    plan_summary = {key: plan[key] for key in ["terms", "dropped", "calls", "expected_new", "new_per_call", "yields", "min_yield"]}
+    if args.dry_run:
+        return {
+            "dry_run": True,
+            "term": args.term,
+            "states": states,
+            "depth": depth,
+            "plan": dict(plan_summary, tasks=[f"{term} in {city}, {state}" for term, city, state in plan["tasks"]]),
+            "predicted": report
+        }
+    # Opened only for a real run: opening the lead store imports the old CSVs and links sessions
+    dedup_index = open_dedup_index()
+    lead_store = open_lead_store()
+    job_store = open_job_store()
+    job = open_job(
+        job_store, args.term, terms, states, cities_by_state, depth, offsets,
+        paginate=args.paginate, has_phone=args.has_phone, has_website=args.has_website, grid=args.grid,
+        plan=plan, resume=not args.new_job
+    )
+    resumed_from = job_store.progress(job["id"])["done"]
+    if resumed_from:
+        print(f"Resuming job {job['id']} ({resumed_from} tasks already done)", file=sys.stderr)
+
+    summary = {
+        "job_id": job["id"],
+        "resumed_tasks": resumed_from,
+        "term": args.term,
+        "terms": terms,
+        "states": states,
+        "depth": depth,
+        "plan": plan_summary,
+        "predicted": report,
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "per_state": []
+    }
+    started = time.monotonic()
+    meter = open_meter()
+    with meter.run(f"leadfinder job {job['id']}") as api_run:
+        for result in run_job(job, job_store, api_key, search_cache, details_cache, dedup_index, lead_store,
+                              threaded=args.threaded):
+            state = result["state"]
+            print(f"{state}: {len(result['leads'])} leads, {result['failed']} failed tasks", file=sys.stderr)
+            summary["per_state"].append(state_summary(result))
+        metered = api_run.totals()
+
+    totals = {key: sum(s[key] for s in summary["per_state"]) for key in
+              ["tasks_run", "tasks_failed", "tasks_skipped", "leads", "new", "already_harvested", "text_search_calls", "nearby_search_calls", "details_calls",
+               "details_cache_hits", "api_calls"]}
+    totals["cost"] = round(metered["cost"], 4)
+    summary["totals"] = totals
+    summary["month"] = {key: round(value, 4) for key, value in meter.month_totals().items() if key in ("calls", "cost", "credit_remaining")}
+    summary["progress"] = job_store.progress(job["id"])
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    return summary
+
+def run_export(args):
+    split = lambda value: [v.strip() for v in value.split(",") if v.strip()] if value else None
+    lead_store = open_lead_store()
+    if args.archive:
+        if args.session is not None or args.states or args.terms:
+            raise ValueError("--archive cannot be combined with --session, --states or --terms")
+        frames, columns = lead_store.iter_frames("leads"), ARCHIVE_COLUMNS
+    else:
+        frames = lead_store.iter_frames(session_id=args.session, states=split(args.states), terms=split(args.terms))
+        columns = list(COLUMNS)
+    started = time.monotonic()
+    rows = export_path(frames, args.out, args.format, columns)
+    return {"out": args.out, "rows": rows, "bytes": os.path.getsize(args.out), "seconds": round(time.monotonic() - started, 3)}
+
+def state_summary(result):
+    # Metered HTTP calls for the state come from its own metering run: every result page and details
+    # lookup its tasks made, retries included, however the states interleaved
+    api = result["api"]
+    endpoint_calls = lambda endpoints: sum(api["by_endpoint"].get(e, {}).get("calls", 0) for e in endpoints)
+    return {
+        "state": result["state"],
+        "tasks_run": result["tasks"],
+        "tasks_failed": result["failed"],
+        "tasks_skipped": result["skipped"],
+        "leads": len(result["leads"]),
+        "new": len(result["new_leads"]),
+        "already_harvested": len(result["leads"]) - len(result["new_leads"]),
+        "text_search_calls": endpoint_calls([TEXT_SEARCH, TEXT_SEARCH_PAGE]),
+        "nearby_search_calls": endpoint_calls([NEARBY_SEARCH, NEARBY_SEARCH_PAGE]),
+        "details_calls": endpoint_calls([DETAILS]),
+        "details_cache_hits": result["details_hits"],
+        "api_calls": api["calls"],
+        "cost": round(api["cost"], 4),
+        "seconds": round(result["seconds"], 3)
+    }
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    if args.command == "jobs":
+        job_store = open_job_store()
+        print(json.dumps([dict(job, progress=job_store.progress(job["id"])) for job in job_store.unfinished_jobs()], indent=2))
+        return 0
+    try:
+        # Library code reports problems with print(); keep stdout for the JSON summary alone
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_export(args) if args.command == "export" else run_search(args)
+    except ValueError as e:
+        print(f"leadfinder: {e}", file=sys.stderr)
+        return 2
+    output = json.dumps(summary, indent=2)
+    if getattr(args, "summary", None):
+        with open(args.summary, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 1 if summary.get("totals", {}).get("tasks_failed") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
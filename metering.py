@@ -0,0 +1,279 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from ratelimit import USAGE_DB, book_usage, TEXT_SEARCH, TEXT_SEARCH_PAGE, NEARBY_SEARCH, NEARBY_SEARCH_PAGE, DETAILS
+
+LEGACY_USAGE_FILE = "api_usage_real.json"
+
+# Google Places SKUs (USD per call). Every result page is billed as its own search, and a
+# details lookup for phone/website is billed as Basic Details plus Contact Data.
+SKU_PRICES = {
+    "text_search": 0.032,
+    "nearby_search": 0.032,
+    "place_details_basic": 0.017,
+    "place_details_contact": 0.003
+}
+ENDPOINT_SKUS = {
+    TEXT_SEARCH: ["text_search"],
+    TEXT_SEARCH_PAGE: ["text_search"],
+    NEARBY_SEARCH: ["nearby_search"],
+    NEARBY_SEARCH_PAGE: ["nearby_search"],
+    DETAILS: ["place_details_basic", "place_details_contact"]
+}
+BILLABLE_STATUSES = {"OK", "ZERO_RESULTS"}
+MONTHLY_CREDIT_USD = 300
+
+FLUSH_EVERY = 50       # buffered calls before the log is written
+FLUSH_SECONDS = 5.0    # ... or seconds since the last write, whichever comes first
+
+_current_run = contextvars.ContextVar("metering_run", default=None)
+
+def _month(now=None):
+    return time.strftime("%Y-%m", time.gmtime(now))
+
+def _day(now=None):
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+def _empty_totals():
+    return {"calls": 0, "billed": 0, "cost": 0.0, "by_endpoint": {}, "by_sku": {}}
+
+def _add(totals, endpoint, sku, calls, billed, cost):
+    # calls/billed are counted once per endpoint (on its first SKU); cost is summed over SKUs
+    first_sku = sku == ENDPOINT_SKUS.get(endpoint, [sku])[0]
+    if first_sku:
+        totals["calls"] += calls
+        totals["billed"] += billed
+        by_endpoint = totals["by_endpoint"].setdefault(endpoint, {"calls": 0, "billed": 0})
+        by_endpoint["calls"] += calls
+        by_endpoint["billed"] += billed
+    totals["cost"] += cost
+    by_sku = totals["by_sku"].setdefault(sku, {"billed": 0, "cost": 0.0})
+    by_sku["billed"] += billed
+    by_sku["cost"] += cost
+
+class Run:
+    # Calls made while this run is current (see Meter.run), wherever in the process they happen.
+    # A child run (see child()) counts its own share of a run, e.g. one state of a threaded job; its
+    # calls count toward the parent too and are logged under the parent's id.
+
+    def __init__(self, label="", parent=None):
+        self.id = parent.id if parent else uuid.uuid4().hex
+        self.label = label
+        self.parent = parent
+        self.started_at = time.time()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _record(self, endpoint, billable):
+        with self._lock:
+            calls, billed = self._counts.get(endpoint, (0, 0))
+            self._counts[endpoint] = (calls + 1, billed + (1 if billable else 0))
+        if self.parent is not None:
+            self.parent._record(endpoint, billable)
+
+    def child(self, label=""):
+        return Run(label, parent=self)
+
+    def totals(self):
+        totals = _empty_totals()
+        with self._lock:
+            counts = dict(self._counts)
+        for endpoint, (calls, billed) in counts.items():
+            for sku in ENDPOINT_SKUS[endpoint]:
+                _add(totals, endpoint, sku, calls, billed, billed * SKU_PRICES[sku])
+        return totals
+
+class Meter:
+    # Counts every real HTTP call to Google by endpoint and SKU. Counting is an in-memory increment;
+    # aggregated rows are appended to the usage log in one transaction every FLUSH_EVERY calls or
+    # FLUSH_SECONDS, when a run ends, and at exit.
+
+    def __init__(self, path=USAGE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_calls = 0
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS api_usage_log (
+                id INTEGER PRIMARY KEY,
+                logged_at REAL NOT NULL,
+                month TEXT NOT NULL,
+                day TEXT NOT NULL,
+                run_id TEXT,
+                endpoint TEXT NOT NULL,
+                sku TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                billed INTEGER NOT NULL,
+                cost REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_api_usage_month ON api_usage_log (month);
+            CREATE TABLE IF NOT EXISTS usage_meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def record(self, endpoint, status):
+        # status: the API's "status" field; only OK and ZERO_RESULTS answers are billed
+        billable = status in BILLABLE_STATUSES
+        run = _current_run.get()
+        if run is not None:
+            run._record(endpoint, billable)
+        now = time.time()
+        with self._lock:
+            key = (_month(now), _day(now), run.id if run else None, endpoint)
+            calls, billed = self._pending.get(key, (0, 0))
+            self._pending[key] = (calls + 1, billed + (1 if billable else 0))
+            self._pending_calls += 1
+            due = self._pending_calls >= FLUSH_EVERY or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_calls = 0
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            now = time.time()
+            rows = [
+                (now, month, day, run_id, endpoint, sku, calls, billed, billed * SKU_PRICES[sku])
+                for (month, day, run_id, endpoint), (calls, billed) in pending.items()
+                for sku in ENDPOINT_SKUS[endpoint]
+            ]
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO api_usage_log (logged_at, month, day, run_id, endpoint, sku, calls, billed, cost)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # Keep the counts for the next attempt rather than losing them
+                for key, (calls, billed) in pending.items():
+                    old_calls, old_billed = self._pending.get(key, (0, 0))
+                    self._pending[key] = (old_calls + calls, old_billed + billed)
+                raise
+
+    def run(self, label=""):
+        return _RunScope(self, Run(label))
+
+    def month_totals(self, month=None):
+        # Logged plus still-buffered usage for a calendar month (UTC), default the current one
+        month = month or _month()
+        totals = _empty_totals()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT endpoint, sku, SUM(calls), SUM(billed), SUM(cost) FROM api_usage_log"
+                " WHERE month = ? GROUP BY endpoint, sku", (month,)
+            ).fetchall()
+            pending = [(key[3], calls, billed) for key, (calls, billed) in self._pending.items() if key[0] == month]
+        for endpoint, sku, calls, billed, cost in rows:
+            _add(totals, endpoint, sku, calls, billed, cost)
+        for endpoint, calls, billed in pending:
+            for sku in ENDPOINT_SKUS[endpoint]:
+                _add(totals, endpoint, sku, calls, billed, billed * SKU_PRICES[sku])
+        totals["credit_remaining"] = MONTHLY_CREDIT_USD - totals["cost"]
+        return totals
+
+    def import_legacy(self, path=LEGACY_USAGE_FILE):
+        # One-shot import of the old api_usage_real.json counter ("actual" text searches, month unknown,
+        # so it is booked to the month the file was last written). The calls also count against that
+        # month's governor budget, so the monthly call limit covers them.
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM usage_meta WHERE name = 'legacy_imported'").fetchone()
+            budgeted = self._conn.execute("SELECT value FROM usage_meta WHERE name = 'legacy_budgeted'").fetchone()
+        if done:
+            if not budgeted:
+                self._budget_legacy()
+            return 0
+        actual = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    actual = int(json.load(f).get("actual", 0))
+            except (OSError, ValueError):
+                actual = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if actual:
+                    mtime = os.path.getmtime(path)
+                    self._conn.execute(
+                        "INSERT INTO api_usage_log (logged_at, month, day, run_id, endpoint, sku, calls, billed, cost)"
+                        " VALUES (?, ?, ?, 'legacy', ?, 'text_search', ?, ?, ?)",
+                        (mtime, _month(mtime), _day(mtime), TEXT_SEARCH, actual, actual, actual * SKU_PRICES["text_search"])
+                    )
+                    book_usage(self._conn, TEXT_SEARCH, actual, mtime)
+                self._conn.execute("INSERT OR REPLACE INTO usage_meta (name, value) VALUES ('legacy_imported', ?)", (str(time.time()),))
+                self._conn.execute("INSERT OR REPLACE INTO usage_meta (name, value) VALUES ('legacy_budgeted', ?)", (str(time.time()),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return actual
+
+    def _budget_legacy(self):
+        # Usage imported before it counted against the budget is booked now, once
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT endpoint, billed, logged_at FROM api_usage_log WHERE run_id = 'legacy'"
+                ).fetchall()
+                for endpoint, billed, logged_at in rows:
+                    book_usage(self._conn, endpoint, billed, logged_at)
+                self._conn.execute("INSERT OR REPLACE INTO usage_meta (name, value) VALUES ('legacy_budgeted', ?)", (str(time.time()),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+class _RunScope:
+    def __init__(self, meter, run):
+        self.meter = meter
+        self.run = run
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_run.set(self.run)
+        return self.run
+
+    def __exit__(self, *exc):
+        _current_run.reset(self._token)
+        self.meter.flush()
+        return False
+
+def current_run():
+    # The run calls in this context count toward, or None
+    return _current_run.get()
+
+@contextlib.contextmanager
+def using_run(run):
+    # Makes `run` current for the block (e.g. inside a worker thread), without flushing anything
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+_meter = None
+_meter_lock = threading.Lock()
+
+def get_meter():
+    global _meter
+    with _meter_lock:
+        if _meter is None:
+            _meter = Meter()
+            atexit.register(_meter.flush)
+    return _meter
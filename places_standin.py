@@ -0,0 +1,166 @@
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from geogrid import in_state, load_state_bounds
+
+# Local stand-in for the Places API endpoints the app uses (textsearch, nearbysearch, details), serving a
+# synthetic, seeded set of businesses: dense clusters around a state's cities plus a rural scatter.
+# Like Google it returns 20 results a page and at most 60 per query, most prominent first. Point the app
+# at it with PLACES_API_BASE=http://127.0.0.1:<port>, e.g.
+#   python places_standin.py --states Ohio --places 4000 --port 8765
+
+CITIES_FILE = "top_cities_by_state_converted.json"
+PAGE_SIZE = 20
+MAX_RESULTS = 60
+CITY_RADIUS_KM = 25  # what a "<term> in <city>" text search covers
+CLUSTERS_PER_STATE = 40
+RURAL_SHARE = 0.2
+
+def _km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+def build_world(states, places_per_state=4000, seed=1, cities_file=CITIES_FILE):
+    # Returns {"places": [...], "cities": {(city, state): (lat, lng)}}
+    rng = random.Random(seed)
+    with open(cities_file, "r") as f:
+        cities_by_state = json.load(f)
+    bounds_by_state = load_state_bounds()
+    places, cities = [], {}
+    for state in states:
+        b = bounds_by_state[state]
+        names = cities_by_state.get(state, [])[:CLUSTERS_PER_STATE]
+        # Zipf-like city sizes: a few big metros, many small towns
+        weights = [1 / (rank + 1) for rank in range(len(names))]
+        # Cities and businesses are on land inside the state, not in its box's lakes or neighbours
+        def anywhere():
+            while True:
+                lat, lng = rng.uniform(b["south"], b["north"]), rng.uniform(b["west"], b["east"])
+                if in_state(state, lat, lng):
+                    return lat, lng
+        for name in names:
+            cities[(name.lower(), state.lower())] = anywhere()
+        for i in range(places_per_state):
+            if names and rng.random() > RURAL_SHARE:
+                name = rng.choices(names, weights)[0]
+                center_lat, center_lng = cities[(name.lower(), state.lower())]
+                while True:
+                    lat = min(max(rng.gauss(center_lat, 0.08), b["south"]), b["north"])
+                    lng = min(max(rng.gauss(center_lng, 0.1), b["west"]), b["east"])
+                    if in_state(state, lat, lng):
+                        break
+                town = name
+            else:
+                lat, lng = anywhere()
+                town = "Rural"
+            place_id = f"standin-{state.lower().replace(' ', '')}-{i}"
+            places.append({
+                "place_id": place_id,
+                "name": f"Business {i} of {town}",
+                "vicinity": f"{i} Main St, {town}",
+                "formatted_address": f"{i} Main St, {town}, {state}, United States",
+                "geometry": {"location": {"lat": lat, "lng": lng}},
+                "prominence": rng.random(),
+                "phone": f"(555) {i // 10000:03d}-{i % 10000:04d}",
+                "website": f"https://{place_id}.example.com/"
+            })
+    return {"places": places, "cities": cities}
+
+class StandinHandler(BaseHTTPRequestHandler):
+    world = None
+    counts = None
+    counts_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, matches, offset, query):
+        matches = sorted(matches, key=lambda p: -p["prominence"])[:MAX_RESULTS]
+        page = [{k: v for k, v in p.items() if k not in ("prominence", "phone", "website")}
+                for p in matches[offset:offset + PAGE_SIZE]]
+        payload = {"status": "OK" if page else "ZERO_RESULTS", "results": page}
+        if offset + PAGE_SIZE < len(matches):
+            token = dict(query, offset=offset + PAGE_SIZE)
+            payload["next_page_token"] = base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+        return payload
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.strip("/").split("/")[0]
+        with self.counts_lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+        query, offset = params, 0
+        if "pagetoken" in params:
+            query = json.loads(base64.urlsafe_b64decode(params["pagetoken"].encode()))
+            offset = query.pop("offset")
+        places = self.world["places"]
+
+        if endpoint == "nearbysearch":
+            if "location" not in query or "radius" not in query:
+                return self._send({"status": "INVALID_REQUEST", "results": []})
+            lat, lng = map(float, query["location"].split(","))
+            radius_km = float(query["radius"]) / 1000
+            matches = [p for p in places if _km(lat, lng, p["geometry"]["location"]["lat"], p["geometry"]["location"]["lng"]) <= radius_km]
+            return self._send(self._page(matches, offset, query))
+
+        if endpoint == "textsearch":
+            # "<term> in <city>, <state>": everything within CITY_RADIUS_KM of the city
+            _, _, location = query.get("query", "").rpartition(" in ")
+            city, _, state = location.partition(", ")
+            center = self.world["cities"].get((city.strip().lower(), state.strip().lower()))
+            if center is None:
+                return self._send({"status": "ZERO_RESULTS", "results": []})
+            matches = [p for p in places if _km(*center, p["geometry"]["location"]["lat"], p["geometry"]["location"]["lng"]) <= CITY_RADIUS_KM]
+            return self._send(self._page(matches, offset, query))
+
+        if endpoint == "details":
+            place = self.world["by_id"].get(query.get("place_id"))
+            if place is None:
+                return self._send({"status": "NOT_FOUND"})
+            return self._send({"status": "OK", "result": {"formatted_phone_number": place["phone"], "website": place["website"]}})
+
+        self.send_error(404)
+
+def start_standin(world, host="127.0.0.1", port=0):
+    # Serves `world` on a background thread; returns (server, base_url). server.counts has requests per endpoint.
+    world = dict(world, by_id={p["place_id"]: p for p in world["places"]})
+    handler = type("Handler", (StandinHandler,), {"world": world, "counts": {}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.counts = handler.counts
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Places API")
+    parser.add_argument("--states", default="Ohio", help="Comma-separated states to populate")
+    parser.add_argument("--places", type=int, default=4000, help="Businesses per state")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    states = [s.strip() for s in args.states.split(",") if s.strip()]
+    server, base_url = start_standin(build_world(states, args.places, args.seed), port=args.port)
+    print(f"Places stand-in with {args.places * len(states):,} businesses at {base_url} (set PLACES_API_BASE={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
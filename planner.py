@@ -0,0 +1,150 @@
+import math
+
+# Yield-driven search planning. The search cache records what every (term, city, state) search returned,
+# which is enough to measure how many places each term variant adds on top of the terms searched before
+# it in the same city. Variants are ranked by that marginal yield, dropped from cities where they are
+# not expected to pay for their calls, and a city stops expanding at run time once a variant adds fewer
+# than min_yield new places per call (see sweep.run_job).
+
+MIN_NEW_PER_CALL = 2.0    # default min_yield: new places a search must be expected to add per call
+PRIOR_NEW_PER_CALL = 5.0  # assumed for a term with no history, so untried variants get a chance
+PRIOR_WEIGHT = 3          # calls of history that count as much as the prior
+PAGE_SIZE = 20
+
+def _calls(place_ids):
+    # A cached answer of n results cost one call per 20-result page
+    return max(1, math.ceil(len(place_ids) / PAGE_SIZE))
+
+def term_yields(history, terms):
+    # history: {(term, city, state): [place_id, ...]} from SearchCache.place_ids(); terms in run order.
+    # The first term's yield is what it found that no other city's search for it did (neighbouring cities
+    # overlap); a variant's is what it found in a city that the terms before it had not.
+    # Returns {term: {"samples", "new", "calls", "new_per_call"}}, new_per_call shrunk toward the prior.
+    terms = [t.lower() for t in terms]
+    by_city = {}
+    for (term, city, state), ids in history.items():
+        if term in terms and not city.startswith("grid:"):
+            by_city.setdefault((city, state), {})[term] = set(ids)
+
+    base = terms[0]
+    seen_in = {}
+    for (city, state), found in by_city.items():
+        for place_id in found.get(base, ()):
+            seen_in.setdefault((state, place_id), set()).add(city)
+
+    yields = {term: {"samples": 0, "new": 0, "calls": 0} for term in terms}
+    for (city, state), found in by_city.items():
+        earlier = set()
+        for term in terms:
+            if term not in found:
+                continue
+            ids = found[term]
+            if term == base:
+                new = sum(1 for place_id in ids if len(seen_in[(state, place_id)]) == 1)
+            else:
+                if base not in found:
+                    continue
+                new = len(ids - earlier)
+            stats = yields[term]
+            stats["samples"] += 1
+            stats["new"] += new
+            stats["calls"] += _calls(ids)
+            earlier |= ids
+    for stats in yields.values():
+        stats["new_per_call"] = (stats["new"] + PRIOR_NEW_PER_CALL * PRIOR_WEIGHT) / (stats["calls"] + PRIOR_WEIGHT)
+    return yields
+
+def rank_terms(terms, yields):
+    # The business type itself always goes first; variants follow, best marginal yield first
+    return terms[:1] + sorted(terms[1:], key=lambda t: -yields[t.lower()]["new_per_call"])
+
+def plan_search(terms, cities_by_state_plan, search_cache, paginate=False, min_yield=MIN_NEW_PER_CALL):
+    # cities_by_state_plan: {state: [city, ...]} the search would cover. Returns the plan:
+    #   tasks          (term, city, state) worth running, cities with the best expected yield first
+    #   terms          the terms in ranked order, dropped      variants pruned from every city
+    #   calls          API calls the plan is expected to make (cached searches are free)
+    #   expected_new   places the plan is expected to add,  new_per_call  expected_new / calls
+    #   expected       {task: places it is expected to add}
+    history = search_cache.place_ids(terms, list(cities_by_state_plan))
+    yields = term_yields(history, terms)
+    ranked = rank_terms(terms, yields)
+    base = ranked[0].lower()
+    pages = 3 if paginate else 1
+    base_sizes = [len(ids) for (term, city, _), ids in history.items() if term == base and not city.startswith("grid:")]
+    mean_base = sum(base_sizes) / len(base_sizes) if base_sizes else None
+
+    tasks, calls, expected_new, used_terms, expected = [], 0, 0.0, set(), {}
+    for state, cities in cities_by_state_plan.items():
+        ranked_cities = []
+        for city in cities:
+            city_tasks, city_calls, city_new = [], 0, 0.0
+            earlier = set()
+            base_ids = history.get((base, city, state))
+            # Small towns (few results for the business type) get proportionally less out of variants
+            factor = len(base_ids) / mean_base if base_ids is not None and mean_base else 1.0
+            for term in ranked:
+                ids = history.get((term.lower(), city, state))
+                if ids is not None:
+                    # Cached: free, and its yield is known exactly
+                    new = len(set(ids) - earlier)
+                    earlier |= set(ids)
+                    city_tasks.append((term, city, state))
+                    expected[(term, city, state)] = new
+                    city_new += new
+                    continue
+                rate = yields[term.lower()]["new_per_call"] * (1.0 if term.lower() == base else factor)
+                if term.lower() != base and rate < min_yield:
+                    continue
+                city_tasks.append((term, city, state))
+                expected[(term, city, state)] = rate * pages
+                city_calls += pages
+                city_new += rate * pages
+            ranked_cities.append((city_new / max(city_calls, 1), city_tasks, city_calls, city_new))
+        for _, city_tasks, city_calls, city_new in sorted(ranked_cities, key=lambda c: -c[0]):
+            tasks.extend(city_tasks)
+            calls += city_calls
+            expected_new += city_new
+            used_terms.update(term for term, _, _ in city_tasks)
+
+    return {
+        "tasks": tasks,
+        "terms": ranked,
+        "dropped": [term for term in ranked if term not in used_terms],
+        "calls": calls,
+        "expected_new": round(expected_new, 1),
+        "new_per_call": round(expected_new / calls, 2) if calls else None,
+        "expected": expected,
+        "yields": {term: round(yields[term.lower()]["new_per_call"], 2) for term in ranked},
+        "min_yield": min_yield
+    }
+
+def trim_to_budget(plan, costs, budget):
+    # costs: {task: USD} from a dry run (sweep.price_plan). Drops the paid tasks that add the fewest places
+    # per dollar until the plan fits the budget: variants go before any city's own business type search,
+    # and dropping that search drops the city's variants with it. Returns a new plan with fewer tasks.
+    base = plan["terms"][0]
+    total = sum(costs.get(task, 0) for task in plan["tasks"])
+    dropped = set()
+    paid = [task for task in plan["tasks"] if costs.get(task, 0) > 0]
+    # Variants first, least productive first; then whole cities
+    paid.sort(key=lambda task: (task[0] == base, plan["expected"].get(task, 0) / costs[task]))
+    for task in paid:
+        if total <= budget:
+            break
+        if task in dropped:
+            continue
+        doomed = [task]
+        if task[0] == base:
+            doomed += [t for t in plan["tasks"] if t[1:] == task[1:] and t != task and t not in dropped]
+        for t in doomed:
+            dropped.add(t)
+            total -= costs.get(t, 0)
+    tasks = [task for task in plan["tasks"] if task not in dropped]
+    return dict(
+        plan,
+        tasks=tasks,
+        dropped=[term for term in plan["terms"] if not any(t[0] == term for t in tasks)],
+        expected_new=round(sum(plan["expected"].get(task, 0) for task in tasks), 1),
+        trimmed=sorted(dropped, key=plan["tasks"].index)
+    )
+
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+USAGE_DB = "usage.db"
+
+# Google Places endpoints as billed: a text or nearby search, each extra result page, and a details lookup
+TEXT_SEARCH = "text_search"
+TEXT_SEARCH_PAGE = "text_search_page"
+NEARBY_SEARCH = "nearby_search"
+NEARBY_SEARCH_PAGE = "nearby_search_page"
+DETAILS = "details"
+
+MONTHLY_CALL_LIMIT = 11000  # all endpoints together
+
+# rate: sustained calls per second; burst: calls allowed back to back; daily/monthly: budgets (None = unlimited)
+ENDPOINT_LIMITS = {
+    TEXT_SEARCH: {"rate": 10, "burst": 10, "daily": None, "monthly": None},
+    TEXT_SEARCH_PAGE: {"rate": 10, "burst": 10, "daily": None, "monthly": None},
+    NEARBY_SEARCH: {"rate": 10, "burst": 10, "daily": None, "monthly": None},
+    NEARBY_SEARCH_PAGE: {"rate": 10, "burst": 10, "daily": None, "monthly": None},
+    DETAILS: {"rate": 20, "burst": 20, "daily": None, "monthly": None}
+}
+OVER_LIMIT_PAUSE = 2.0  # seconds an endpoint is held back after Google answers OVER_QUERY_LIMIT
+BLOCK_POLL_SECONDS = 60
+
+class BudgetExceeded(Exception):
+    pass
+
+class TokenBucket:
+    # Reservation-style bucket: take() books the next slot and returns how long to wait for it,
+    # so sync callers can time.sleep() and coroutines can asyncio.sleep() without holding a lock
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds):
+        # Drain the bucket so no new slot opens for `seconds`; repeated pauses do not stack
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, -seconds * self.rate)
+            self._updated = now
+
+BUDGET_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS api_budget ("
+    " endpoint TEXT NOT NULL,"
+    " period TEXT NOT NULL,"
+    " used INTEGER NOT NULL,"
+    " PRIMARY KEY (endpoint, period))"
+)
+_BOOK_SQL = (
+    "INSERT INTO api_budget (endpoint, period, used) VALUES (?, ?, ?)"
+    " ON CONFLICT (endpoint, period) DO UPDATE SET used = used + excluded.used"
+)
+
+def _periods(now=None):
+    now = time.gmtime(now)
+    return {"daily": time.strftime("day:%Y-%m-%d", now), "monthly": time.strftime("month:%Y-%m", now)}
+
+def book_usage(conn, endpoint, calls, now=None):
+    # Counts calls made outside the governor (the legacy usage counter) against the monthly budgets of the
+    # month they were made in; runs inside the caller's transaction on a connection to the usage database
+    period = _periods(now)["monthly"]
+    conn.execute(BUDGET_TABLE_SQL)
+    conn.executemany(_BOOK_SQL, [(endpoint, period, calls), ("*", period, calls)])
+
+class Governor:
+    # Process-wide rate limits per endpoint plus daily/monthly budgets. Budget counters live in SQLite
+    # and are reserved in one transaction before each call, so concurrent threads, coroutines and
+    # processes (the app and the headless runner) can never overspend.
+
+    def __init__(self, path=USAGE_DB, limits=None, monthly_limit=MONTHLY_CALL_LIMIT, block=False):
+        self.path = path
+        self.limits = {endpoint: dict(limit) for endpoint, limit in (limits or ENDPOINT_LIMITS).items()}
+        self.monthly_limit = monthly_limit
+        self.block = block  # wait for the next period instead of raising BudgetExceeded
+        self._buckets = {endpoint: TokenBucket(limit["rate"], limit["burst"]) for endpoint, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(BUDGET_TABLE_SQL)
+
+    def _budget_rows(self, endpoint):
+        # (counter endpoint, period, limit) for every budget one call to `endpoint` counts against
+        periods = _periods()
+        rows = [(endpoint, periods[kind], self.limits[endpoint][kind])
+                for kind in ("daily", "monthly") if self.limits[endpoint].get(kind)]
+        rows.append(("*", periods["monthly"], self.monthly_limit))
+        return rows
+
+    def reserve(self, endpoint, calls=1):
+        # Books `calls` against every budget or none of them; raises BudgetExceeded if any would go over
+        rows = self._budget_rows(endpoint)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for counter, period, limit in rows:
+                    used = self._conn.execute(
+                        "SELECT used FROM api_budget WHERE endpoint = ? AND period = ?", (counter, period)
+                    ).fetchone()
+                    used = used[0] if used else 0
+                    if limit is not None and used + calls > limit:
+                        raise BudgetExceeded(f"{counter} budget for {period} reached ({used:,} of {limit:,} calls)")
+                for counter, period, _ in rows:
+                    self._conn.execute(_BOOK_SQL, (counter, period, calls))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def refund(self, endpoint, calls=1):
+        # Gives back reserved calls Google did not bill (errors, OVER_QUERY_LIMIT, failed requests), so only
+        # billed calls count against the budgets; a call refunded after midnight comes off the new period
+        rows = self._budget_rows(endpoint)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for counter, period, _ in rows:
+                    self._conn.execute(
+                        "UPDATE api_budget SET used = MAX(used - ?, 0) WHERE endpoint = ? AND period = ?", (calls, counter, period)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _reserve_or_wait(self, endpoint):
+        # Returns seconds to wait before retrying, or 0 once the call is booked
+        try:
+            self.reserve(endpoint)
+            return 0
+        except BudgetExceeded:
+            if not self.block:
+                raise
+            return BLOCK_POLL_SECONDS
+
+    def acquire(self, endpoint):
+        # Blocking form for threads: waits for a rate slot, then books the call
+        time.sleep(self._buckets[endpoint].take())
+        while True:
+            wait = self._reserve_or_wait(endpoint)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, endpoint):
+        # Same as acquire() without blocking the event loop
+        await asyncio.sleep(self._buckets[endpoint].take())
+        while True:
+            wait = await asyncio.to_thread(self._reserve_or_wait, endpoint)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def over_limit(self, endpoint):
+        # Google answered OVER_QUERY_LIMIT: hold the endpoint back briefly
+        self._buckets[endpoint].pause(OVER_LIMIT_PAUSE)
+
+    def used(self, endpoint="*", kind="monthly"):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT used FROM api_budget WHERE endpoint = ? AND period = ?", (endpoint, _periods()[kind])
+            ).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self):
+        return max(self.monthly_limit - self.used(), 0) if self.monthly_limit is not None else None
+
+    def exhausted(self):
+        return self.monthly_limit is not None and self.used() >= self.monthly_limit
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+    return _governor
@@ -0,0 +1,99 @@
+import re
+from functools import lru_cache
+
+DEFAULT_ROLES = ["owner", "manager", "director"]
+
+# Words that mark a tag's text as a specialization blurb rather than a title
+ROLE_SKIP_KEYWORDS = ["specialty", "areas", "services", "invisalign", "implants", "procedures", "bio", "about", "focus"]
+# Marketing/section phrases that are never a contact's title
+ROLE_GENERIC_PHRASES = [
+    "welcome to", "about your", "our services", "learn more",
+    "improve your smile", "what to expect", "iv sedation",
+    "sleep apnea", "quality dental care", "new patients",
+    "treatments", "dental care", "oral health"
+]
+# Noise filtering for the line-by-line fallback
+LINE_SKIP_PHRASES = [
+    "meet your", "what our patients", "our services", "about your",
+    "frequently asked", "faq", "iv sedation", "sleep apnea",
+    "quality dental care", "new patients", "treatments", "oral health"
+]
+MATCHER_CACHE_SIZE = 64
+
+def _alternation(phrases):
+    # Longest first so the regex prefers "office manager" over "manager" at the same offset
+    unique = sorted(set(phrases), key=len, reverse=True)
+    return "|".join(re.escape(p) for p in unique)
+
+def _phrase_regex(phrases):
+    return re.compile(_alternation([p.lower() for p in phrases])) if phrases else None
+
+class RoleMatcher:
+    # One industry's roles and the noise phrase lists compiled into single patterns, so
+    # each check is one scan of the text. Matching is case-insensitive, like `role.lower() in text.lower()`.
+
+    def __init__(self, roles, skip_keywords=ROLE_SKIP_KEYWORDS, generic_phrases=ROLE_GENERIC_PHRASES,
+                 line_skip_phrases=LINE_SKIP_PHRASES):
+        self.roles = list(roles)
+        self._lowered = [role.lower() for role in self.roles]
+        self._any_re = _phrase_regex(self._lowered)
+        # Zero-width lookahead finds a match at every offset, so overlapping roles
+        # ("director" inside "funeral director") are all reported
+        self._all_re = re.compile(f"(?=({_alternation(self._lowered)}))") if self.roles else None
+        # Every role matching at one offset is a prefix of the longest one matching there
+        self._prefixes = {
+            role: sorted((other for other in set(self._lowered) if other != role and role.startswith(other)), key=len, reverse=True)
+            for role in set(self._lowered)
+        }
+        self._skip_re = _phrase_regex(skip_keywords)
+        self._generic_re = _phrase_regex(generic_phrases)
+        self._line_skip_re = _phrase_regex(line_skip_phrases)
+
+    def search(self, text):
+        return self._any_re is not None and self._any_re.search(text.lower()) is not None
+
+    def find_all(self, text):
+        # [(role, start, end)] for every role occurrence in text.lower(), by offset then longest first
+        found = []
+        if self._all_re is None:
+            return found
+        for match in self._all_re.finditer(text.lower()):
+            longest = match.group(1)
+            start = match.start()
+            for role in [longest] + self._prefixes[longest]:
+                found.append((role, start, start + len(role)))
+        return found
+
+    def first_role(self, text):
+        # The first configured role present in text (config order, not position), as configured
+        if not self.search(text):
+            return None
+        present = {role for role, _, _ in self.find_all(text)}
+        return next((role for role, lowered in zip(self.roles, self._lowered) if lowered in present), None)
+
+    def is_title_noise(self, text):
+        text = text.lower()
+        return any(regex is not None and regex.search(text) for regex in (self._skip_re, self._generic_re))
+
+    def is_line_noise(self, text):
+        return self._line_skip_re is not None and self._line_skip_re.search(text.lower()) is not None
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _compiled_matcher(roles):
+    return RoleMatcher(roles)
+
+def role_matcher(roles):
+    # Compiled once per distinct role list (i.e. per industry) and shared by every page in the process
+    if isinstance(roles, RoleMatcher):
+        return roles
+    return _compiled_matcher(tuple(roles))
+
+def roles_for_business(business_name, role_config):
+    industry = str(business_name).lower()
+    for key, roles in role_config.get("titles_by_industry", {}).items():
+        if key in industry:
+            return roles
+    return DEFAULT_ROLES
+
+def matcher_for_business(business_name, role_config):
+    return role_matcher(roles_for_business(business_name, role_config))
@@ -1,32 +1,346 @@
-import time
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import weakref
 import requests
+from requests.adapters import HTTPAdapter
 
-def search_places(query, location, api_key, use_pagination=False):
-    url = f"https://maps.googleapis.com/maps/api/place/textsearch/json"
-    params = {
-        "query": f"{query} in {location}",
-        "key": api_key
-    }
+from ratelimit import TEXT_SEARCH, TEXT_SEARCH_PAGE, NEARBY_SEARCH, NEARBY_SEARCH_PAGE, DETAILS, get_governor
+from metering import BILLABLE_STATUSES, get_meter
+
+# PLACES_API_BASE points the client at another server, e.g. the local stand-in in places_standin.py
+PLACES_API_BASE = "https://maps.googleapis.com/maps/api/place"
+MAX_NEARBY_RADIUS_M = 50000
+
+MAX_IN_FLIGHT = 8          # requests to Google in flight at once, process-wide; also the connection pool size
+PAGE_TOKEN_DELAY = 2       # next_page_token is not valid until ~2s after it is issued
+REQUEST_TIMEOUT = 15
+OVER_LIMIT_RETRIES = 2     # retries after an OVER_QUERY_LIMIT answer, each after the endpoint is paused
+
+SEARCH_OK_STATUSES = {"OK", "ZERO_RESULTS"}  # the only answers a search result may be built (and cached) from
+
+class PlacesAPIError(Exception):
+    # Google answered a search with an error status (OVER_QUERY_LIMIT after the retries, REQUEST_DENIED,
+    # INVALID_REQUEST, an HTTP error...): the query has no trustworthy result and must be retried later
+    def __init__(self, endpoint, status, message=""):
+        super().__init__(f"{endpoint}: {status}" + (f" ({message})" if message else ""))
+        self.endpoint = endpoint
+        self.status = status
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    # One pooled keep-alive session shared by every caller in the process, with a connection per request slot
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAX_IN_FLIGHT)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+# ---------------- Shared event loop ----------------
+# Every sync wrapper, the sweep and the details lookups run their coroutines on one long-lived loop in a
+# background thread. Requests take one of MAX_IN_FLIGHT slots of a semaphore owned by that loop, so the
+# whole process never has more requests out than the session has connections, and page-token waits
+# hold neither a slot nor a thread.
+
+_loop = None
+_loop_lock = threading.Lock()
+_slots = weakref.WeakKeyDictionary()  # event loop -> its request semaphore
+
+def _shared_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            # Blocking requests and cache reads/writes run in the loop's executor: a thread per request slot plus as many for the caches
+            loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=2 * MAX_IN_FLIGHT, thread_name_prefix="places"))
+            threading.Thread(target=loop.run_forever, name="places-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def _request_slots():
+    # The running loop's request semaphore (coroutines run on one loop, so it needs no lock)
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        slots = _slots[loop] = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return slots
+
+def submit(coro):
+    # Schedules a coroutine on the shared loop and returns a concurrent.futures.Future for its result.
+    # It runs in the caller's context, so its calls count toward the caller's metering run; cancelling the
+    # future cancels the coroutine.
+    loop = _shared_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def settle(settle_future, value):
+        # The caller may have cancelled the future meanwhile
+        try:
+            settle_future(value)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    async def run():
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            # KeyboardInterrupt and SystemExit too: they reach the caller instead of stopping the shared loop
+            settle(future.set_exception, e)
+            return
+        settle(future.set_result, result)
+
+    def start():
+        if future.cancelled():
+            coro.close()
+            return
+        task = loop.create_task(run())
+        future.add_done_callback(lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel))
+
+    loop.call_soon_threadsafe(context.run, start)
+    return future
+
+def run_on_loop(coro):
+    # Blocking form of submit(); not for use from a coroutine on the shared loop, which it would deadlock
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None and running is _loop:
+        coro.close()
+        raise RuntimeError("run_on_loop() called from the shared loop; await the coroutine instead")
+    return submit(coro).result()
+
+def _api_status(response):
+    if response.status_code != 200:
+        return f"HTTP_{response.status_code}"
+    try:
+        return response.json().get("status", "OK")
+    except ValueError:
+        return "INVALID_RESPONSE"
+
+def _error_message(response):
+    try:
+        return response.json().get("error_message", "")
+    except ValueError:
+        return ""
+
+async def _send(session, url, params, semaphore):
+    # semaphore: an extra limit of the caller's batch, or None for the process-wide slots alone
+    if semaphore is None:
+        async with _request_slots():
+            return await asyncio.to_thread(session.get, url, params=params, timeout=REQUEST_TIMEOUT)
+    async with semaphore, _request_slots():
+        return await asyncio.to_thread(session.get, url, params=params, timeout=REQUEST_TIMEOUT)
+
+async def _get(endpoint, url, params, semaphore=None):
+    # Every Google call goes through the process-wide governor: it waits for a rate slot and books
+    # the call against the endpoint's budgets first (raising BudgetExceeded rather than overspending).
+    # Every answer that comes back is metered by endpoint and SKU; calls Google does not bill are refunded.
+    session = get_session()
+    governor = get_governor()
+    meter = get_meter()
+    for attempt in range(OVER_LIMIT_RETRIES + 1):
+        await governor.acquire_async(endpoint)
+        try:
+            response = await _send(session, url, params, semaphore)
+        except Exception:
+            governor.refund(endpoint)
+            raise
+        status = _api_status(response)
+        meter.record(endpoint, status)
+        if status not in BILLABLE_STATUSES:
+            governor.refund(endpoint)
+        if status != "OVER_QUERY_LIMIT":
+            break
+        governor.over_limit(endpoint)
+    return response
+
+def _api_url(name):
+    # Read per call so a PLACES_API_BASE loaded from .env after import still applies
+    return f"{os.getenv('PLACES_API_BASE', PLACES_API_BASE).rstrip('/')}/{name}/json"
+
+# ---------------- Async API ----------------
+
+async def _paged_search(endpoints, url, params, use_pagination, semaphore=None, stats=None):
+    # endpoints: (first page, later pages); up to 3 pages of 20 results when paginating.
+    # stats, if given, gets the result pages fetched added under "calls" (each page is a billed search).
     results = []
-    for _ in range(3 if use_pagination else 1):
-        response = requests.get(url, params=params)
+    for page in range(3 if use_pagination else 1):
+        endpoint = endpoints[1] if page else endpoints[0]
+        response = await _get(endpoint, url, dict(params), semaphore)
+        status = _api_status(response)
+        if status not in SEARCH_OK_STATUSES:
+            # Raising keeps an error out of the search cache and leaves the task resumable
+            raise PlacesAPIError(endpoint, status, _error_message(response))
         data = response.json()
+        if stats is not None:
+            stats["calls"] = stats.get("calls", 0) + 1
         results.extend(data.get("results", []))
         if "next_page_token" in data:
             params["pagetoken"] = data["next_page_token"]
-            time.sleep(2)
+            # Waits holding no request slot, so other searches keep the connections busy
+            await asyncio.sleep(PAGE_TOKEN_DELAY)
         else:
             break
     return results
 
-def get_place_details(place_id, api_key):
-    details_url = "https://maps.googleapis.com/maps/api/place/details/json"
+async def search_places_async(query, location, api_key, use_pagination=False, semaphore=None, stats=None):
+    params = {
+        "query": f"{query} in {location}",
+        "key": api_key
+    }
+    return await _paged_search((TEXT_SEARCH, TEXT_SEARCH_PAGE), _api_url("textsearch"), params, use_pagination, semaphore, stats)
+
+async def search_nearby_async(keyword, lat, lng, radius_m, api_key, use_pagination=False, semaphore=None, stats=None):
+    # Nearby Search only returns places inside the circle, so a full answer means the area is saturated
+    params = {
+        "keyword": keyword,
+        "location": f"{lat:.6f},{lng:.6f}",
+        "radius": int(min(radius_m, MAX_NEARBY_RADIUS_M)),
+        "key": api_key
+    }
+    return await _paged_search((NEARBY_SEARCH, NEARBY_SEARCH_PAGE), _api_url("nearbysearch"), params, use_pagination, semaphore, stats)
+
+async def _fetch_details(place_id, api_key, semaphore=None):
+    # None means the lookup failed and must not be cached
     params = {
         "place_id": place_id,
         "fields": "formatted_phone_number,website",
         "key": api_key
     }
-    response = requests.get(details_url, params=params)
-    if response.status_code == 200:
-        return response.json().get("result", {})
-    return {}
\ No newline at end of file
+    response = await _get(DETAILS, _api_url("details"), params, semaphore)
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get("status", "OK") != "OK":
+        return None
+    return data.get("result", {})
+
+async def get_place_details_async(place_id, api_key, semaphore=None):
+    return await _fetch_details(place_id, api_key, semaphore) or {}
+
+def _batch_limit(max_in_flight):
+    # A batch's own cap on its requests, below the process-wide one; None for no extra cap
+    return asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+async def search_places_batch_async(queries, api_key, use_pagination=False, max_in_flight=None, stats=None):
+    # queries: iterable of (term, location); results come back in the same order. All searches run at once
+    # and their page-token waits overlap. A failed query raises, so an empty answer is never mistaken for a real one.
+    semaphore = _batch_limit(max_in_flight)
+    return await asyncio.gather(*(
+        search_places_async(query, location, api_key, use_pagination, semaphore, stats)
+        for query, location in queries
+    ))
+
+async def search_nearby_batch_async(queries, api_key, use_pagination=False, max_in_flight=None, stats=None):
+    # queries: iterable of (keyword, lat, lng, radius_m); results come back in the same order, errors raise
+    semaphore = _batch_limit(max_in_flight)
+    return await asyncio.gather(*(
+        search_nearby_async(keyword, lat, lng, radius_m, api_key, use_pagination, semaphore, stats)
+        for keyword, lat, lng, radius_m in queries
+    ))
+
+async def _details_batch(place_ids, api_key, max_in_flight=None):
+    semaphore = _batch_limit(max_in_flight)
+    unique_ids = list(dict.fromkeys(pid for pid in place_ids if pid))
+
+    async def run(place_id):
+        try:
+            return await _fetch_details(place_id, api_key, semaphore)
+        except requests.exceptions.RequestException as e:
+            print(f"Place details failed for {place_id}: {e}")
+            return None
+
+    details = await asyncio.gather(*(run(pid) for pid in unique_ids))
+    return dict(zip(unique_ids, details))
+
+async def get_place_details_cached_async(place_ids, api_key, cache, max_in_flight=None, stats=None):
+    # Resolve every cached id in one read, fetch only the misses, store what succeeded.
+    # stats, if given, gets this call's own "hits"/"misses" added (the cache's counters are shared).
+    found = await asyncio.to_thread(cache.get_many, place_ids)
+    missing = [pid for pid in dict.fromkeys(place_ids) if pid and pid not in found]
+    if stats is not None:
+        stats["hits"] = stats.get("hits", 0) + len(found)
+        stats["misses"] = stats.get("misses", 0) + len(missing)
+    if missing:
+        fetched = await _details_batch(missing, api_key, max_in_flight)
+        fresh = {pid: details for pid, details in fetched.items() if details is not None}
+        await asyncio.to_thread(cache.put_many, fresh)
+        found.update({pid: details or {} for pid, details in fetched.items()})
+    return found
+
+# ---------------- Sync wrappers ----------------
+
+def search_places(query, location, api_key, use_pagination=False, stats=None):
+    return run_on_loop(search_places_async(query, location, api_key, use_pagination, stats=stats))
+
+def search_places_batch(queries, api_key, use_pagination=False, max_in_flight=None, stats=None):
+    return run_on_loop(search_places_batch_async(queries, api_key, use_pagination, max_in_flight, stats))
+
+def search_nearby_batch(queries, api_key, use_pagination=False, max_in_flight=None, stats=None):
+    return run_on_loop(search_nearby_batch_async(queries, api_key, use_pagination, max_in_flight, stats))
+
+def get_place_details(place_id, api_key):
+    return run_on_loop(get_place_details_async(place_id, api_key))
+
+def get_place_details_cached(place_ids, api_key, cache, max_in_flight=None, stats=None):
+    return run_on_loop(get_place_details_cached_async(place_ids, api_key, cache, max_in_flight, stats))
+
+# ---------------- Per-run coalescing ----------------
+
+class DetailsFlight:
+    # Place Details for one run, coalesced by place_id across every term variant, city and thread:
+    # each id is resolved (from the cache or with one API call) once, and a caller asking for an id
+    # another thread is already fetching waits for that lookup instead of repeating it
+
+    def __init__(self, api_key, cache, max_in_flight=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self._details = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, place_ids, stats=None):
+        # Returns {place_id: details}; stats, if given, gets the cache hits/misses of the ids this call fetched
+        wanted = list(dict.fromkeys(pid for pid in place_ids if pid))
+        owned, waiting = [], []
+        with self._lock:
+            for pid in wanted:
+                if pid in self._details:
+                    continue
+                if pid in self._in_flight:
+                    waiting.append(self._in_flight[pid])
+                else:
+                    self._in_flight[pid] = threading.Event()
+                    owned.append(pid)
+        if owned:
+            fetched = {}
+            try:
+                fetched = get_place_details_cached(owned, self.api_key, self.cache, self.max_in_flight, stats)
+            finally:
+                with self._lock:
+                    self._details.update({pid: fetched[pid] for pid in owned if pid in fetched})
+                    for pid in owned:
+                        self._in_flight.pop(pid).set()
+        for event in waiting:
+            event.wait()
+        with self._lock:
+            found = {pid: self._details[pid] for pid in wanted if pid in self._details}
+        # Ids whose lookup failed in another thread are tried again here, so the error surfaces to this caller too
+        retry = [pid for pid in wanted if pid not in found]
+        if retry:
+            found.update(self.get_many(retry, stats))
+        return found
+
@@ -0,0 +1,477 @@
+import asyncio
+import json
+import os
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from search import DetailsFlight, run_on_loop, search_places_async, submit
+from cache_store import DetailsCache, SearchCache
+from dedup import DedupIndex, duplicated_entities, lead_digests
+from lead_store import LeadStore
+from jobs import JobStore
+from geogrid import grid_from_cache, grid_search_async
+from metering import ENDPOINT_SKUS, SKU_PRICES, Run, current_run, get_meter, using_run
+from planner import MIN_NEW_PER_CALL, plan_search, trim_to_budget
+from ratelimit import DETAILS, TEXT_SEARCH
+
+# Search logic shared by the Streamlit Lead Finder page and the headless runner (leadfinder.py)
+
+CITIES_FILE = "top_cities_by_state_converted.json"
+ARCHIVE_CSV = "lead_archive.csv"
+RESULTS_CSV = "lead_results_latest.csv"
+
+TEST_MODE_DEPTH = 3
+GRID_CITY = "(state grid)"  # task "city" of a grid coverage search, which covers the whole state
+# Request rate is capped by the governor in ratelimit.py and requests in flight by search.MAX_IN_FLIGHT.
+# Searches run as coroutines on search's shared loop, so page-token waits overlap without holding a thread.
+SEARCH_TASKS = 32  # searches in progress at once
+DETAILS_WORKERS = 8
+
+# Variants are searched and cached as themselves; planner.py decides where each one is worth a call
+TERM_VARIANTS = {
+    "dentist": ["dental office", "dental clinic", "family dentist"],
+    "school": ["elementary school", "middle school", "high school", "academy"]
+}
+
+# ---------------- Shared resources ----------------
+
+def open_meter():
+    meter = get_meter()
+    # One-shot import of the old api_usage_real.json counter; a no-op once done
+    meter.import_legacy()
+    return meter
+
+def load_cities(path=CITIES_FILE):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def open_details_cache():
+    return DetailsCache()
+
+def open_dedup_index():
+    index = DedupIndex()
+    if len(index) == 0:
+        index.build_from_csv(ARCHIVE_CSV)
+    elif index.entity_count() == 0:
+        # One-shot: index the archived leads of a store created before entity resolution
+        for frame in LeadStore().iter_frames("leads"):
+            index.add_entities(frame)
+    return index
+
+def open_lead_store():
+    store = LeadStore()
+    # One-shot import of the CSVs the app used to rewrite; a no-op once done
+    store.import_csvs(ARCHIVE_CSV, RESULTS_CSV)
+    store.build_sessions()
+    return store
+
+def open_job_store():
+    return JobStore()
+
+def open_search_cache():
+    cache = SearchCache()
+    # One-shot import of the legacy cache/<md5>.json files (keyed by base term); a no-op once done
+    known_terms = set(TERM_VARIANTS)
+    for path in [ARCHIVE_CSV, RESULTS_CSV]:
+        if os.path.exists(path):
+            known_terms.update(pd.read_csv(path, usecols=["Search Term"])["Search Term"].dropna().str.lower())
+    cache.migrate_json_dir(terms=known_terms, cities_by_state=load_cities())
+    return cache
+
+# ---------------- Planning ----------------
+
+def expand_terms(business_type, test_mode=False):
+    # Only expand variants if not in test mode
+    terms = [business_type]
+    if not test_mode:
+        for base, variants in TERM_VARIANTS.items():
+            if base in business_type.lower():
+                terms.extend(variants)
+                break
+    return terms
+
+def cities_for_state(cities_by_state, state, depth, offset=0):
+    # offset > 0 skips cities searched in earlier sessions ("Explore More Cities")
+    return cities_by_state.get(state, [state])[offset:offset + depth]
+
+# ---------------- Jobs ----------------
+
+def planned_cities(states, cities_by_state, depth, offsets=None, grid=False):
+    # {state: [city, ...]} the search covers; offsets: {state: cities to skip}. A grid search covers each
+    # state as a whole.
+    offsets = offsets or {}
+    return {
+        state: [GRID_CITY] if grid else cities_for_state(cities_by_state, state, depth, offsets.get(state, 0))
+        for state in states
+    }
+
+def plan_tasks(terms, states, cities_by_state, depth, offsets=None, grid=False):
+    # Every (term, city, state) the search covers, in the order they run
+    return [
+        (term, city, state)
+        for state, cities in planned_cities(states, cities_by_state, depth, offsets, grid).items()
+        for city in cities
+        for term in terms
+    ]
+
+def plan_job(terms, states, cities_by_state, depth, search_cache, offsets=None, paginate=False, grid=False,
+             min_yield=MIN_NEW_PER_CALL):
+    # Yield-ranked plan (see planner.plan_search) to show before running and to pass to open_job
+    cities = planned_cities(states, cities_by_state, depth, offsets, grid)
+    return plan_search(terms, cities, search_cache, paginate or grid, min_yield)
+
+def _price(endpoint):
+    return sum(SKU_PRICES[sku] for sku in ENDPOINT_SKUS[endpoint])
+
+def price_plan(plan, search_cache, details_cache, paginate=False):
+    # Dry run: resolves every planned task against the search and details caches without touching the
+    # network or the caches' LRU and hit counters. Cached searches are free and their details calls are
+    # exact (places not yet in the details cache, counted once per run); for searches that would go out,
+    # details are the planner's expected new places. Returns per-task costs and totals.
+    search_price, details_price = _price(TEXT_SEARCH), _price(DETAILS)
+    keys = [(term.lower(), city, state) for term, city, state in plan["tasks"] if city != GRID_CITY]
+    cached = search_cache.peek_many(keys)
+    cached_ids = {key: {r["place_id"] for r in results if r.get("place_id")} for key, results in cached.items()}
+    grid_ids = {}
+    for term, city, state in plan["tasks"]:
+        if city == GRID_CITY:
+            grid_ids[(term, state)] = grid_from_cache(term, state, search_cache, term.lower())
+    known = details_cache.contains_many(set().union(*cached_ids.values(), *(ids for ids, _ in grid_ids.values())))
+
+    seen = set()
+    costs = {}
+    report = {"tasks": len(plan["tasks"]), "cached_searches": 0, "search_calls": 0, "details_calls": 0,
+              "estimated_details_calls": 0, "exact": True}
+    for task in plan["tasks"]:
+        term, city, state = task
+        if city == GRID_CITY:
+            ids, uncached_cells = grid_ids[(term, state)]
+            # At least one call per uncached cell; what lies under it is unknown
+            search_calls = uncached_cells
+            report["exact"] = report["exact"] and not uncached_cells
+        else:
+            ids = cached_ids.get((term.lower(), city, state))
+            search_calls = 0 if ids is not None else (3 if paginate else 1)
+            # A paged search stops early when there is no next page
+            report["exact"] = report["exact"] and not (paginate and search_calls)
+        details_calls = 0
+        if ids is not None:
+            fresh = ids - seen
+            seen |= fresh
+            details_calls = len(fresh - known)
+        if search_calls:
+            estimated = round(plan["expected"].get(task, 0))
+            details_calls += estimated
+            report["estimated_details_calls"] += estimated
+            report["exact"] = False
+        report["cached_searches"] += 0 if search_calls else 1
+        report["search_calls"] += search_calls
+        report["details_calls"] += details_calls
+        costs[task] = search_calls * search_price + details_calls * details_price
+    report["cost"] = round(sum(costs.values()), 4)
+    report["search_cost"] = round(report["search_calls"] * search_price, 4)
+    report["details_cost"] = round(report["details_calls"] * details_price, 4)
+    return costs, report
+
+def dry_run(terms, states, cities_by_state, depth, search_cache, details_cache, offsets=None, paginate=False,
+            grid=False, min_yield=MIN_NEW_PER_CALL, budget=None):
+    # Plan plus exact pricing; with a budget (USD) the plan is trimmed to fit it. Returns (plan, report),
+    # the plan ready for open_job.
+    plan = plan_job(terms, states, cities_by_state, depth, search_cache, offsets, paginate, grid, min_yield)
+    costs, report = price_plan(plan, search_cache, details_cache, paginate)
+    planned, trimmed = plan["tasks"], []
+    # Dropping a task can move its cached places onto a later task that returns them too, so the trimmed
+    # plan is re-priced and trimmed again until it fits
+    while budget is not None and report["cost"] > budget:
+        plan = trim_to_budget(plan, costs, budget)
+        if not plan["trimmed"]:
+            break
+        trimmed += plan["trimmed"]
+        costs, report = price_plan(plan, search_cache, details_cache, paginate)
+    if trimmed:
+        trimmed = plan["trimmed"] = sorted(trimmed, key=planned.index)
+    report["trimmed_tasks"] = len(trimmed)
+    report["trimmed"] = [f"{term} in {city}, {state}" for term, city, state in trimmed]
+    if budget is not None:
+        plan["budget"] = report["budget"] = budget
+        report["headroom"] = round(budget - report["cost"], 4)
+    plan["calls"] = report["search_calls"]
+    plan["new_per_call"] = round(plan["expected_new"] / report["search_calls"], 2) if report["search_calls"] else None
+    return plan, report
+
+def open_job(job_store, business_type, terms, states, cities_by_state, depth, offsets=None,
+             paginate=False, has_phone=False, has_website=False, grid=False, plan=None, resume=True):
+    # Resumes the latest unfinished job for the same search (see JobStore.find_unfinished), or starts a new
+    # one with the plan's tasks (every term in every city without a plan); resume=False always starts over
+    offsets = {state: offset for state, offset in (offsets or {}).items() if offset}
+    options = {
+        "terms": terms, "offsets": offsets, "paginate": paginate,
+        "has_phone": has_phone, "has_website": has_website
+    }
+    if grid:
+        options["grid"] = True
+    if plan and plan["min_yield"]:
+        options["min_yield"] = plan["min_yield"]
+    # A budget changes which tasks the plan has, so a search under another budget is another job
+    if plan and plan.get("budget") is not None:
+        options["budget"] = plan["budget"]
+    job = job_store.find_unfinished(business_type, states, depth, options) if resume else None
+    if job is None:
+        tasks = plan["tasks"] if plan else plan_tasks(terms, states, cities_by_state, depth, offsets, grid)
+        job = job_store.create_job(business_type, states, depth, options, tasks)
+    return job
+
+# ---------------- Running ----------------
+
+async def search_stage(task, api_key, search_cache, paginate=False):
+    # Text search for one (term, city, state) task, from the cache when possible; returns (results, result pages fetched).
+    # Runs on search's shared loop; the cache is read and written off the loop.
+    term, city, state = task["term"], task["city"], task["state"]
+    cache_term = term.lower()
+    if city == GRID_CITY:
+        # One page per cell: a full page splits the cell instead of paging deeper
+        results, calls, _ = await grid_search_async(term, state, api_key, search_cache, cache_term)
+        return results, calls
+    query_results = await asyncio.to_thread(search_cache.get, cache_term, city, state)
+    if query_results is not None:
+        return query_results, 0
+    stats = {}
+    query_results = await search_places_async(term, f"{city}, {state}", api_key, use_pagination=paginate, stats=stats)
+    await asyncio.to_thread(search_cache.put, cache_term, city, state, query_results)
+    # Each result page is its own billed search
+    return query_results, stats.get("calls", 0)
+
+def details_stage(task, query_results, calls, business_type, timestamp, place_details):
+    # Details for the task's places, then its lead rows. place_details (a DetailsFlight) coalesces
+    # lookups by place_id across the run, so a place found again by another variant, a neighbouring
+    # city or a concurrent task costs nothing. The result is tagged with the task's own term and
+    # state so it can be recorded in whatever order tasks finish.
+    details_stats = {"hits": 0, "misses": 0}
+    details_by_id = place_details.get_many([r.get("place_id") for r in query_results], stats=details_stats)
+
+    leads = []
+    for result in query_results:
+        details = details_by_id.get(result.get("place_id"), {})
+        leads.append({
+            "Business Name": result.get("name", ""),
+            "Phone": details.get("formatted_phone_number", ""),
+            "Website": details.get("website", ""),
+            "Address": result.get("formatted_address") or result.get("vicinity", ""),
+            "Search Term": business_type,
+            "Search State(s)": task["state"],
+            "Timestamp": timestamp
+        })
+    return {
+        "task": task,
+        "term": task["term"],
+        "state": task["state"],
+        "leads": leads,
+        "text_search_calls": calls,
+        "details_hits": details_stats["hits"],
+        "details_misses": details_stats["misses"]
+    }
+
+def filter_leads(df, has_phone=False, has_website=False):
+    if has_phone:
+        df = df[df["Phone"].notna() & df["Phone"].str.strip().ne("")]
+    if has_website:
+        df = df[df["Website"].notna() & df["Website"].str.strip().ne("")]
+    return df
+
+def merge_leads(leads, dedup_index, lead_store, has_phone=False, has_website=False, session_id=None, run_entities=None):
+    # Flags and archives one task's leads as soon as it finishes; returns (rows kept, new rows).
+    # run_entities, if given, is the run's own map of the leads it has kept so far ({"digests": set(),
+    # "entities": set()}): a row of one of those businesses, e.g. the same practice another task found under
+    # another name or URL, is merged into the run's earlier row instead of being kept as Already Harvested.
+    df = pd.DataFrame(leads)
+    if df.empty:
+        return 0, 0
+    df = df.drop_duplicates(subset=["Business Name", "Phone", "Website"])
+    # Near-duplicates too (http/https, utm tags, "LLC", phone formatting): the first row of each entity is kept
+    df = df[~duplicated_entities(df)]
+    df = filter_leads(df, has_phone, has_website)
+    if df.empty:
+        return 0, 0
+    digests = pd.Series(lead_digests(df), index=df.index)
+    entities = dedup_index.match_entities(df)
+    if run_entities is not None:
+        in_run = digests.isin(run_entities["digests"]) | entities.isin(run_entities["entities"]).fillna(False)
+        df, digests, entities = df[~in_run], digests[~in_run], entities[~in_run]
+        if df.empty:
+            return 0, 0
+    # Already harvested: an exact key match or a row resolved to an archived entity
+    known = pd.Series(dedup_index.known(digests.tolist()), index=df.index) | entities.notna().values
+    df = df.assign(Status=known.map({True: "Already Harvested", False: "New"}))
+    new_leads = df[~known]
+    # Append new leads to the archive and the rows to this search's history so they display in Lead Database
+    lead_store.append_archive(new_leads)
+    lead_store.append_results(df, session_id)
+    entities[~known] = dedup_index.add_entities(new_leads)
+    dedup_index.add_digests(digests[~known].tolist())
+    if run_entities is not None:
+        run_entities["digests"].update(digests.tolist())
+        run_entities["entities"].update(int(e) for e in entities.dropna())
+    return len(df), len(new_leads)
+
+def run_tasks(tasks, run_search, run_details, threaded=False, sequence=None):
+    # Yields (task, outcome) as tasks finish; outcome() returns the task's result or raises its error.
+    # run_search(task) -> coroutine of (results, calls); run_details(task, results, calls) -> task result.
+    # Threaded, up to SEARCH_TASKS searches run at once on search's shared loop and each finished search
+    # feeds a details pool, so both stay busy across term and state boundaries and the API rate limit, not
+    # the slowest city of a state, bounds the run. sequence(task), if given, keys tasks whose searches
+    # must run one after another in task order: each starts once the previous one's search finished.
+    if not threaded:
+        for task in tasks:
+            yield task, lambda task=task: run_details(task, *run_on_loop(run_search(task)))
+        return
+
+    chains = {}
+    for position, task in enumerate(tasks):
+        chains.setdefault(sequence(task) if sequence else position, deque()).append(task)
+    ready = deque(chains)  # chains whose next search can start
+    lookups = ThreadPoolExecutor(max_workers=DETAILS_WORKERS)
+    in_flight = {}
+    searching = 0
+
+    def start_searches():
+        # submit() and the details pool keep the caller's context, so calls count toward the current metering run
+        nonlocal searching
+        while ready and searching < SEARCH_TASKS:
+            key = ready.popleft()
+            task = chains[key].popleft()
+            in_flight[submit(run_search(task))] = (task, "search", key)
+            searching += 1
+
+    try:
+        start_searches()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task, stage, key = in_flight.pop(future)
+                if stage == "search":
+                    searching -= 1
+                    if chains[key]:
+                        ready.append(key)
+                if stage == "search" and future.exception() is None:
+                    results, calls = future.result()
+                    lookup = lookups.submit(contextvars.copy_context().run, run_details, task, results, calls)
+                    in_flight[lookup] = (task, "details", key)
+                else:
+                    yield task, future.result
+            start_searches()
+    finally:
+        # Tasks not started yet stay pending in the job store if the caller stops early
+        for future in in_flight:
+            future.cancel()
+        lookups.shutdown(cancel_futures=True)
+
+def _state_summary(state, session_id, stats, lead_store, started, api_run):
+    # Everything this job logged for the state, including tasks finished before an interruption.
+    # api: the metered calls this run made for the state's tasks (see metering.Run.totals)
+    df = lead_store.session_frame(session_id)
+    return dict(
+        stats,
+        state=state,
+        session_id=session_id,
+        leads=df,
+        new_leads=df[df["Status"] == "New"],
+        api=api_run.totals(),
+        seconds=time.monotonic() - started
+    )
+
+def run_job(job, job_store, api_key, search_cache, details_cache, dedup_index, lead_store, threaded=False, on_task=None):
+    # Runs the job's pending tasks, checkpointing each one, and yields one summary per state as soon as
+    # its last task is recorded; the job is marked done once every task is. on_task(task, progress)
+    # reports progress from the calling thread.
+    started = time.monotonic()
+    job_store.start(job["id"])
+    options = job["options"]
+    # Shared by every task of the run so each unique place costs at most one details call
+    place_details = DetailsFlight(api_key, details_cache)
+    tasks = job_store.pending_tasks(job["id"])
+    # Each state of the run is one search session in the lead store
+    sessions = {
+        state: lead_store.open_session(job["business_type"], state, job["timestamp"], job["id"], options)
+        for state in job["states"]
+    }
+    remaining = {state: 0 for state in job["states"]}
+    for task in tasks:
+        remaining[task["state"]] += 1
+    stats = {
+        state: {"tasks": count, "failed": 0, "skipped": 0, "text_search_calls": 0, "details_hits": 0, "details_misses": 0}
+        for state, count in remaining.items()
+    }
+
+    # Each state's API calls are metered on a child of the current metering run, so interleaved
+    # (threaded) states are still credited with their own calls
+    parent_run = current_run()
+    state_runs = {state: parent_run.child(state) if parent_run else Run(state) for state in job["states"]}
+
+    # States a resumed job already finished are reported straight away
+    for state in job["states"]:
+        if not remaining[state]:
+            yield _state_summary(state, sessions[state], stats[state], lead_store, started, state_runs[state])
+
+    # With a min_yield, the terms of one city are searched one after another in plan order. Once a term adds
+    # fewer than min_yield places per call that the city's earlier terms had not found, the city's
+    # remaining terms are skipped. Without one, every search runs independently.
+    min_yield = options.get("min_yield")
+    city_seen, stopped_cities = {}, set()
+    city_of = lambda task: (task["city"], task["state"])
+
+    # What this run has kept, so a business found by several tasks is one row of the run, not one per task
+    run_entities = {"digests": set(), "entities": set()}
+
+    # Searches run on the shared loop's thread, so the per-city bookkeeping needs no lock
+    async def search(task):
+        if not min_yield:
+            return await search_stage(task, api_key, search_cache, options["paginate"])
+        city = city_of(task)
+        if city in stopped_cities:
+            return None, 0
+        results, calls = await search_stage(task, api_key, search_cache, options["paginate"])
+        seen = city_seen.setdefault(city, set())
+        ids = {r.get("place_id") for r in results if r.get("place_id")}
+        new = len(ids - seen)
+        if seen and new / max(calls, 1) < min_yield:
+            stopped_cities.add(city)
+        seen |= ids
+        return results, calls
+
+    async def run_search(task):
+        await asyncio.to_thread(job_store.mark_running, task["id"])
+        with using_run(state_runs[task["state"]]):
+            return await search(task)
+
+    def run_details(task, results, calls):
+        if results is None:
+            return dict(details_stage(task, [], 0, job["business_type"], job["timestamp"], place_details), skipped=True)
+        with using_run(state_runs[task["state"]]):
+            return details_stage(task, results, calls, job["business_type"], job["timestamp"], place_details)
+
+    for task, outcome in run_tasks(tasks, run_search, run_details, threaded, city_of if min_yield else None):
+        state_stats = stats[task["state"]]
+        try:
+            result = outcome()
+            kept, new = merge_leads(result["leads"], dedup_index, lead_store, options["has_phone"], options["has_website"],
+                                    sessions[task["state"]], run_entities)
+            job_store.mark_done(task["id"], kept, new, result["text_search_calls"])
+            for key in ["text_search_calls", "details_hits", "details_misses"]:
+                state_stats[key] += result[key]
+            state_stats["skipped"] += 1 if result.get("skipped") else 0
+        except Exception as e:
+            # The task stays resumable; everything already merged is kept
+            print(f"Search task failed for {task['term']} in {task['city']}, {task['state']}: {e}")
+            job_store.mark_failed(task["id"], e)
+            state_stats["failed"] += 1
+        if on_task:
+            on_task(task, job_store.progress(job["id"]))
+        remaining[task["state"]] -= 1
+        if not remaining[task["state"]]:
+            lead_store.finish_session(sessions[task["state"]], state_stats["text_search_calls"], state_stats["details_misses"])
+            yield _state_summary(task["state"], sessions[task["state"]], state_stats, lead_store, started, state_runs[task["state"]])
+    job_store.finish(job["id"])